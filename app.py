@@ -1,19 +1,45 @@
 import os
 import json
+import time
 import random
 import logging
 from datetime import datetime, timedelta, timezone
 from functools import wraps
+import click
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, send_from_directory, abort
+from flask import Flask, Response, jsonify, request, abort
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room
 from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, jwt_required, JWTManager, verify_jwt_in_request
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy import desc, func, or_
+from sqlalchemy.orm import contains_eager, selectinload
 from config import Config
+from cache_sync import cache_sync
+from catalog import catalog
+from broadcast import broadcaster
+import ledger
+import bank_stats
+import search
+import provisioning
+import schema
+import lottery
+import shop
+from chat import chat_service, ChatError, SUPPORT_ROOM
+from auction import auction_engine, BidRejected, LOT_TYPES
+from leader import LeaderLease
+from expiry import expiry_engine, run_expiry_loop
+from leaderboard import leaderboard
+from passwords import password_hasher
+from db_pool import db_pool
+from sqlite_writer import sqlite_writer
+from static_assets import static_assets
+from uploads import upload_store, UploadError
+from perf import perf
+from settings import settings_cache
+from market import RESOLUTIONS, compact_price_history, price_history, price_tape
 from models import (
-    db, User, Passport, Team, Transaction, ShopItem, Task, TaskSubmission,
+    paginate_by_date, user_query, USER_LOADERS, db, User, Passport, Team, Transaction, ShopItem, Task, TaskSubmission,
     Loan, Asset, AssetHistory, UserAsset, InsuranceOption, ScheduleItem,
     EconomicEvent, Notification, ChatMessage, GlobalSetting, LotteryTicket,
     WonLot, AuctionState
@@ -22,16 +48,32 @@ from models import (
 load_dotenv(dotenv_path='app.env')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-app = Flask(__name__, static_folder='.', static_url_path='')
+app = Flask(__name__, static_folder=None)
 app.config.from_object(Config)
 
 CORS(app, resources={r"/api/*": {"origins": "*"}})
+db_pool.init_app(app)
 db.init_app(app)
 jwt = JWTManager(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
-
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'])
+broadcaster.init_app(app, socketio)
+cache_sync.init_app(app)
+password_hasher.init_app(app)
+auction_engine.init_app(app)
+chat_service.init_app(app, socketio)
+sqlite_writer.init_app(app, socketio)
+static_assets.init_app(app)
+perf.init_app(app, socketio)
+perf.gauge('ceobank_password_hash_queue', lambda: password_hasher.waiting, 'Хешування паролів, що чекають у черзі')
+perf.gauge('ceobank_password_hash_in_flight', lambda: password_hasher.running, 'Хешування паролів, що виконуються')
+perf.gauge('ceobank_db_pool_in_use', lambda: db_pool.in_use, "З'єднання з БД, видані запитам і задачам")
+perf.gauge('ceobank_db_pool_idle', lambda: db_pool.idle, "Вільні з'єднання в пулі")
+perf.gauge('ceobank_db_pool_overflow', lambda: db_pool.overflow, "З'єднання, відкриті понад DB_POOL_SIZE")
+perf.gauge('ceobank_db_pool_waiting', lambda: db_pool.waiting, "Запити, що чекають вільного з'єднання")
+perf.gauge('ceobank_db_pool_wait_p95_ms', lambda: db_pool.wait_percentile(0.95), "p95 очікування з'єднання, мс")
+
+upload_store.init_app(app, socketio)
+perf.gauge('ceobank_upload_processing_queue', lambda: upload_store.pending, 'Завантажені файли, що чекають на перевірку')
 
 # --- Допоміжні функції та Декоратори ---
 
@@ -47,99 +89,145 @@ def admin_required(fn):
     return wrapper
 
 def get_setting(key, default=None):
-    setting = GlobalSetting.query.get(key)
-    if setting:
-        try:
-            return json.loads(setting.value)
-        except (json.JSONDecodeError, TypeError):
-            return setting.value
-    return default
+    # Читання йде з кешу в пам'яті (settings.py), без звернення до БД
+    return settings_cache.get(key, default)
 
 def set_setting(key, value):
     with app.app_context():
-        setting = GlobalSetting.query.get(key)
-        if not setting:
-            setting = GlobalSetting(key=key)
-            db.session.add(setting)
-        setting.value = json.dumps(value)
-        db.session.commit()
-        socketio.emit('settings_update', {'key': key, 'value': value})
+        settings_cache.set(key, value)
+        catalog.invalidate('settings', 'ceoNews')
+        broadcaster.publish('settings_update', 'settings', [{'key': key, 'value': value}], key='key')
 
 def add_transaction(user_id, action, amount, is_positive, comment='', details=None, commit=True):
     user = User.query.get(user_id)
     if not user: return
-    transaction = Transaction(user_id=user_id, action=action, amount=round(amount, 2), is_positive=is_positive, comment=comment, details=json.dumps(details) if details else None)
+    transaction = Transaction(user_id=user_id, action=action, amount=round(amount, 2), is_positive=is_positive, comment=comment, details=json.dumps(details) if details else None, date=datetime.utcnow())
     db.session.add(transaction)
     if commit:
         db.session.commit()
+    else:
+        db.session.flush()  # Потрібен id для to_dict ще до коміту
     socketio.emit('new_transaction', {'userId': user_id, 'transaction': transaction.to_dict()}, room=f'user_{user_id}')
+    return transaction
 
-def notify_user(user_id, message_text, commit_now=True):
+def add_notification(user_id, message_text):
+    # Лише рядок у поточній транзакції; emit робить викликач після коміту
     notification = Notification(user_id=user_id, text=message_text, date=datetime.now(timezone.utc))
     db.session.add(notification)
+    return notification
+
+def notify_user(user_id, message_text, commit_now=True):
+    notification = add_notification(user_id, message_text)
     if commit_now:
         db.session.commit()
-    socketio.emit('new_notification', {'text': message_text}, room=f'user_{user_id}')
-
-def get_current_user():
+    else:
+        db.session.flush()
+    socketio.emit('new_notification', notification.to_dict(), room=f'user_{user_id}')
+    return notification
+
+def emit_user_delta(user, *fields, transaction=None):
+    # Замість повного to_dict(include_sensitive=True) надсилаємо лише змінені поля
+    payload = {'user': user.to_delta(*fields)}
+    if transaction is not None:
+        payload['transaction'] = transaction.to_dict()
+    socketio.emit('user_update', payload, room=f'user_{user.id}')
+
+def history_page(query, model):
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    try:
+        items, next_cursor = paginate_by_date(query, model, request.args.get('cursor'), max(limit, 1))
+    except ValueError:
+        return jsonify({"msg": "Некоректний курсор"}), 400
+    return jsonify({'items': [i.to_dict() for i in items], 'nextCursor': next_cursor})
+
+def get_current_user(profile='auth'):
+    # profile — набір наперед завантажених зв'язків (див. USER_LOADERS у models.py)
     user_identity = get_jwt_identity()
-    return User.query.get(user_identity['id'])
+    return db.session.get(User, user_identity['id'], options=USER_LOADERS[profile])
 
 @app.cli.command("init-db")
 def init_db_command():
     db.drop_all()
-    db.create_all()
+    db.create_all(); price_tape.reset(); settings_cache.invalidate()
     logging.info("Базу даних очищено та створено заново.")
-    admin_user = User(username='admin', is_admin=True); admin_user.set_password('admin123'); db.session.add(admin_user)
-    for i in range(1, 71):
-        user = User(username=f'user{i}', balance=100, loyalty_points=10, photo=f'./foto{i % 20 + 1}.png'); user.set_password(f'pass{i}')
-        passport = Passport(user=user, surname=f'Прізвище{i}', name=f'Ім\'я{i}', dob=f'{2000+(i%15)}-{str(i%12+1).zfill(2)}-{str(i%28+1).zfill(2)}', number=''.join(random.choices('AB', k=2)) + str(random.randint(100000, 999999)), room=str(100+i))
-        loan = Loan(user=user); db.session.add_all([user, passport, loan])
-    shop_items_data = [
-      {'name': 'Смартфон X', 'price': 500, 'category': 'electronics', 'description': 'Сучасний смартфон.', 'image': './t1.png', 'quantity': 5},
-      {'name': 'Навушники Z', 'price': 200, 'category': 'electronics', 'description': 'Бездротові навушники.', 'image': './t2.png', 'discount_price': 180, 'quantity': 10},
-      {'name': 'Футболка Logo', 'price': 150, 'category': 'clothing', 'description': 'Стильна футболка.', 'image': './t3.png', 'quantity': 20},
-      {'name': 'Лотерейний квиток "Шанс"', 'price': 25, 'category': 'lottery', 'description': 'Випробуй свою удачу!', 'image': './t4.png', 'quantity': 200, 'is_lottery': True, 'lottery_max_tickets_user': 10},
-    ]
-    for item_data in shop_items_data: db.session.add(ShopItem(**item_data))
-    assets_data = [
-        {'name': 'TechCorp', 'ticker': 'TCH', 'price': 150.00, 'type': 'stock'}, {'name': 'EcoFuel', 'ticker': 'EFL', 'price': 85.50, 'type': 'stock'},
-        {'name': 'Bitcoin', 'ticker': 'BTC', 'price': 65000.00, 'type': 'crypto'}, {'name': 'Ethereum', 'ticker': 'ETH', 'price': 3500.00, 'type': 'crypto'}
-    ]
-    for asset_data in assets_data:
-        asset = Asset(name=asset_data['name'], ticker=asset_data['ticker'], price=asset_data['price'], type=asset_data['type'])
-        history = AssetHistory(asset=asset, price=asset_data['price']); db.session.add_all([asset, history])
-    initial_settings = {
-        "featuresEnabled": {"transfers": True, "shop": True, "auction": True, "loans": True, "exchange": True, "insurance": True, "rewards": True, "support": True, "deposit": True, "lottery": True, "dynamicEvents": True},
-        "loanSettings": {"interestRate": 5, "maxAmount": 1000, "autoApprove": True, "termDays": 1},
-        "ceoNews": [{"text": "Вітаємо у C.E.O. Банку! Ваш надійний партнер у світі ігрових фінансів.", "date": datetime.now(timezone.utc).isoformat()}],
-        "loyaltyDiscountsEnabled": True
-    }
-    for key, value in initial_settings.items(): set_setting(key, value)
-    auction_states = {'general_auction': {'isActive': False, 'endTime': None, 'bids': [], 'winner': None}, 'special_lot': None}
-    for key, value in auction_states.items(): db.session.add(AuctionState(key=key, state_json=json.dumps(value)))
-    db.session.commit(); logging.info("Базу даних успішно наповнено.")
+    seed_initial_data()
+
+def seed_initial_data():
+    report = provisioning.seed_database(method=app.config['PASSWORD_HASH_METHOD'])
+    bank_stats.reconcile(); search.install_search_index(); catalog.invalidate()
+    logging.info(f"Базу даних успішно наповнено ({report['created']} гравців за {report['seconds']} с).")
 
 @app.cli.command("safe-init-db")
 def safe_init_db_command():
     with app.app_context():
-        db.create_all(); logging.info("Таблиці перевірено/створено.")
-        if User.query.filter_by(username='admin').first() is None: init_db_command()
-        else: logging.info("База даних вже містить дані. Наповнення пропущено.")
+        db.create_all(); search.install_search_index(); logging.info("Таблиці перевірено/створено.")
+        if User.query.filter_by(username='admin').first() is None: seed_initial_data()
+        else: chat_service.reconcile(); logging.info("База даних вже містить дані. Наповнення пропущено.")
+
+@app.cli.command("import-users")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None, help="За замовчуванням — за розширенням файлу.")
+@click.option('--chunk-size', default=provisioning.IMPORT_CHUNK_SIZE, show_default=True, help="Скільки рядків вставляти за раз.")
+@click.option('--workers', default=None, type=int, help="Процесів для хешування паролів (за замовчуванням — кількість ядер).")
+def import_users_command(path, fmt, chunk_size, workers):
+    """Створює гравців з CSV/JSONL. Повторний запуск пропускає вже наявних."""
+    report = provisioning.import_users(provisioning.read_rows(path, fmt), chunk_size=chunk_size, workers=workers, method=app.config['PASSWORD_HASH_METHOD'])
+    if report['created']: catalog.invalidate('teams')
+    click.echo(f"Прочитано {report['read']}, створено {report['created']}, пропущено {report['skipped']}, некоректних {report['invalid']} "
+               f"за {report['seconds']} с ({report['rowsPerSecond']} рядків/с).")
+
+@app.cli.command("db-optimize")
+@click.option('--dry-run', is_flag=True, help="Лише показати відсутні індекси та плани запитів, нічого не змінюючи.")
+def db_optimize_command(dry_run):
+    """Додає до наявної БД індекси з models.py, оновлює статистику (ANALYZE) і показує повні скани гарячих запитів."""
+    if not dry_run:
+        before = set(db.inspect(db.engine).get_table_names()); db.create_all()
+        for name in sorted(set(db.inspect(db.engine).get_table_names()) - before): click.echo(f"Створено таблицю {name}")
+    missing = schema.missing_indexes()
+    if dry_run:
+        for index in missing: click.echo(f"Відсутній індекс {index.name} ({index.table.name})")
+    else:
+        for name, seconds in schema.create_indexes(missing): click.echo(f"Створено індекс {name} за {seconds} с")
+        schema.analyze(); click.echo("Статистику планувальника оновлено (ANALYZE).")
+    report = schema.explain_hot_queries()
+    for entry in report:
+        if entry.get('error'): click.echo(f"  ПОМИЛКА     {entry['query']}: {entry['error']}"); continue
+        scans = ', '.join(f"{table} ({rows} рядків)" for table, rows in entry['fullScans'].items())
+        click.echo(f"  {'ПОВНИЙ СКАН' if scans else 'індекс     '} {entry['query']}" + (f": {scans}" if scans else ''))
+        if scans:
+            for line in entry['plan']: click.echo(f"      {line}")
+    click.echo(f"Індексів {'відсутньо' if dry_run else 'створено'}: {len(missing)}; запитів з повним сканом: "
+               f"{sum(1 for entry in report if entry['fullScans'])} з {len(report)}.")
+
+@app.cli.command("build-static")
+@click.option('--prune', is_flag=True, help="Видалити з каталогу збірки файли попередніх збірок (після перезапуску всіх воркерів).")
+def build_static_command(prune):
+    """Збирає статичні файли: копії з хешем у назві, стиснуті .gz/.br і WebP-копії зображень."""
+    produced = static_assets.build(); stats = static_assets.stats
+    click.echo(f"Джерел {stats['files']}, нових файлів {stats['written']}, WebP-копій {stats['webp']}; "
+               f"текст {stats['bytes']} -> {stats['compressedBytes']} байт після gzip.")
+    if prune: click.echo(f"Видалено застарілих файлів: {static_assets.prune(produced)}")
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)): return send_from_directory(app.static_folder, path)
-    if 'admin.html' in request.path: return send_from_directory(app.static_folder, 'admin.html')
-    return send_from_directory(app.static_folder, 'index.html')
+    # Файли фронтенду з індексу static_assets (зібраного при старті); решта адрес — index.html/admin.html
+    return static_assets.serve(path)
 
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json(); username = data.get('username'); password = data.get('password')
     if not username or not password: return jsonify({"msg": "Потрібно вказати ім'я користувача та пароль"}), 400
+    started = time.perf_counter()
     user = User.query.filter_by(username=username).first()
-    if user and user.check_password(password):
+    # Перевірка хешу йде в пулі потоків (passwords.py), хаб eventlet тим часом обслуговує інших
+    ok = bool(user) and password_hasher.verify(user.password_hash, password)
+    rehashed = ok and password_hasher.needs_rehash(user.password_hash)
+    if rehashed:
+        # Прозоре оновлення старого simpleHash / застарілих параметрів хешу
+        user.password_hash = password_hasher.hash(password); db.session.commit()
+    password_hasher.observe_login(time.perf_counter() - started, ok, rehashed)
+    if ok:
         if user.is_blocked: return jsonify({"msg": "Ваш акаунт заблоковано"}), 403
         access_token = create_access_token(identity={'id': user.id, 'username': user.username}, additional_claims={'is_admin': user.is_admin})
         return jsonify(access_token=access_token, isAdmin=user.is_admin)
@@ -148,23 +236,66 @@ def login():
 @app.route('/api/initial-data', methods=['GET'])
 @jwt_required()
 def get_initial_data():
-    user = get_current_user()
+    user = get_current_user('full')
     if not user: return jsonify({"msg": "Користувача не знайдено"}), 404
-    general_auction_state = json.loads(AuctionState.query.filter_by(key='general_auction').first().state_json)
-    special_lot_state = json.loads(AuctionState.query.filter_by(key='special_lot').first().state_json)
-    all_settings_db = GlobalSetting.query.all()
-    settings = {s.key: json.loads(s.value) for s in all_settings_db}
-    return jsonify({
-        'user': user.to_dict(include_sensitive=True),
-        'shopItems': [item.to_dict() for item in ShopItem.query.order_by(ShopItem.name).all()],
-        'tasks': [task.to_dict() for task in Task.query.all()],
-        'auction': { 'isActive': general_auction_state.get('isActive', False), 'endTime': general_auction_state.get('endTime'), 'bids': [], 'specialLot': special_lot_state },
-        'exchange': { 'companies': [c.to_dict() for c in Asset.query.filter_by(type='stock').all()], 'crypto': [c.to_dict() for c in Asset.query.filter_by(type='crypto').all()] },
-        'settings': settings, 'ceoNews': get_setting('ceoNews', []),
-        'schedule': [{'id': item.id, 'time': item.time_str, 'activity': item.activity} for item in ScheduleItem.query.order_by(ScheduleItem.time_str).all()],
-        'insurance': { 'options': [{'id': opt.id, 'duration': opt.duration, 'cost': opt.cost} for opt in InsuranceOption.query.all()] },
-        'teams': [{'name': t.name, 'members': [m.username for m in t.members]} for t in Team.query.all()]
-    })
+    bundle, _, etag, version = catalog.get()
+    return jsonify(dict(bundle, user=user.to_dict(include_sensitive=True), catalogVersion=version, catalogEtag=etag))
+
+@app.route('/api/catalog', methods=['GET'])
+@jwt_required()
+def get_catalog():
+    # Спільна частина initial-data; клієнт може перевіряти актуальність через If-None-Match
+    _, body, etag, version = catalog.get()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag); response.headers['Cache-Control'] = 'no-cache'; response.headers['X-Catalog-Version'] = str(version)
+    return response
+
+def upload_error(e):
+    body = {"msg": str(e)}
+    if e.offset is not None: body['offset'] = e.offset
+    response = jsonify(body)
+    if e.offset is not None: response.headers['Upload-Offset'] = str(e.offset)
+    return response, e.status
+
+@app.route('/api/tasks/<int:task_id>/uploads', methods=['POST'])
+@jwt_required()
+def create_upload(task_id):
+    # {"filename": "...", "size": байти} -> {"uploadId", "offset": 0, ...}; далі байти йдуть PATCH-запитами
+    data = request.get_json() or {}
+    try:
+        return jsonify(upload_store.create(get_jwt_identity()['id'], task_id, data.get('filename'), data.get('size'))), 201
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+@jwt_required()
+def upload_bytes(upload_id):
+    # GET — скільки прийнято (для докачування); PATCH — сирі байти з позиції Upload-Offset (тіло не буферизується);
+    # DELETE — скасувати. Після останнього байта створюється заявка на завдання (201)
+    user_id = get_jwt_identity()['id']
+    try:
+        if request.method == 'GET': return jsonify(upload_store.status(user_id, upload_id))
+        if request.method == 'DELETE': upload_store.cancel(user_id, upload_id); return jsonify({"msg": "Завантаження скасовано"}), 200
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None: return jsonify({"msg": "Потрібен заголовок Upload-Offset"}), 400
+        result = upload_store.append(user_id, upload_id, offset, request.content_length, request.stream)
+    except UploadError as e:
+        return upload_error(e)
+    if 'submission' in result:
+        broadcaster.signal('admin_data_refresh', 'submissions')
+        return jsonify(result), 201
+    response = jsonify(result); response.headers['Upload-Offset'] = str(result['upload']['offset'])
+    return response, 200
+
+@app.route('/api/uploads/files/<sha256>', methods=['GET'])
+@jwt_required()
+def get_uploaded_file(sha256):
+    # Файл заявки (?thumb=1 — мініатюра WebP, якщо є); доступний власнику заявки та адміністраторам
+    response = upload_store.send(get_jwt_identity()['id'], get_jwt().get('is_admin', False), sha256, request.args.get('thumb') == '1')
+    return response if response is not None else (jsonify({"msg": "Файл не знайдено"}), 404)
 
 @app.route('/api/user/tour-status', methods=['GET'])
 @jwt_required()
@@ -176,6 +307,16 @@ def get_tour_status():
 def complete_tour():
     get_current_user().has_completed_tour = True; db.session.commit(); return jsonify({'msg': 'Статус туру оновлено'}), 200
 
+@app.route('/api/user/transactions', methods=['GET'])
+@jwt_required()
+def get_user_transactions():
+    return history_page(Transaction.query.filter_by(user_id=get_jwt_identity()['id']), Transaction)
+
+@app.route('/api/user/notifications', methods=['GET'])
+@jwt_required()
+def get_user_notifications():
+    return history_page(Notification.query.filter_by(user_id=get_jwt_identity()['id']), Notification)
+
 @app.route('/api/transfer', methods=['POST'])
 @jwt_required()
 def transfer_money():
@@ -185,90 +326,191 @@ def transfer_money():
     if sender.username == recipient_username: return jsonify({"msg": "Неможливо надіслати кошти собі"}), 400
     recipient = User.query.filter_by(username=recipient_username).first()
     if not recipient or recipient.is_admin: return jsonify({"msg": f"Отримувача '{recipient_username}' не знайдено"}), 404
-    if sender.balance < amount: return jsonify({"msg": "Недостатньо коштів"}), 400
-    sender.balance -= amount; sender.total_sent += amount
-    add_transaction(sender.id, f'Переказ до {recipient.username}', amount, False, commit=False)
-    recipient.balance += amount
-    add_transaction(recipient.id, f'Отримано від {sender.username}', amount, True, commit=False)
-    notify_user(recipient.id, f"Ви отримали переказ на {amount:.2f} грн від {sender.username}", commit_now=False)
-    db.session.commit()
-    socketio.emit('user_update', {'user': sender.to_dict(include_sensitive=True)}, room=f'user_{sender.id}')
-    socketio.emit('user_update', {'user': recipient.to_dict(include_sensitive=True)}, room=f'user_{recipient.id}')
+    try:
+        sender_tx, recipient_tx, notification = ledger.transfer(sender, recipient, amount, extra=lambda: add_notification(recipient.id, f"Ви отримали переказ на {amount:.2f} грн від {sender.username}"))
+    except ledger.InsufficientFunds:
+        return jsonify({"msg": "Недостатньо коштів"}), 400
+    emit_user_delta(sender, 'balance', transaction=sender_tx)
+    emit_user_delta(recipient, 'balance', transaction=recipient_tx)
+    socketio.emit('new_notification', notification.to_dict(), room=f'user_{recipient.id}')
     return jsonify({"msg": "Переказ успішний"}), 200
 
 @app.route('/api/shop/checkout', methods=['POST'])
 @jwt_required()
 def shop_checkout():
-    cart = request.get_json().get('cart'); user = get_current_user()
-    if not cart: return jsonify({"msg": "Кошик порожній"}), 400
-    subtotal = 0; items_details = []
-    for cart_item in cart:
-        item = ShopItem.query.get(cart_item['id'])
-        if not item or item.quantity < cart_item['quantity']: return jsonify({"msg": f"Товар '{item.name if item else 'невідомий'}' закінчився або його недостатньо"}), 400
-        price = item.discount_price if item.discount_price else item.price
-        subtotal += price * cart_item['quantity']
-        items_details.append({'itemId': item.id, 'itemName': item.name, 'quantity': cart_item['quantity'], 'price': price})
-    loyalty_discount = min(subtotal, user.loyalty_points) if get_setting('loyaltyDiscountsEnabled', True) else 0
-    final_total = subtotal - loyalty_discount
-    if user.balance < final_total: return jsonify({"msg": "Недостатньо коштів"}), 400
-    user.balance -= final_total; user.loyalty_points -= loyalty_discount; user.loyalty_points += int(subtotal / 100)
-    add_transaction(user.id, "Покупка в магазині", final_total, False, f"Використано {loyalty_discount} балів", {'items': items_details}, commit=False)
-    for cart_item in cart:
-        item = ShopItem.query.get(cart_item['id']); item.quantity -= cart_item['quantity']; item.popularity += cart_item['quantity']
-    db.session.commit()
-    socketio.emit('shop_update', {'items': [i.to_dict() for i in ShopItem.query.all()]})
-    socketio.emit('user_update', {'user': user.to_dict(include_sensitive=True)}, room=f'user_{user.id}')
+    # Уся покупка — одна транзакція в shop.py; перепродаж останньої одиниці товару відхиляється умовним UPDATE
+    user_id = get_jwt_identity()['id']
+    try:
+        purchase_tx, changed_items = shop.checkout(user_id, shop.parse_cart((request.get_json() or {}).get('cart')), get_setting('loyaltyDiscountsEnabled', True))
+    except ledger.InsufficientFunds:
+        return jsonify({"msg": "Недостатньо коштів"}), 400
+    except shop.OutOfStock as e:
+        return jsonify({"msg": str(e)}), 409
+    except shop.CheckoutError as e:
+        return jsonify({"msg": str(e)}), 400
+    catalog.patch('shopItems', changed_items)
+    broadcaster.publish('shop_update', 'items', changed_items)
+    emit_user_delta(db.session.get(User, user_id), 'balance', 'loyaltyPoints', transaction=purchase_tx)
     return jsonify({"msg": "Покупку успішно оформлено"}), 200
 
+@app.route('/api/lottery/<int:item_id>/tickets', methods=['POST'])
+@jwt_required()
+def buy_lottery_tickets(item_id):
+    if not get_setting('featuresEnabled', {}).get('lottery', True): return jsonify({"msg": "Лотерея тимчасово вимкнена"}), 403
+    item = ShopItem.query.get_or_404(item_id)
+    if not item.is_lottery: return jsonify({"msg": "Цей товар не є лотерейним квитком"}), 400
+    count = (request.get_json() or {}).get('count', 1)
+    if isinstance(count, bool) or not isinstance(count, int) or count <= 0: return jsonify({"msg": "Некоректна кількість квитків"}), 400
+    user_id = get_jwt_identity()['id']
+    try:
+        transaction, first, last = lottery.buy_tickets(user_id, item, count)
+    except ledger.InsufficientFunds:
+        return jsonify({"msg": "Недостатньо коштів"}), 400
+    except lottery.LotteryError as e:
+        return jsonify({"msg": str(e)}), 400
+    db.session.refresh(item); changed = [{'id': item.id, 'quantity': item.quantity, 'popularity': item.popularity}]
+    catalog.patch('shopItems', changed); broadcaster.publish('shop_update', 'items', changed)
+    emit_user_delta(db.session.get(User, user_id), 'balance', transaction=transaction)
+    return jsonify({'itemId': item.id, 'firstNumber': first, 'lastNumber': last, 'count': count}), 201
+
+@app.route('/api/admin/lottery/<int:item_id>/draw', methods=['POST'])
+@admin_required
+def draw_lottery(item_id):
+    item = ShopItem.query.get_or_404(item_id)
+    if not item.is_lottery: return jsonify({"msg": "Цей товар не є лотереєю"}), 400
+    data = request.get_json() or {}; winners = data.get('winners', 1)
+    if isinstance(winners, bool) or not isinstance(winners, int) or winners <= 0: return jsonify({"msg": "Некоректна кількість переможців"}), 400
+    results = lottery.draw(item, winners, data.get('prize'))
+    for result in results: socketio.emit('new_notification', result.pop('notification'), room=f"user_{result['userId']}")
+    return jsonify({'item': item.name, 'winners': results})
+
+@app.route('/api/admin/lottery/<int:item_id>/tickets', methods=['DELETE'])
+@admin_required
+def reset_lottery(item_id):
+    removed = lottery.reset(item_id); db.session.commit()
+    broadcaster.signal('admin_data_refresh', 'shop')
+    return jsonify({"msg": f"Деактивовано {removed} квитків"}), 200
+
+def chat_page(user_id):
+    try:
+        items, next_cursor = chat_service.history(user_id, request.args.get('cursor'), min(max(request.args.get('limit', 50, type=int), 1), 200))
+    except ValueError:
+        return jsonify({"msg": "Некоректний курсор"}), 400
+    return jsonify({'items': items, 'nextCursor': next_cursor, 'thread': chat_service.thread(user_id)})
+
+def chat_send(sender_id, user_id, from_support):
+    try:
+        return jsonify(chat_service.send(sender_id, user_id, (request.get_json() or {}).get('text'), from_support)), 201
+    except ChatError as e:
+        return jsonify({"msg": str(e)}), 400
+
+def chat_read(user_id, by_support):
+    up_to = (request.get_json() or {}).get('upTo')
+    if isinstance(up_to, bool) or not isinstance(up_to, int): return jsonify({"msg": "Некоректний id повідомлення"}), 400
+    chat_service.mark_read(user_id, by_support, up_to)
+    return jsonify({"msg": "Прийнято"}), 202
+
+@app.route('/api/chat/messages', methods=['GET', 'POST'])
+@jwt_required()
+def user_chat_messages():
+    user_id = get_jwt_identity()['id']
+    if request.method == 'GET': return chat_page(user_id)
+    if not get_setting('featuresEnabled', {}).get('support', True): return jsonify({"msg": "Чат підтримки тимчасово вимкнено"}), 403
+    return chat_send(user_id, user_id, False)
+
+@app.route('/api/chat/read', methods=['POST'])
+@jwt_required()
+def user_chat_read():
+    return chat_read(get_jwt_identity()['id'], False)
+
+@app.route('/api/admin/chat', methods=['GET'])
+@admin_required
+def admin_chat_inbox():
+    return jsonify(chat_service.inbox())
+
+@app.route('/api/admin/chat/<int:user_id>/messages', methods=['GET', 'POST'])
+@admin_required
+def admin_chat_messages(user_id):
+    if request.method == 'GET': return chat_page(user_id)
+    return chat_send(get_jwt_identity()['id'], user_id, True)
+
+@app.route('/api/admin/chat/<int:user_id>/read', methods=['POST'])
+@admin_required
+def admin_chat_read(user_id):
+    return chat_read(user_id, True)
+
 @app.route('/api/admin/dashboard-stats', methods=['GET'])
 @admin_required
 def get_dashboard_stats():
-    users = User.query.filter_by(is_admin=False).all()
-    total_balance = sum(u.balance for u in users) if users else 0
-    total_debt = db.session.query(func.sum(Loan.amount)).scalar() or 0
-    return jsonify({
-        'totalUsers': len(users), 'totalTransactions': db.session.query(func.count(Transaction.id)).scalar(),
-        'totalBalance': total_balance, 'totalDebt': total_debt, 'moneySupply': total_balance + total_debt,
-        'popularItems': [item.to_dict() for item in ShopItem.query.order_by(desc(ShopItem.popularity)).limit(5).all()],
-        'activeUsers': [{'username': u.username, 'tx_count': count} for u, count in db.session.query(User, func.count(Transaction.id).label('tx_count')).join(Transaction).filter(User.is_admin == False).group_by(User.id).order_by(desc('tx_count')).limit(5).all()]
-    })
+    # Агрегати читаються з bank_stats (O(1)), а не перераховуються по всіх користувачах і транзакціях
+    return jsonify(dict(bank_stats.read().to_dict(),
+        popularItems=[item.to_dict() for item in ShopItem.query.order_by(desc(ShopItem.popularity)).limit(5).all()],
+        activeUsers=[{'username': username, 'tx_count': count} for username, count in bank_stats.top_active_users(5)]
+    ))
+
+@app.route('/api/admin/bank-stats', methods=['GET'])
+@admin_required
+def get_bank_stats():
+    return jsonify(bank_stats.read().to_dict())
 
 @app.route('/api/admin/users', methods=['GET', 'POST'])
 @admin_required
 def manage_users():
     if request.method == 'GET':
-        return jsonify([u.to_dict() for u in User.query.filter_by(is_admin=False).order_by(User.username).all()])
+        return jsonify([u.to_dict() for u in user_query('list').filter_by(is_admin=False).order_by(User.username).all()])
     data = request.json; username = data.get('username'); password = data.get('password')
     if not username or not password: return jsonify({"msg": "Потрібно вказати ім'я та пароль"}), 400
     if User.query.filter_by(username=username).first(): return jsonify({"msg": "Користувач вже існує"}), 409
-    new_user = User(username=username, balance=data.get('balance', 100), loyalty_points=data.get('loyaltyPoints', 10)); new_user.set_password(password)
-    db.session.add(new_user); db.session.commit()
-    socketio.emit('admin_data_refresh', 'users'); return jsonify(new_user.to_dict()), 201
+    new_user = User(username=username, balance=data.get('balance', 100), loyalty_points=data.get('loyaltyPoints', 10)); new_user.password_hash = password_hasher.hash(password)
+    db.session.add(new_user); db.session.commit(); catalog.invalidate('teams')
+    broadcaster.signal('admin_data_refresh', 'users'); return jsonify(new_user.to_dict()), 201
 
 @app.route('/api/admin/users/<int:user_id>', methods=['PUT', 'DELETE'])
 @admin_required
 def manage_user(user_id):
-    user = User.query.get_or_404(user_id)
+    user = user_query('list').get_or_404(user_id)
     if request.method == 'DELETE':
-        db.session.delete(user); db.session.commit()
-        socketio.emit('admin_data_refresh', 'users'); return jsonify({"msg": f"Користувача {user.username} видалено"}), 200
+        db.session.delete(user); db.session.commit(); catalog.invalidate('teams')
+        broadcaster.signal('admin_data_refresh', 'users'); return jsonify({"msg": f"Користувача {user.username} видалено"}), 200
     data = request.get_json(); user.balance = data.get('balance', user.balance); user.loyalty_points = data.get('loyaltyPoints', user.loyalty_points)
     user.is_blocked = data.get('isBlocked', user.is_blocked)
-    if data.get('password'): user.set_password(data['password'])
+    if data.get('password'): user.password_hash = password_hasher.hash(data['password'])
     db.session.commit()
-    socketio.emit('user_update', {'user': user.to_dict(include_sensitive=True)}, room=f'user_{user_id}')
-    socketio.emit('admin_data_refresh', 'users')
+    emit_user_delta(user, 'balance', 'loyaltyPoints', 'isBlocked')
+    broadcaster.signal('admin_data_refresh', 'users')
     return jsonify(user.to_dict())
 
+@app.route('/api/admin/teams/<int:team_id>/pay', methods=['POST'])
+@admin_required
+def pay_team(team_id):
+    team = Team.query.get_or_404(team_id)
+    data = request.get_json(); amount = data.get('amount')
+    if not isinstance(amount, (int, float)) or amount <= 0: return jsonify({"msg": "Некоректна сума"}), 400
+    member_ids = [m.id for m in team.members if not m.is_admin]
+    if not member_ids: return jsonify({"msg": "У команді немає учасників"}), 400
+    transactions = ledger.batch_credit({user_id: amount for user_id in member_ids}, f'Виплата команді {team.name}', data.get('comment', ''))
+    members = {u.id: u for u in User.query.filter(User.id.in_(member_ids)).all()}
+    for tx in transactions:
+        emit_user_delta(members[tx.user_id], 'balance', transaction=tx)
+    broadcaster.signal('admin_data_refresh', 'users')
+    return jsonify({"msg": f"Виплачено {len(member_ids)} учасникам команди {team.name}", 'total': amount * len(member_ids)}), 200
+
 @app.route('/api/admin/transactions', methods=['GET'])
 @admin_required
 def admin_get_transactions():
-    query = db.session.query(Transaction, User.username).join(User, Transaction.user_id == User.id)
-    if filter_text := request.args.get('filter'):
-        search = f"%{filter_text}%"; query = query.filter(or_(User.username.ilike(search), Transaction.comment.ilike(search), Transaction.action.ilike(search)))
-    transactions_with_users = query.order_by(desc(Transaction.date)).limit(200).all()
-    result = [dict(tx.to_dict(), username=username) for tx, username in transactions_with_users]
-    return jsonify(result)
+    args = request.args
+    try:
+        date_from = datetime.fromisoformat(args['from']) if args.get('from') else None
+        date_to = datetime.fromisoformat(args['to']) if args.get('to') else None
+        query = search.filter_transactions(
+            Transaction.query.join(User, Transaction.user_id == User.id).options(contains_eager(Transaction.user)),
+            filter_text=args.get('filter'), username=args.get('user'), action=args.get('action'),
+            min_amount=args.get('minAmount', type=float), max_amount=args.get('maxAmount', type=float),
+            date_from=date_from, date_to=date_to)
+        transactions, next_cursor = paginate_by_date(query, Transaction, args.get('cursor'), min(max(args.get('limit', 100, type=int), 1), 200))
+    except ValueError:
+        return jsonify({"msg": "Некоректні параметри фільтра"}), 400
+    return jsonify({'items': [dict(tx.to_dict(), username=tx.user.username) for tx in transactions], 'nextCursor': next_cursor})
 
 @app.route('/api/admin/shop', methods=['GET','POST'])
 @admin_required
@@ -278,8 +520,8 @@ def manage_shop_items():
     data = request.get_json(); new_item = ShopItem(); 
     for key, value in data.items():
         if hasattr(new_item, key): setattr(new_item, key, value)
-    db.session.add(new_item); db.session.commit()
-    socketio.emit('shop_update', {'items': [i.to_dict() for i in ShopItem.query.all()]})
+    db.session.add(new_item); db.session.commit(); catalog.invalidate('shopItems')
+    broadcaster.publish('shop_update', 'items', [new_item.to_dict()])
     return jsonify(new_item.to_dict()), 201
 
 @app.route('/api/admin/shop/<int:item_id>', methods=['PUT', 'DELETE'])
@@ -287,18 +529,23 @@ def manage_shop_items():
 def manage_shop_item(item_id):
     item = ShopItem.query.get_or_404(item_id)
     if request.method == 'DELETE':
-        LotteryTicket.query.filter_by(item_id=item_id).delete()
-        db.session.delete(item); db.session.commit()
-        socketio.emit('shop_update'); return jsonify({"msg": "Товар видалено"}), 200
+        lottery.reset(item_id)
+        db.session.delete(item); db.session.commit(); catalog.invalidate('shopItems')
+        broadcaster.publish('shop_update', 'items', [{'id': item_id, 'deleted': True}]); return jsonify({"msg": "Товар видалено"}), 200
     data = request.get_json()
     for key, value in data.items():
         if hasattr(item, key) and key not in ['id', 'popularity']: setattr(item, key, value)
-    db.session.commit(); socketio.emit('shop_update'); return jsonify(item.to_dict())
+    db.session.commit(); catalog.invalidate('shopItems')
+    broadcaster.publish('shop_update', 'items', [item.to_dict()]); return jsonify(item.to_dict())
 
 @app.route('/api/admin/settings', methods=['POST'])
 @admin_required
 def update_settings():
     settings_data = request.get_json();
+    try:
+        for key, value in settings_data.items(): settings_cache.validate(key, value)
+    except ValueError as e:
+        return jsonify({"msg": str(e)}), 400
     for key, value in settings_data.items():
         set_setting(key, value)
     return jsonify({"msg": "Налаштування оновлено"}), 200
@@ -312,15 +559,146 @@ def send_ceo_news():
     set_setting('ceoNews', news_list[:10])
     return jsonify({'msg': 'Новину надіслано'}), 200
 
+@app.route('/api/exchange/history/<ticker>', methods=['GET'])
+@jwt_required()
+def get_asset_history(ticker):
+    asset = Asset.query.filter_by(ticker=ticker.upper()).first_or_404()
+    resolution = request.args.get('resolution', '1m')
+    if resolution != 'raw' and resolution not in RESOLUTIONS: return jsonify({"msg": "Невідома роздільність"}), 400
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"msg": "Некоректний діапазон дат"}), 400
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 2000)
+    return jsonify({'ticker': asset.ticker, 'resolution': resolution, 'points': price_history(asset.id, resolution, start, end, limit)})
+
+@app.route('/api/leaderboard', methods=['GET'])
+@jwt_required()
+def get_leaderboard():
+    # Рейтинг береться з пам'яті (leaderboard.py); БД потрібна лише для першого завантаження
+    leaderboard.ensure_loaded()
+    limit = min(request.args.get('limit', app.config['LEADERBOARD_SIZE'], type=int), 100)
+    return jsonify(dict(leaderboard.snapshot(limit), me=leaderboard.rank(get_jwt_identity()['id'])))
+
+def publish_auction(lot):
+    # Клієнтам іде лише знімок лоту з топ-k ставок; часті ставки в межах вікна розсилки зливаються в одне повідомлення
+    catalog.invalidate('auction', propagate=False); cache_sync.bump(f"auction:{lot['key']}")
+    broadcaster.publish('auction_update', 'lots', [lot], key='key')
+
+def emit_auction_closed(result):
+    if result['userId'] is None: return
+    user = db.session.get(User, result['userId'])
+    socketio.emit('user_update', {'user': user.to_delta('balance'), 'transaction': result['transaction']}, room=f'user_{user.id}')
+    socketio.emit('new_notification', result['notification'], room=f"user_{result['userId']}")
+
+@app.route('/api/auction', methods=['GET'])
+@jwt_required()
+def get_auction():
+    auction_engine.ensure_loaded()
+    return jsonify(auction_engine.snapshot())
+
+@app.route('/api/auction/<key>/bid', methods=['POST'])
+@jwt_required()
+def place_bid(key):
+    if not get_setting('featuresEnabled', {}).get('auction', True): return jsonify({"msg": "Аукціон тимчасово вимкнено"}), 403
+    amount = (request.get_json() or {}).get('amount')
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0: return jsonify({"msg": "Некоректна сума ставки"}), 400
+    identity = get_jwt_identity()
+    try:
+        lot = auction_engine.place_bid(key, identity['id'], identity['username'], float(amount))
+    except ledger.InsufficientFunds:
+        return jsonify({"msg": "Недостатньо коштів для такої ставки"}), 400
+    except BidRejected as e:
+        return jsonify({"msg": str(e)}), 409
+    publish_auction(lot)
+    return jsonify(lot), 201
+
+@app.route('/api/admin/auction/<key>', methods=['POST'])
+@admin_required
+def manage_auction(key):
+    # {"isActive": true, "endTime": ..., "name"/"description"/"image"/"startPrice": ...} — новий раунд; {"isActive": false} — завершити зараз
+    if key not in LOT_TYPES: return jsonify({"msg": "Лот не знайдено"}), 404
+    try:
+        result = auction_engine.configure(key, request.get_json() or {})
+    except ValueError as e:
+        return jsonify({"msg": str(e) or "Некоректні дані"}), 400
+    if result: emit_auction_closed(result)
+    lot = auction_engine.snapshot(key); publish_auction(lot)
+    return jsonify(dict(lot, closed=result))
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    return jsonify({'settings': settings_cache.get_stats(), 'catalog': dict(catalog.stats, version=catalog.version), 'leaderboard': leaderboard.get_stats(), 'auction': auction_engine.get_stats(), 'chat': chat_service.get_stats()})
+
+@app.route('/api/admin/perf', methods=['GET'])
+@admin_required
+def get_perf_stats():
+    return jsonify(dict(perf.report(), dbPool=db_pool.get_stats(), sqliteWriter=sqlite_writer.get_stats(), uploads=upload_store.get_stats()))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Для Prometheus без JWT: доступ за статичним токеном; без PERF_METRICS_TOKEN ендпоінт вимкнено
+    token = app.config['PERF_METRICS_TOKEN']
+    if not token or request.headers.get('Authorization') != f'Bearer {token}': abort(404)
+    return Response(perf.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/auth-stats', methods=['GET'])
+@admin_required
+def get_auth_stats():
+    return jsonify(password_hasher.get_stats())
+
+@app.route('/api/admin/broadcast-stats', methods=['GET'])
+@admin_required
+def get_broadcast_stats():
+    return jsonify(broadcaster.get_stats())
+
 @socketio.on('join')
 @jwt_required(optional=True)
 def on_join():
     user_identity = get_jwt_identity()
     if user_identity:
         join_room(f'user_{user_identity.get("id")}')
+        if get_jwt().get('is_admin'): join_room(SUPPORT_ROOM)
         logging.info(f"Клієнт {user_identity.get('id')} приєднався до кімнати.")
 
+@socketio.on('get_leaderboard')
+@jwt_required(optional=True)
+def on_get_leaderboard(data=None):
+    # Відповідь іде через ack-колбек клієнта
+    leaderboard.ensure_loaded()
+    user_identity = get_jwt_identity()
+    try:
+        limit = min(max(int((data or {}).get('limit', app.config['LEADERBOARD_SIZE'])), 1), 100)
+    except (AttributeError, TypeError, ValueError):
+        return {'error': "Некоректні дані"}
+    return dict(leaderboard.snapshot(limit), me=leaderboard.rank(user_identity['id']) if user_identity else None)
+
+@socketio.on('chat_send')
+@jwt_required()
+def on_chat_send(data):
+    # {text} від гравця або {text, userId} від адміністратора; відповідь — через ack
+    identity, data = get_jwt_identity(), data or {}
+    from_support = bool(get_jwt().get('is_admin'))
+    if not from_support and not get_setting('featuresEnabled', {}).get('support', True): return {'error': "Чат підтримки тимчасово вимкнено"}
+    try:
+        return chat_service.send(identity['id'], int(data['userId']) if from_support else identity['id'], data.get('text'), from_support)
+    except (ChatError, KeyError, TypeError, ValueError) as e:
+        return {'error': str(e) if isinstance(e, ChatError) else "Некоректні дані"}
+
+@socketio.on('chat_read')
+@jwt_required()
+def on_chat_read(data):
+    identity, data = get_jwt_identity(), data or {}
+    by_support = bool(get_jwt().get('is_admin'))
+    try:
+        chat_service.mark_read(int(data['userId']) if by_support else identity['id'], by_support, int(data['upTo']))
+    except (KeyError, TypeError, ValueError):
+        return {'error': "Некоректні дані"}
+
 scheduler = BackgroundScheduler(daemon=True)
+scheduler_lease = LeaderLease('scheduler', ttl=app.config['SCHEDULER_LEASE_TTL'])
 
 def update_asset_prices_job():
     with app.app_context():
@@ -330,28 +708,105 @@ def update_asset_prices_job():
         for asset in assets:
             change_percent = (random.random() - 0.495) * (3 if asset.type == 'crypto' else 1.5)
             asset.price = round(max(0.01, asset.price * (1 + change_percent / 100)), 2)
-            db.session.add(AssetHistory(asset_id=asset.id, price=asset.price))
             updates.append({'ticker': asset.ticker, 'price': asset.price})
-        db.session.commit()
-        socketio.emit('exchange_update', {'updates': updates})
+        price_tape.record([(asset.id, asset.price) for asset in assets])
+        db.session.commit(); catalog.invalidate('exchange')
+        broadcaster.publish('exchange_update', 'updates', updates, key='ticker')
+        leaderboard.refresh(); leaderboard.revalue({asset.id: asset.price for asset in assets})
+        broadcast_leaderboard()
+
+def broadcast_leaderboard():
+    broadcaster.signal('leaderboard_update', leaderboard.snapshot(app.config['LEADERBOARD_SIZE']))
 
-def check_deposits_job():
+def refresh_leaderboard_job():
+    # У кожному воркері: дочитуємо змінених гравців; розсилає лише лідер, щоб не дублювати повідомлення
     with app.app_context():
-        now = datetime.now(timezone.utc)
-        finished_users = User.query.filter(User.deposit_amount > 0, User.deposit_end_time <= now).all()
-        for user in finished_users:
-            return_amount = user.deposit_amount * 1.10
-            user.balance += return_amount; user.deposit_earnings += return_amount - user.deposit_amount
-            add_transaction(user.id, 'Повернення депозиту', return_amount, True, f"Прибуток: {(return_amount - user.deposit_amount):.2f} грн", commit=False)
-            notify_user(user.id, f"Ваш депозит на {user.deposit_amount:.2f} грн завершено! Нараховано {return_amount:.2f} грн.", commit_now=False)
-            user.deposit_amount = 0; user.deposit_end_time = None
-            socketio.emit('user_update', {'user': user.to_dict(include_sensitive=True)}, room=f'user_{user.id}')
-        if finished_users: db.session.commit()
-
-scheduler.add_job(func=update_asset_prices_job, trigger="interval", seconds=15)
-scheduler.add_job(func=check_deposits_job, trigger="interval", minutes=1)
+        if leaderboard.refresh() and scheduler_lease.is_leader(): broadcast_leaderboard()
 
-if __name__ == '__main__':
+def rebuild_leaderboard_job():
+    # Повне перезавантаження підхоплює зміни, зроблені іншими воркерами
+    with app.app_context():
+        leaderboard.rebuild()
+
+# Поля user_update для кожного виду строку (див. expiry.py)
+EXPIRY_DELTA_FIELDS = {'deposit': ('balance', 'depositAmount', 'depositEndTime'), 'insurance': ('isInsured', 'insuranceEndTime'), 'loan': ('balance', 'loan')}
+
+def emit_expiry_settled(settled):
+    # Один запит на всіх зачеплених користувачів, далі — розсилка по їхніх кімнатах
+    user_ids = {user_id for items in settled.values() for user_id, _, _ in items}
+    if not user_ids: return
+    users = {user.id: user for user in User.query.options(selectinload(User.loan)).filter(User.id.in_(user_ids))}
+    for kind, items in settled.items():
+        for user_id, transaction, notification in items:
+            payload = {'user': users[user_id].to_delta(*EXPIRY_DELTA_FIELDS[kind])}
+            if transaction: payload['transaction'] = transaction
+            socketio.emit('user_update', payload, room=f'user_{user_id}')
+            socketio.emit('new_notification', notification, room=f'user_{user_id}')
+
+def run_expiry_engine():
+    expiry_engine.init_app(app)
+    run_expiry_loop(app, socketio, scheduler_lease.is_leader, lambda: get_setting('loanSettings', {}).get('termDays', 1), perf.job(emit_expiry_settled))
+
+def close_auctions_job():
+    # Перевірка — у пам'яті; до БД звертаємось лише коли якийсь лот справді завершився
+    with app.app_context():
+        auction_engine.ensure_loaded()
+        for key in auction_engine.due(datetime.utcnow()):
+            result = auction_engine.close(key)
+            if result: emit_auction_closed(result)
+            publish_auction(auction_engine.snapshot(key))
+
+def compact_price_history_job():
+    with app.app_context():
+        removed = compact_price_history()
+        if removed: logging.info(f"Видалено {removed} застарілих записів історії цін.")
+
+def reconcile_bank_stats_job():
+    with app.app_context():
+        bank_stats.reconcile()
+
+def expire_uploads_job():
+    with app.app_context():
+        removed = upload_store.expire()
+        if removed: logging.info(f"Видалено {removed} незавершених завантажень.")
+
+def renew_scheduler_lease_job():
+    if not app.config['SCHEDULER_ENABLED']: return
+    with app.app_context():
+        scheduler_lease.try_acquire()
+
+def sync_caches_job():
+    with app.app_context():
+        cache_sync.poll()
+
+# Воркер, що не є лідером, отримує нові ціни лише з БД — скидаємо його буфер тиків разом із секцією каталогу
+cache_sync.on('catalog:exchange', lambda name: price_tape.reset())
+cache_sync.on('catalog:exchange', lambda name: leaderboard.reload_prices())
+cache_sync.on('auction:', lambda name: auction_engine.reload(name.split(':', 1)[1]))
+cache_sync.on('auction:', lambda name: catalog.invalidate('auction', propagate=False))
+
+scheduler.add_job(func=perf.job(renew_scheduler_lease_job), trigger="interval", seconds=max(1, app.config['SCHEDULER_LEASE_TTL'] // 3))
+scheduler.add_job(func=scheduler_lease.leader_only(perf.job(update_asset_prices_job)), trigger="interval", seconds=15)
+scheduler.add_job(func=scheduler_lease.leader_only(perf.job(close_auctions_job)), trigger="interval", seconds=1)
+scheduler.add_job(func=scheduler_lease.leader_only(perf.job(compact_price_history_job)), trigger="interval", minutes=10)
+scheduler.add_job(func=scheduler_lease.leader_only(perf.job(reconcile_bank_stats_job)), trigger="interval", minutes=15)
+scheduler.add_job(func=scheduler_lease.leader_only(perf.job(expire_uploads_job)), trigger="interval", minutes=30)
+scheduler.add_job(func=perf.job(refresh_leaderboard_job), trigger="interval", seconds=app.config['LEADERBOARD_REFRESH_INTERVAL'])
+scheduler.add_job(func=perf.job(rebuild_leaderboard_job), trigger="interval", seconds=app.config['LEADERBOARD_REBUILD_INTERVAL'])
+if cache_sync.enabled:
+    scheduler.add_job(func=perf.job(sync_caches_job), trigger="interval", seconds=app.config['CACHE_SYNC_INTERVAL'])
+
+def start_scheduler():
+    # Викликається з app.py і wsgi.py у кожному воркері; задачі виконає лише лідер
     if not scheduler.running:
+        sqlite_writer.start()
+        upload_store.start()
+        renew_scheduler_lease_job()
+        if cache_sync.enabled: sync_caches_job()
         scheduler.start()
+        # Строки депозитів/страховок/кредитів обробляє окремий фоновий цикл (лише в лідері)
+        socketio.start_background_task(run_expiry_engine)
+
+if __name__ == '__main__':
+    start_scheduler()
     socketio.run(app, host='0.0.0.0', port=5001, debug=False, use_reloader=False)
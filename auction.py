@@ -0,0 +1,308 @@
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import exists, func, insert, literal, select, update
+from models import db, AuctionState, Bid, User, WonLot, Notification
+from bank_stats import record_balance_change
+import ledger
+
+# Аукціони: ставки — окремі рядки Bid, а не список усередині AuctionState.state_json
+# (там лишився лише опис лоту: isActive, endTime, round, winner, назва тощо).
+# Найвища ставка кожного лоту тримається в пам'яті, тож замала ставка відхиляється без БД.
+# Прийняття ставки — умовний INSERT (лише якщо в раунді немає вищої ставки) під блокуванням
+# рядка лоту: одночасні ставки, навіть з різних воркерів, не перезаписують одна одну.
+# Кожна прийнята ставка вища за всі попередні, тому топ-k — це просто k останніх прийнятих.
+
+# Тип WonLot для кожного лоту
+LOT_TYPES = {'general_auction': 'auction', 'special_lot': 'special_auction'}
+# Поля опису лоту, які адмін задає під час запуску
+LOT_FIELDS = ('name', 'description', 'image', 'startPrice')
+# Скільки ставок за раз перебирати при визначенні переможця
+SETTLE_PAGE = 50
+
+class BidRejected(Exception):
+    """Ставку не прийнято; текст помилки показується гравцю."""
+
+class _StaleLot(Exception):
+    """Стан лоту в пам'яті відстав від БД (ставка з іншого воркера, продовження часу тощо)."""
+
+def parse_end_time(value):
+    """ISO-рядок (з часовою зоною або без) -> naive datetime в UTC, як інші строки в моделях."""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def _bid_dict(bid_id, username, amount, date):
+    return {'id': bid_id, 'username': username, 'amount': amount, 'date': date.isoformat()}
+
+class _Lot:
+    def __init__(self, key, top_k):
+        self.key = key
+        self.top_k = top_k
+        self.lock = threading.Lock()
+        self.state = {}
+        self.end_time = None
+        self.top = ()  # Незмінний кортеж від найвищої ставки: читачам не потрібне блокування
+        self.bid_count = 0
+
+    @property
+    def round(self):
+        return self.state.get('round', 0)
+
+    @property
+    def active(self):
+        return bool(self.state.get('isActive'))
+
+    @property
+    def high(self):
+        return self.top[0]['amount'] if self.top else None
+
+    def set_state(self, state):
+        state = dict(state or {})
+        state.pop('bids', None)  # Старий формат зі ставками всередині JSON
+        self.state = state
+        self.end_time = parse_end_time(state.get('endTime'))
+
+    def load(self):
+        """Перечитує опис лоту і топ ставок поточного раунду (індекс lot_key, round, amount)."""
+        state_json = db.session.execute(select(AuctionState.state_json).where(AuctionState.key == self.key)).scalar()
+        self.set_state(json.loads(state_json) if state_json else None)
+        in_round = (Bid.lot_key == self.key, Bid.round == self.round)
+        rows = db.session.execute(select(Bid.id, User.username, Bid.amount, Bid.date).join(User, Bid.user_id == User.id)
+                                  .where(*in_round).order_by(Bid.amount.desc()).limit(self.top_k)).all()
+        self.top = tuple(_bid_dict(*row) for row in rows)
+        self.bid_count = db.session.execute(select(func.count(Bid.id)).where(*in_round)).scalar()
+
+    def minimum(self, increment):
+        if self.high is None:
+            return max(float(self.state.get('startPrice') or 0), increment)
+        return self.high + increment
+
+    def check(self, amount, now, increment):
+        if not self.active:
+            raise BidRejected("Аукціон неактивний")
+        if self.end_time is not None and now >= self.end_time:
+            raise BidRejected("Аукціон завершено")
+        if amount < self.minimum(increment):
+            raise BidRejected(f"Мінімальна ставка — {self.minimum(increment):.2f} грн")
+
+    def matches(self, state):
+        return (state.get('round', 0), bool(state.get('isActive')), state.get('endTime')) == (self.round, self.active, self.state.get('endTime'))
+
+    def accept(self, bid, state):
+        self.top = ((bid,) + self.top)[:self.top_k]
+        self.bid_count += 1
+        self.set_state(state)
+
+    def snapshot(self):
+        return dict({field: self.state[field] for field in LOT_FIELDS if field in self.state},
+                    key=self.key, isActive=self.active, endTime=self.state.get('endTime'), round=self.round,
+                    winner=self.state.get('winner'), highestBid=self.high, bidCount=self.bid_count, topBids=list(self.top))
+
+class AuctionEngine:
+    """Лоти аукціонів у пам'яті; джерело істини — таблиці auction_state і bid."""
+
+    def __init__(self, top_k=10, bid_interval=0.5, snipe_window=30, extension=30, min_increment=1):
+        self.top_k = top_k
+        self.bid_interval = bid_interval
+        self.snipe_window = snipe_window
+        self.extension = extension
+        self.min_increment = min_increment
+        self._lock = threading.Lock()
+        self._lots = {}
+        self._loaded = False
+        self._last_bid = {}  # user_id -> time.monotonic() останньої спроби
+        self.stats = Counter()
+
+    def init_app(self, app):
+        self.top_k = app.config.get('AUCTION_TOP_BIDS', self.top_k)
+        self.bid_interval = app.config.get('AUCTION_BID_INTERVAL', self.bid_interval)
+        self.snipe_window = app.config.get('AUCTION_SNIPE_WINDOW', self.snipe_window)
+        self.extension = app.config.get('AUCTION_EXTENSION', self.extension)
+        self.min_increment = app.config.get('AUCTION_MIN_INCREMENT', self.min_increment)
+
+    def _lot(self, key):
+        with self._lock:
+            if key not in self._lots:
+                self._lots[key] = _Lot(key, self.top_k)
+            return self._lots[key]
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.reload()
+
+    def reload(self, key=None):
+        """Перечитує з БД один лот або всі (після змін в іншому воркері)."""
+        keys = [key] if key else db.session.execute(select(AuctionState.key)).scalars().all()
+        for name in keys:
+            lot = self._lot(name)
+            with lot.lock:
+                lot.load()
+        if key is None:
+            self._loaded = True
+
+    def snapshot(self, key=None):
+        if key is not None:
+            lot = self._lots.get(key)
+            return lot.snapshot() if lot else None
+        return {name: lot.snapshot() for name, lot in list(self._lots.items())}
+
+    def due(self, now):
+        return [lot.key for lot in list(self._lots.values()) if lot.active and lot.end_time is not None and lot.end_time <= now]
+
+    # --- Ставки ---
+
+    def _throttle(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_bid.get(user_id)
+            if last is not None and now - last < self.bid_interval:
+                self.stats['throttled'] += 1
+                raise BidRejected("Занадто часті ставки, спробуйте за мить")
+            self._last_bid[user_id] = now
+
+    def place_bid(self, key, user_id, username, amount, now=None):
+        """Приймає ставку і повертає знімок лоту.
+
+        BidRejected — ставку відхилено; ledger.InsufficientFunds — ставка більша за баланс гравця.
+        """
+        self.ensure_loaded()
+        lot = self._lots.get(key)
+        if lot is None:
+            raise BidRejected("Лот не знайдено")
+        self._throttle(user_id)
+        now = now or datetime.utcnow()
+        with lot.lock:
+            # Друга спроба — після перечитування лоту, якщо пам'ять відстала від БД
+            for _ in range(2):
+                try:
+                    lot.check(amount, now, self.min_increment)
+                except BidRejected:
+                    self.stats['rejected'] += 1
+                    raise
+                try:
+                    bid, state = ledger.atomic(lambda: self._insert_bid(lot, user_id, username, amount, now))
+                except _StaleLot:
+                    self.stats['stale'] += 1
+                    lot.load()
+                    continue
+                lot.accept(bid, state)
+                self.stats['accepted'] += 1
+                return lot.snapshot()
+        self.stats['rejected'] += 1
+        raise BidRejected("Стан аукціону змінився, спробуйте ще раз")
+
+    def _insert_bid(self, lot, user_id, username, amount, now):
+        state_json = db.session.execute(select(AuctionState.state_json).where(AuctionState.key == lot.key).with_for_update()).scalar()
+        state = (json.loads(state_json) if state_json else None) or {}  # Після сиду special_lot зберігається як "null"
+        if not lot.matches(state):
+            raise _StaleLot()
+        if db.session.execute(select(User.balance).where(User.id == user_id)).scalar() < amount:
+            raise ledger.InsufficientFunds(user_id)
+        # Compare-and-set у SQL: рядок з'явиться, лише якщо в раунді ще немає ставки, вищої за amount - крок
+        higher = exists().where(Bid.lot_key == lot.key, Bid.round == lot.round, Bid.amount > amount - self.min_increment)
+        bid_id = db.session.execute(
+            insert(Bid).from_select(['lot_key', 'round', 'user_id', 'amount', 'date'],
+                                    select(literal(lot.key), literal(lot.round), literal(user_id), literal(amount), literal(now)).where(~higher))
+            .returning(Bid.id)
+        ).scalar()
+        if bid_id is None:
+            raise _StaleLot()
+        # Антиснайпінг: ставка в останні snipe_window секунд відсуває завершення
+        end_time = parse_end_time(state.get('endTime'))
+        if end_time is not None and (end_time - now).total_seconds() < self.snipe_window:
+            state['endTime'] = max(end_time, now + timedelta(seconds=self.extension)).isoformat()
+            db.session.execute(update(AuctionState).where(AuctionState.key == lot.key).values(state_json=json.dumps(state)))
+            self.stats['extended'] += 1
+        return _bid_dict(bid_id, username, amount, now), state
+
+    # --- Керування лотами ---
+
+    def configure(self, key, data, now=None):
+        """Запускає новий раунд лоту (isActive=true) або зупиняє його.
+
+        Зупинка активного лоту визначає переможця і повертає підсумок close(). ValueError — некоректні дані.
+        """
+        if not data.get('isActive'):
+            return self.close(key, now, force=True)
+        now = now or datetime.utcnow()
+        end_time = parse_end_time(data.get('endTime'))
+        if end_time is not None and end_time <= now:
+            raise ValueError("Час завершення вже минув")
+        if data.get('startPrice') is not None and float(data['startPrice']) < 0:
+            raise ValueError("Початкова ціна не може бути від'ємною")
+        def work():
+            row = db.session.execute(select(AuctionState).where(AuctionState.key == key).with_for_update()).scalar()
+            if row is None:
+                row = AuctionState(key=key)
+                db.session.add(row)
+            previous = json.loads(row.state_json) if row.state_json else None
+            state = {'isActive': True, 'endTime': end_time.isoformat() if end_time else None,
+                     'round': (previous or {}).get('round', 0) + 1, 'winner': None}
+            state.update({field: data[field] for field in LOT_FIELDS if data.get(field) is not None})
+            row.state_json = json.dumps(state)
+        lot = self._lot(key)
+        with lot.lock:
+            ledger.atomic(work)
+            lot.load()
+        return None
+
+    def close(self, key, now=None, force=False):
+        """Завершує лот, якщо настав час (або force). Повертає підсумок або None, якщо закривати нічого."""
+        now = now or datetime.utcnow()
+        lot = self._lot(key)
+        with lot.lock:
+            result = ledger.atomic(lambda: self._settle(key, now, force))
+            lot.load()
+        if result is not None:
+            self.stats['closed'] += 1
+        return result
+
+    def _settle(self, key, now, force):
+        row = db.session.execute(select(AuctionState).where(AuctionState.key == key).with_for_update()).scalar()
+        state = (json.loads(row.state_json) if row and row.state_json else None) or {}
+        end_time = parse_end_time(state.get('endTime'))
+        if not state.get('isActive') or not (force or (end_time is not None and end_time <= now)):
+            return None
+        state.pop('bids', None)
+        state.update(isActive=False, winner=None)
+        result = {'key': key, 'winner': None, 'userId': None, 'transaction': None, 'notification': None}
+        name = state.get('name') or 'Загальний аукціон'
+        # Переможець — найвища ставка гравця, якому вистачає коштів; зазвичай це перша ж ставка
+        tried, offset = set(), 0
+        while result['userId'] is None:
+            bids = db.session.execute(select(Bid.user_id, User.username, Bid.amount).join(User, Bid.user_id == User.id)
+                                      .where(Bid.lot_key == key, Bid.round == state.get('round', 0))
+                                      .order_by(Bid.amount.desc(), Bid.id).offset(offset).limit(SETTLE_PAGE)).all()
+            if not bids:
+                break
+            offset += SETTLE_PAGE
+            for user_id, username, amount in bids:
+                if user_id in tried:
+                    continue
+                tried.add(user_id)
+                try:
+                    ledger.debit(user_id, amount)
+                except ledger.InsufficientFunds:
+                    continue
+                record_balance_change(-amount)
+                transaction = ledger.record(user_id, f'Виграш аукціону: {name}', amount, False)
+                db.session.add(WonLot(user_id=user_id, type=LOT_TYPES.get(key, 'auction'), name=name, prize=state.get('description')))
+                notification = Notification(user_id=user_id, text=f"Вітаємо! Ви виграли «{name}» зі ставкою {amount:.2f} грн.", date=datetime.utcnow())
+                db.session.add(notification)
+                db.session.flush()
+                state['winner'] = {'username': username, 'amount': amount}
+                result.update(winner=state['winner'], userId=user_id, transaction=transaction.to_dict(), notification=notification.to_dict())
+                break
+        row.state_json = json.dumps(state)
+        return result
+
+    def get_stats(self):
+        return dict(self.stats, lots={key: {'bidCount': lot.bid_count, 'highestBid': lot.high} for key, lot in list(self._lots.items())})
+
+auction_engine = AuctionEngine()
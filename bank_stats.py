@@ -0,0 +1,159 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import case, delete, event, func, insert, inspect, select, update
+from models import db, User, Loan, Transaction, BankStats, UserStats
+
+# Агрегати банку (загальний баланс, борг, кількість транзакцій, лічильники по користувачах)
+# оновлюються в тій самій транзакції БД, що й зміни, які їх спричинили:
+#  - зміни ORM-об'єктів User/Loan/Transaction збираються автоматично в before_flush;
+#  - прямі UPDATE балансів і кредитів (ledger.py, expiry.py) повідомляють про себе через
+#    record_balance_change() / record_debt_change().
+# Періодичний reconcile() перераховує все з нуля і виправляє можливий дрейф.
+
+STATS_ID = 1
+_table = BankStats.__table__
+_user_table = UserStats.__table__
+_default_balance = User.__table__.c.balance.default.arg
+
+def _pending(session):
+    return session.info.setdefault('bank_stats', {'balance': 0.0, 'debt': 0.0, 'users': 0, 'tx': Counter(), 'new_tx': []})
+
+def snapshot(session):
+    """Копія ще не застосованих змін сесії: відкат SAVEPOINT-а (sqlite_writer) відновлює її через restore()."""
+    pending = session.info.get('bank_stats')
+    if pending is None:
+        return None
+    # Об'єкти Transaction у new_tx не копіюються — лише список посилань на них
+    return dict(pending, tx=Counter(pending['tx']), new_tx=list(pending['new_tx']))
+
+def restore(session, saved):
+    if saved is None:
+        session.info.pop('bank_stats', None)
+    else:
+        session.info['bank_stats'] = saved
+
+def record_balance_change(amount, session=None):
+    """Враховує зміну сумарного балансу гравців, зроблену в обхід ORM."""
+    _pending(session or db.session())['balance'] += amount
+
+def record_new_users(count, balance, session=None):
+    """Враховує гравців, вставлених в обхід ORM (масовий імпорт)."""
+    pending = _pending(session or db.session())
+    pending['users'] += count
+    pending['balance'] += balance
+
+def record_debt_change(amount, session=None):
+    """Враховує зміну сумарного боргу за кредитами, зроблену в обхід ORM."""
+    _pending(session or db.session())['debt'] += amount
+
+def _balance_delta(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    if not history.added:
+        return 0
+    if not history.deleted:
+        # Старе значення не було завантажене — точну різницю знає лише reconcile()
+        logging.warning(f"Невідоме попереднє значення {type(obj).__name__}.{attr}; агрегати уточнить звірка.")
+        return 0
+    return (history.added[0] or 0) - (history.deleted[0] or 0)
+
+@event.listens_for(db.session, 'before_flush')
+def _collect(session, flush_context, instances):
+    pending = _pending(session)
+    for obj in session.new:
+        if isinstance(obj, User) and not obj.is_admin:
+            pending['balance'] += obj.balance if obj.balance is not None else _default_balance
+            pending['users'] += 1
+        elif isinstance(obj, Loan):
+            pending['debt'] += obj.amount or 0
+        elif isinstance(obj, Transaction):
+            pending['new_tx'].append(obj)  # user_id може з'явитися лише після flush
+    for obj in session.dirty:
+        if isinstance(obj, User) and not obj.is_admin:
+            pending['balance'] += _balance_delta(obj, 'balance')
+        elif isinstance(obj, Loan):
+            pending['debt'] += _balance_delta(obj, 'amount')
+    for obj in session.deleted:
+        if isinstance(obj, User) and not obj.is_admin:
+            pending['balance'] -= obj.balance or 0
+            pending['users'] -= 1
+        elif isinstance(obj, Loan):
+            pending['debt'] -= obj.amount or 0
+        elif isinstance(obj, Transaction):
+            pending['tx'][obj.user_id] -= 1
+
+@event.listens_for(db.session, 'after_flush')
+@event.listens_for(db.session, 'before_commit')
+def _apply(session, *args):
+    pending = session.info.pop('bank_stats', None)
+    if not pending:
+        return
+    pending['tx'].update(obj.user_id for obj in pending['new_tx'])
+    tx = {user_id: n for user_id, n in pending['tx'].items() if n}
+    if not (pending['balance'] or pending['debt'] or pending['users'] or tx):
+        return
+    # Працюємо через connection, а не через ORM, щоб не запускати autoflush посеред flush
+    conn = session.connection()
+    conn.execute(update(_table).where(_table.c.id == STATS_ID).values(
+        total_balance=_table.c.total_balance + pending['balance'],
+        total_debt=_table.c.total_debt + pending['debt'],
+        user_count=_table.c.user_count + pending['users'],
+        tx_count=_table.c.tx_count + sum(tx.values()),
+    ))
+    if tx:
+        conn.execute(update(_user_table).where(_user_table.c.user_id.in_(list(tx)))
+                     .values(tx_count=_user_table.c.tx_count + case(tx, value=_user_table.c.user_id, else_=0)))
+        existing = set(conn.execute(select(_user_table.c.user_id).where(_user_table.c.user_id.in_(list(tx)))).scalars())
+        missing = [{'user_id': user_id, 'tx_count': n} for user_id, n in tx.items() if user_id not in existing and n > 0]
+        if missing:
+            conn.execute(insert(_user_table), missing)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard(session):
+    session.info.pop('bank_stats', None)
+
+def reconcile():
+    """Перераховує агрегати повними запитами і перезаписує їх. Повертає розбіжність із попередніми значеннями."""
+    session = db.session
+    # Блокування рядка агрегатів: паралельні інкременти дочекаються кінця звірки
+    stats = session.execute(select(BankStats).where(BankStats.id == STATS_ID).with_for_update()).scalar_one_or_none()
+    created = stats is None
+    if created:
+        stats = BankStats(id=STATS_ID, total_balance=0, total_debt=0, user_count=0, tx_count=0)
+        session.add(stats)
+    before = stats.to_dict()
+    balance, users = session.execute(select(func.coalesce(func.sum(User.balance), 0), func.count(User.id)).where(User.is_admin == False)).one()
+    values = {
+        'total_balance': balance,
+        'user_count': users,
+        'total_debt': session.execute(select(func.coalesce(func.sum(Loan.amount), 0))).scalar(),
+        'tx_count': session.execute(select(func.count(Transaction.id))).scalar(),
+    }
+    for key, value in values.items(): setattr(stats, key, value)
+    stats.reconciled_at = datetime.utcnow()
+    conn = session.connection()
+    conn.execute(delete(_user_table))
+    rows = session.execute(select(Transaction.user_id, func.count(Transaction.id)).group_by(Transaction.user_id)).all()
+    if rows:
+        conn.execute(insert(_user_table), [{'user_id': user_id, 'tx_count': n} for user_id, n in rows])
+    # Зміни, зроблені звіркою, вже враховані повним перерахунком
+    session.flush()
+    session.info.pop('bank_stats', None)
+    session.commit()
+    after = stats.to_dict()
+    drift = {key: after[key] - before[key] for key in ('totalUsers', 'totalTransactions', 'totalBalance', 'totalDebt')}
+    if not created and any(abs(v) > 1e-6 for v in drift.values()):
+        logging.warning(f"Звірка агрегатів банку виявила розбіжність: {drift}")
+    return drift
+
+def read():
+    """Агрегати за O(1); при першому зверненні (ще немає рядка) виконує звірку."""
+    stats = db.session.get(BankStats, STATS_ID)
+    if stats is None:
+        reconcile()
+        stats = db.session.get(BankStats, STATS_ID)
+    return stats
+
+def top_active_users(limit=5):
+    return db.session.query(User.username, UserStats.tx_count).join(UserStats, UserStats.user_id == User.id) \
+        .filter(User.is_admin == False).order_by(UserStats.tx_count.desc()).limit(limit).all()
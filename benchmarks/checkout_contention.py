@@ -0,0 +1,68 @@
+"""Бенчмарк оформлення замовлень під конкуренцією за один товар з малим залишком.
+
+Усі клієнти одночасно (через бар'єр) купують той самий товар по одній штуці, доки він не закінчиться.
+Кожен раунд перевіряє, що продано рівно стільки, скільки було на складі (жодного перепродажу),
+а звіт містить пропускну здатність оформлення і латентність успішних/відхилених спроб.
+Решта параметрів — як у benchmarks/run.py.
+
+    python benchmarks/checkout_contention.py --users 100 --concurrency 50 --hot-stock 20 --rounds 5
+"""
+import sys
+import time
+import argparse
+import threading
+from collections import Counter
+
+import run
+
+def contention(hot_item, hot_stock, rounds):
+    def scenario(ctx, args):
+        _, items = ctx.admin.request('GET', '/api/admin/shop')
+        item = next((i for i in items if i['name'] == hot_item), None) or next(i for i in items if i['id'] in ctx.item_ids)
+        clients = []
+        for n in range(args.concurrency):
+            client = ctx.client(n % ctx.users + 1)
+            client.login(*ctx.me(client))
+            clients.append(client)
+        results = []
+        for _ in range(rounds):
+            ctx.admin.request('PUT', f"/api/admin/shop/{item['id']}", {'quantity': hot_stock})
+            statuses, lock = Counter(), threading.Lock()
+            barrier = threading.Barrier(len(clients) + 1)
+            def buyer(client):
+                barrier.wait()
+                while True:
+                    status, _ = client.request('POST', '/api/shop/checkout', {'cart': [{'id': item['id'], 'quantity': 1}]}, op='checkout hot item')
+                    with lock: statuses[str(status)] += 1
+                    if status != 200:
+                        return  # Товар закінчився (409) або помилка — покупець іде
+            threads = [threading.Thread(target=buyer, args=(client,), daemon=True) for client in clients]
+            for thread in threads: thread.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for thread in threads: thread.join()
+            seconds = time.perf_counter() - started
+            _, after = ctx.admin.request('GET', '/api/admin/shop')
+            remaining = next(i['quantity'] for i in after if i['id'] == item['id'])
+            sold = statuses['200']
+            results.append({'stock': hot_stock, 'sold': sold, 'remaining': remaining, 'statuses': dict(statuses),
+                            'oversold': sold > hot_stock or remaining < 0 or sold + remaining != hot_stock,
+                            'seconds': round(seconds, 3), 'attemptsPerSecond': round(sum(statuses.values()) / seconds, 2) if seconds else None})
+        return {'item': item['name'], 'buyers': len(clients), 'rounds': results,
+                'oversold': any(r['oversold'] for r in results)}
+    return scenario
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--hot-item', default='Смартфон X', help="Назва товару, за який змагаються покупці")
+    parser.add_argument('--hot-stock', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    own, rest = parser.parse_known_args(argv)
+    report = run.main(rest, scenario=contention(own.hot_item, own.hot_stock, own.rounds))
+    for i, r in enumerate(report['scenario']['rounds'], 1):
+        print(f"Раунд {i}: продано {r['sold']}/{r['stock']}, залишок {r['remaining']}, {r['attemptsPerSecond']} спроб/с"
+              + (" — ПЕРЕПРОДАЖ!" if r['oversold'] else ""))
+    return 1 if report['scenario']['oversold'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
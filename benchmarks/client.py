@@ -0,0 +1,107 @@
+import json
+import time
+import threading
+import urllib.request
+import urllib.error
+from collections import Counter, defaultdict
+
+# HTTP- і Socket.IO-клієнти бенчмарка та збір результатів.
+# HTTP — лише стандартна бібліотека; Socket.IO потребує python-socketio[client] (benchmarks/requirements.txt).
+
+def percentiles(values, quantiles=(0.5, 0.9, 0.95, 0.99)):
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {f'p{int(q * 100)}': round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2) for q in quantiles}
+    result['max'] = round(values[-1] * 1000, 2)
+    result['mean'] = round(sum(values) / len(values) * 1000, 2)
+    return result
+
+class Recorder:
+    """Потокобезпечний збір латентностей і статусів по операціях."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, op, seconds, status):
+        with self._lock:
+            self.latencies[op].append(seconds)
+            self.statuses[op][str(status)] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        with self._lock:
+            ops = {}
+            for op, values in sorted(self.latencies.items()):
+                statuses = self.statuses[op]
+                errors = sum(n for status, n in statuses.items() if status == 'error' or status.startswith('5'))
+                ops[op] = {'count': len(values), 'errors': errors, 'statuses': dict(statuses),
+                           'throughput': round(len(values) / elapsed, 2) if elapsed else None, 'latencyMs': percentiles(values)}
+            total = sum(len(values) for values in self.latencies.values())
+            return {'seconds': round(elapsed, 2), 'requests': total, 'throughput': round(total / elapsed, 2) if elapsed else None,
+                    'latencyMs': percentiles([v for values in self.latencies.values() for v in values]), 'operations': ops}
+
+class HttpClient:
+    def __init__(self, base_url, recorder=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, body=None, op=None, token=None):
+        """Повертає (status, json-або-None). Помилка з'єднання — status 'error'."""
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        if token or self.token:
+            req.add_header('Authorization', f'Bearer {token or self.token}')
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            status, payload = exc.code, exc.read()
+        except (urllib.error.URLError, OSError):
+            status, payload = 'error', b''
+        if self.recorder is not None:
+            self.recorder.record(op or f'{method} {path.split("?")[0]}', time.perf_counter() - started, status)
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+    def login(self, username, password, op='login'):
+        status, payload = self.request('POST', '/api/login', {'username': username, 'password': password}, op=op)
+        if status == 200:
+            self.token = payload['access_token']
+        return status
+
+class SocketListener:
+    """Socket.IO-клієнт, що рахує отримані події та їхній обсяг (байти JSON)."""
+
+    def __init__(self, base_url, token):
+        import socketio  # python-socketio[client]
+        self.events = Counter()
+        self.bytes = Counter()
+        self._lock = threading.Lock()
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('*', self._on_event)
+        self.client.on('connect', lambda: self.client.emit('join'))
+        self.client.connect(base_url, headers={'Authorization': f'Bearer {token}'}, transports=['websocket'])
+
+    def _on_event(self, event, *args):
+        size = len(json.dumps(args, ensure_ascii=False, default=str).encode())
+        with self._lock:
+            self.events[event] += 1
+            self.bytes[event] += size
+
+    def close(self):
+        self.client.disconnect()
@@ -0,0 +1,41 @@
+"""Бенчмарк латентності одночасних запитів на Postgres із зеленим psycopg2 і без нього.
+
+Той самий сценарій (benchmarks/run.py) запускається двічі на одній БД: з DB_GREEN=0 (кожен запит
+до Postgres блокує хаб eventlet) і з DB_GREEN=1. Для кожного режиму виводяться пропускна здатність,
+p50/p95/p99 по операціях і стан пулу з'єднань сервера (очікування видачі, максимум виданих).
+Решта параметрів — як у benchmarks/run.py; --database-url обов'язковий.
+
+    python benchmarks/pool_latency.py --database-url postgresql://bench@localhost/ceobank_bench \\
+        --users 300 --concurrency 100 --duration 30 --mix read_heavy --pool-size 20 --max-overflow 30
+"""
+import sys
+import argparse
+
+import run
+
+MODES = (('blocking', '0'), ('green', '1'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--max-overflow', type=int, default=30)
+    own, rest = parser.parse_known_args(argv)
+    if not any(arg.startswith('--database-url') for arg in rest):
+        parser.error("потрібен --database-url postgresql://... (зелений режим стосується лише psycopg2)")
+    reports = {}
+    for label, green in MODES:
+        reports[label] = run.main(rest + ['--label', f'pool-{label}', '--env', f'DB_GREEN={green}',
+                                          '--env', f'DB_POOL_SIZE={own.pool_size}', '--env', f'DB_MAX_OVERFLOW={own.max_overflow}'])
+    for label, report in reports.items():
+        http, pool = report['http'], report['server']['perf'].get('dbPool', {})
+        print(f"\n[{label}] {http['throughput']} запитів/с, p50 {http['latencyMs'].get('p50')} мс, "
+              f"p95 {http['latencyMs'].get('p95')} мс, p99 {http['latencyMs'].get('p99')} мс")
+        for op, stats in http['operations'].items():
+            latency = stats['latencyMs']
+            print(f"  {op:<16} p50 {latency.get('p50')} мс, p95 {latency.get('p95')} мс, p99 {latency.get('p99')} мс, помилок {stats['errors']}")
+        print(f"  пул: зелений={pool.get('green')}, видач {pool.get('checkouts')}, очікування p95 {(pool.get('waitMs') or {}).get('p95')} мс, "
+              f"макс. {pool.get('waitMsMax')} мс, тайм-аутів {pool.get('timeouts')}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
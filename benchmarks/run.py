@@ -0,0 +1,293 @@
+"""Навантажувальний бенчмарк CEO-BANK.
+
+Піднімає застосунок (benchmarks/server.py) на окремій БД, створює N гравців через
+`flask init-db` + `flask import-users`, після чого багато паралельних клієнтів ганяють
+суміш запитів (або відтворюють записаний трафік) протягом заданого часу. Результат —
+JSON-звіт (пропускна здатність, перцентилі латентності по операціях, обсяг socket-подій,
+серверні метрики з /api/admin/perf), який зручно порівнювати між версіями.
+
+    python benchmarks/run.py --users 500 --concurrency 50 --duration 60 --mix event
+    python benchmarks/run.py --replay traffic.jsonl --speed 4
+    python benchmarks/run.py --database-url postgresql://bench@localhost/ceobank_bench
+
+Трафік для --replay записує сам застосунок, якщо задано TRAFFIC_CAPTURE_PATH (див. config.py).
+УВАГА: init-db очищає вказану БД — для Postgres використовуйте окрему базу.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+from queue import Queue, Empty
+
+from client import HttpClient, Recorder, SocketListener
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ваги операцій у сумішах навантаження
+MIXES = {
+    'event': {'login': 5, 'initial_data': 30, 'transfer': 25, 'checkout': 15, 'leaderboard': 15, 'admin': 10},
+    'login_storm': {'login': 80, 'initial_data': 20},
+    'read_heavy': {'initial_data': 60, 'leaderboard': 30, 'admin': 10},
+    'write_heavy': {'transfer': 60, 'checkout': 40},
+}
+
+def bench_user(i):
+    return f'bench{i}', f'benchpass{i}'
+
+# --- Операції: (ctx, client, rng) ---
+
+def op_login(ctx, client, rng):
+    client.login(*ctx.me(client))
+
+def op_initial_data(ctx, client, rng):
+    client.request('GET', '/api/initial-data', op='initial_data')
+
+def op_transfer(ctx, client, rng):
+    recipient = bench_user(rng.randint(1, ctx.users))[0]
+    client.request('POST', '/api/transfer', {'recipient': recipient, 'amount': 1, 'comment': 'bench'}, op='transfer')
+
+def op_checkout(ctx, client, rng):
+    cart = [{'id': item_id, 'quantity': 1} for item_id in rng.sample(ctx.item_ids, min(len(ctx.item_ids), rng.randint(1, 3)))]
+    client.request('POST', '/api/shop/checkout', {'cart': cart}, op='checkout')
+
+def op_leaderboard(ctx, client, rng):
+    client.request('GET', '/api/leaderboard', op='leaderboard')
+
+ADMIN_PATHS = ['/api/admin/dashboard-stats', '/api/admin/users', '/api/admin/transactions?limit=50', '/api/admin/transactions?filter=bench']
+
+def op_admin(ctx, client, rng):
+    path = rng.choice(ADMIN_PATHS)
+    client.request('GET', path, op='admin ' + path.split('?')[0].rsplit('/', 1)[-1], token=ctx.admin.token)
+
+OPERATIONS = {'login': op_login, 'initial_data': op_initial_data, 'transfer': op_transfer,
+              'checkout': op_checkout, 'leaderboard': op_leaderboard, 'admin': op_admin}
+
+class Context:
+    def __init__(self, base_url, users, recorder):
+        self.base_url = base_url
+        self.users = users
+        self.recorder = recorder
+        self.admin = HttpClient(base_url)
+        self.item_ids = []
+        self._credentials = {}
+
+    def client(self, i):
+        client = HttpClient(self.base_url, self.recorder)
+        self._credentials[id(client)] = bench_user(i)
+        return client
+
+    def me(self, client):
+        return self._credentials[id(client)]
+
+# --- Підготовка ---
+
+def prepare_database(env, users, workdir, workers=None):
+    subprocess.run([sys.executable, '-m', 'flask', 'init-db'], env=env, cwd=REPO, check=True)
+    path = os.path.join(workdir, 'bench_users.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['username', 'password', 'surname', 'name', 'passport', 'room', 'balance'])
+        for i in range(1, users + 1):
+            username, password = bench_user(i)
+            writer.writerow([username, password, 'Бенч', f'Гравець{i}', f'BN{i:07d}', str(1000 + i), 1_000_000])
+    command = [sys.executable, '-m', 'flask', 'import-users', path]
+    if workers: command += ['--workers', str(workers)]
+    subprocess.run(command, env=env, cwd=REPO, check=True)
+
+def start_server(env, port, timeout=120):
+    server = subprocess.Popen([sys.executable, os.path.join('benchmarks', 'server.py'), '--port', str(port)],
+                              env=env, cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Сервер бенчмарка завершився з кодом {server.returncode}')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/catalog', timeout=2)
+            return server
+        except urllib.error.HTTPError:
+            return server  # Сервер відповідає (напр. 401) — готовий
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError('Сервер бенчмарка не запустився вчасно')
+
+def setup_catalog(ctx, stock=None):
+    """Логін адміна і, якщо задано stock, виставлення залишків товарів (щоб покупки не впиралися в нуль)."""
+    if ctx.admin.login('admin', 'admin123') != 200:
+        raise RuntimeError('Не вдалося увійти як admin')
+    _, items = ctx.admin.request('GET', '/api/admin/shop')
+    ctx.item_ids = [item['id'] for item in items or [] if not item.get('isLottery')]
+    if stock is not None:
+        for item_id in ctx.item_ids:
+            ctx.admin.request('PUT', f'/api/admin/shop/{item_id}', {'quantity': stock})
+
+# --- Навантаження ---
+
+def run_mix(ctx, mix, concurrency, duration, seed=0):
+    weights = MIXES[mix]
+    names, cumulative = list(weights), []
+    total = 0
+    for name in names:
+        total += weights[name]; cumulative.append(total)
+    deadline = time.time() + duration
+    def virtual_user(n):
+        rng = random.Random(seed * 100003 + n)
+        client = ctx.client(n % ctx.users + 1)
+        client.login(*ctx.me(client))
+        while time.time() < deadline:
+            pick = rng.uniform(0, total)
+            name = next(name for name, bound in zip(names, cumulative) if pick <= bound)
+            OPERATIONS[name](ctx, client, rng)
+    threads = [threading.Thread(target=virtual_user, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+def run_replay(ctx, path, concurrency, speed):
+    """Відтворює записаний трафік з тими самими інтервалами (поділеними на speed; 0 — без пауз)."""
+    with open(path, encoding='utf-8') as f:
+        entries = sorted((json.loads(line) for line in f if line.strip()), key=lambda e: e['t'])
+    if not entries:
+        return
+    # Користувачі із запису відображаються на гравців бенчмарка в порядку появи
+    mapping, clients = {}, {}
+    admin = HttpClient(ctx.base_url, ctx.recorder)
+    admin.token = ctx.admin.token
+    def client_for(username):
+        if username is None:
+            return None
+        if username == 'admin':
+            return admin
+        if username not in mapping:
+            mapping[username] = len(mapping) % ctx.users + 1
+            clients[username] = ctx.client(mapping[username])
+            clients[username].login(*ctx.me(clients[username]))
+        return clients[username]
+    for entry in entries: client_for(entry.get('user'))
+    queue = Queue()
+    started, t0 = time.time(), entries[0]['t']
+    def worker():
+        while True:
+            try:
+                entry = queue.get(timeout=1)
+            except Empty:
+                return
+            if entry is None:
+                return
+            if speed:
+                delay = started + (entry['t'] - t0) / speed - time.time()
+                if delay > 0: time.sleep(delay)
+            client = client_for(entry.get('user'))
+            if entry['path'] == '/api/login':
+                if client is None or client is admin: admin.login('admin', 'admin123')
+                else: client.login(*ctx.me(client))
+                continue
+            path = entry['path'] + (f"?{entry['query']}" if entry.get('query') else '')
+            requester = client or HttpClient(ctx.base_url, ctx.recorder)
+            requester.request(entry['method'], path, entry.get('body'), op=f"replay {entry['method']} {entry['path']}")
+    for entry in entries: queue.put(entry)
+    for _ in range(concurrency): queue.put(None)
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+def start_listeners(ctx, count):
+    listeners, error = [], None
+    for i in range(1, count + 1):
+        client = HttpClient(ctx.base_url)
+        if client.login(*bench_user((i - 1) % ctx.users + 1)) != 200:
+            continue
+        try:
+            listeners.append(SocketListener(ctx.base_url, client.token))
+        except Exception as exc:  # Напр. не встановлено python-socketio[client]
+            error = f'{type(exc).__name__}: {exc}'
+            break
+    return listeners, error
+
+def socket_report(listeners, error):
+    report = {'clients': len(listeners), 'events': {}, 'bytes': {}}
+    for listener in listeners:
+        for event, n in listener.events.items(): report['events'][event] = report['events'].get(event, 0) + n
+        for event, n in listener.bytes.items(): report['bytes'][event] = report['bytes'].get(event, 0) + n
+        listener.close()
+    report['totalEvents'] = sum(report['events'].values())
+    report['totalBytes'] = sum(report['bytes'].values())
+    if error: report['error'] = error
+    return report
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(argv=None, scenario=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help="За замовчуванням — тимчасовий файл SQLite")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', choices=sorted(MIXES), default='event')
+    parser.add_argument('--replay', help="JSONL, записаний через TRAFFIC_CAPTURE_PATH")
+    parser.add_argument('--speed', type=float, default=1.0, help="Прискорення відтворення; 0 — без пауз")
+    parser.add_argument('--socket-clients', type=int, default=0)
+    parser.add_argument('--stock', type=int, default=1_000_000, help="Залишок кожного товару перед запуском")
+    parser.add_argument('--hash-method', default='pbkdf2:sha256', help="Напр. pbkdf2:sha256:1000 для швидкого наповнення")
+    parser.add_argument('--import-workers', type=int)
+    parser.add_argument('--no-scheduler', action='store_true', help="Без фонових задач (тік цін, строки)")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="Додаткові змінні оточення сервера")
+    parser.add_argument('--label', default='')
+    parser.add_argument('--out', help="Шлях JSON-звіту (за замовчуванням benchmarks/results/<час>.json)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='ceobank-bench-')
+    env = dict(os.environ, FLASK_APP='app.py', PASSWORD_HASH_METHOD=args.hash_method, SCHEDULER_ENABLED='0' if args.no_scheduler else '1',
+               DATABASE_URL=args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db'))
+    env.update(item.split('=', 1) for item in args.env)
+    prepare_database(env, args.users, workdir, args.import_workers)
+    server = start_server(env, args.port)
+    recorder = Recorder()
+    ctx = Context(f'http://127.0.0.1:{args.port}', args.users, recorder)
+    try:
+        setup_catalog(ctx, args.stock)
+        listeners, socket_error = start_listeners(ctx, args.socket_clients)
+        recorder = ctx.recorder = Recorder()
+        if scenario is not None:
+            extra = scenario(ctx, args)
+        elif args.replay:
+            extra = run_replay(ctx, args.replay, args.concurrency, args.speed)
+        else:
+            extra = run_mix(ctx, args.mix, args.concurrency, args.duration)
+        recorder.stop()
+        time.sleep(1)  # Даємо дійти відкладеним socket-повідомленням
+        report = {
+            'label': args.label, 'revision': git_revision(), 'startedAt': datetime.now(timezone.utc).isoformat(),
+            'config': {key: value for key, value in vars(args).items() if key != 'database_url'},
+            'database': (args.database_url or 'sqlite').split(':', 1)[0],
+            'http': recorder.summary(),
+            'sockets': socket_report(listeners, socket_error),
+            'server': {'perf': ctx.admin.request('GET', '/api/admin/perf')[1],
+                       'broadcast': ctx.admin.request('GET', '/api/admin/broadcast-stats')[1]},
+        }
+        if extra: report['scenario'] = extra
+    finally:
+        server.terminate(); server.wait(timeout=10)
+    out = args.out or os.path.join(REPO, 'benchmarks', 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    http = report['http']
+    print(f"{http['requests']} запитів за {http['seconds']} с ({http['throughput']}/с), p50 {http['latencyMs'].get('p50')} мс, "
+          f"p99 {http['latencyMs'].get('p99')} мс; socket-подій: {report['sockets']['totalEvents']}. Звіт: {out}")
+    return report
+
+if __name__ == '__main__':
+    main()
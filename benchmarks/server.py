@@ -0,0 +1,27 @@
+"""Сервер для бенчмарків: той самий застосунок під eventlet, але на окремій БД і порту.
+
+Запускається з benchmarks/run.py; БД на цей момент уже наповнена (flask init-db + flask import-users).
+Налаштування передаються через змінні оточення (DATABASE_URL, PASSWORD_HASH_METHOD, SCHEDULER_ENABLED, ...).
+
+    python benchmarks/server.py --port 5055
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+    from app import app, socketio, start_scheduler
+    start_scheduler()
+    socketio.run(app, host=args.host, port=args.port, log_output=False, use_reloader=False)
+
+if __name__ == '__main__':
+    main()
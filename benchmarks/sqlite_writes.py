@@ -0,0 +1,40 @@
+"""Бенчмарк запису на SQLite до і після продакшн-режиму (SQLITE_PRODUCTION).
+
+Та сама суміш запитів (за замовчуванням write_heavy: перекази й покупки, плюс фонові задачі)
+запускається двічі на свіжій файловій БД: зі стандартними налаштуваннями SQLite і з WAL, прагмами
+та чергою записувача. Виводяться пропускна здатність, латентність по операціях, кількість 5xx
+(у стандартному режимі це зазвичай "database is locked") і статистика пакетів записувача.
+Решта параметрів — як у benchmarks/run.py.
+
+    python benchmarks/sqlite_writes.py --users 300 --concurrency 50 --duration 30
+"""
+import sys
+import argparse
+
+import run
+
+MODES = (('default', '0'), ('production', '1'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--mix', default='write_heavy')
+    own, rest = parser.parse_known_args(argv)
+    if any(arg.startswith('--database-url') for arg in rest):
+        parser.error("бенчмарк порівнює режими SQLite на тимчасовій БД — --database-url не потрібен")
+    reports = {label: run.main(rest + ['--mix', own.mix, '--label', f'sqlite-{label}', '--env', f'SQLITE_PRODUCTION={flag}'])
+               for label, flag in MODES}
+    for label, report in reports.items():
+        http, writer = report['http'], report['server']['perf'].get('sqliteWriter', {})
+        errors = sum(stats['errors'] for stats in http['operations'].values())
+        print(f"\n[{label}] {http['throughput']} запитів/с, p50 {http['latencyMs'].get('p50')} мс, "
+              f"p99 {http['latencyMs'].get('p99')} мс, помилок {errors}")
+        for op, stats in http['operations'].items():
+            latency = stats['latencyMs']
+            print(f"  {op:<16} {stats['throughput']}/с, p50 {latency.get('p50')} мс, p99 {latency.get('p99')} мс, помилок {stats['errors']}")
+        if writer.get('enabled'):
+            print(f"  записувач: пакетів {writer.get('batches')}, робіт {writer.get('jobs')}, у середньому {writer.get('avgBatch')}, "
+                  f"макс. {writer.get('maxBatch')}, очікування замка {writer.get('lockWaitMs')} мс")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import threading
+from collections import Counter
+
+# Шар розсилки Socket.IO: повідомлення накопичуються протягом короткого вікна,
+# повторні оновлення тієї самої сутності зливаються, і клієнтам іде лише різниця.
+
+class Broadcaster:
+    """Об'єднує часті socket-повідомлення в пачки (див. BROADCAST_WINDOW у config.py)."""
+
+    def __init__(self, socketio=None, window=0.25):
+        self.socketio = socketio
+        self.window = window
+        self._lock = threading.Lock()
+        self._entities = {}  # (event, room, collection) -> {key: dict}
+        self._signals = {}   # (event, room) -> [payload, ...] без дублікатів
+        self._scheduled = False  # Чи вже заплановано відкладений flush
+        self.stats = {'published': Counter(), 'emitted': Counter(), 'coalesced': Counter()}
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.window = app.config.get('BROADCAST_WINDOW', self.window)
+
+    def publish(self, event, collection, entities, key='id', room=None):
+        """Ставить у чергу зміни сутностей; на клієнт піде {collection: [змінені сутності]}.
+
+        Поля повторних оновлень однієї сутності (за полем key) в межах вікна зливаються.
+        """
+        with self._lock:
+            pending = self._entities.setdefault((event, room, collection), {})
+            for entity in entities:
+                self.stats['published'][event] += 1
+                if entity[key] in pending:
+                    pending[entity[key]].update(entity)
+                    self.stats['coalesced'][event] += 1
+                else:
+                    pending[entity[key]] = dict(entity)
+        self._schedule()
+
+    def signal(self, event, payload=None, room=None):
+        """Ставить у чергу повідомлення без сутностей; однакові повідомлення у вікні надсилаються один раз."""
+        with self._lock:
+            self.stats['published'][event] += 1
+            pending = self._signals.setdefault((event, room), [])
+            if payload in pending:
+                self.stats['coalesced'][event] += 1
+            else:
+                pending.append(payload)
+        self._schedule()
+
+    def _schedule(self):
+        if not self.window:
+            self.flush()
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.window)
+        with self._lock:
+            self._scheduled = False
+        self.flush()
+
+    def flush(self):
+        """Негайно надсилає все накопичене."""
+        with self._lock:
+            entities, self._entities = self._entities, {}
+            signals, self._signals = self._signals, {}
+        for (event, room, collection), pending in entities.items():
+            self._emit(event, {collection: list(pending.values())}, room)
+        for (event, room), payloads in signals.items():
+            for payload in payloads:
+                self._emit(event, payload, room)
+
+    def _emit(self, event, payload, room):
+        self.stats['emitted'][event] += 1
+        if payload is None:
+            self.socketio.emit(event, room=room)
+        else:
+            self.socketio.emit(event, payload, room=room)
+
+    def get_stats(self):
+        with self._lock:
+            return {name: dict(counter) for name, counter in self.stats.items()}
+
+broadcaster = Broadcaster()
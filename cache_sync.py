@@ -0,0 +1,61 @@
+import logging
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import db, CacheVersion
+
+# Міжпроцесна інвалідація кешів у пам'яті (налаштування, каталог).
+# Кожна зміна піднімає лічильник у таблиці cache_version; інші воркери
+# періодично звіряють лічильники і скидають свої локальні копії.
+
+class CacheSync:
+    """Лічильники версій кешів, спільні для всіх воркерів (див. CACHE_SYNC_INTERVAL у config.py)."""
+
+    def __init__(self):
+        self.enabled = False
+        self._seen = None
+        self._handlers = []  # (префікс імені, обробник(name))
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CACHE_SYNC_INTERVAL', 0) > 0
+
+    def on(self, prefix, handler):
+        """Реєструє обробник, що викликається, коли інший воркер змінив кеш з іменем на цей префікс."""
+        self._handlers.append((prefix, handler))
+
+    def bump(self, *names):
+        """Повідомляє інші воркери про зміну кешів names. В режимі одного процесу нічого не робить."""
+        if not self.enabled or not names:
+            return
+        for name in names:
+            result = db.session.execute(update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1))
+            if result.rowcount == 0:
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(CacheVersion(name=name, version=1))
+                except IntegrityError:
+                    db.session.execute(update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1))
+        versions = dict(db.session.query(CacheVersion.name, CacheVersion.version).filter(CacheVersion.name.in_(names)).all())
+        db.session.commit()
+        # Власні зміни вже застосовано локально — наступний poll не повинен обробляти їх вдруге
+        if self._seen is not None:
+            self._seen.update(versions)
+
+    def poll(self):
+        """Звіряє версії з БД і викликає обробники для змінених кешів. Повертає список змінених імен."""
+        current = dict(db.session.query(CacheVersion.name, CacheVersion.version).all())
+        db.session.commit()
+        if self._seen is None:
+            # Перший виклик лише запам'ятовує стан
+            self._seen = current
+            return []
+        changed = [name for name, version in current.items() if self._seen.get(name) != version]
+        self._seen = current
+        for name in changed:
+            for prefix, handler in self._handlers:
+                if name.startswith(prefix):
+                    handler(name)
+        if changed:
+            logging.info(f"Оновлено кеші після змін в інших воркерах: {', '.join(changed)}")
+        return changed
+
+cache_sync = CacheSync()
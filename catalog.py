@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+from auction import auction_engine
+from cache_sync import cache_sync
+from market import price_tape
+from models import (
+    Asset, InsuranceOption, ScheduleItem, ShopItem, Task, Team, User
+)
+from sqlalchemy.orm import selectinload
+from settings import settings_cache
+
+# Спільна для всіх користувачів частина /api/initial-data.
+# Кожна секція будується ліниво і живе в пам'яті, доки її не інвалідує один із шляхів запису.
+
+class CatalogCache:
+    """Версіонований кеш каталогу (магазин, завдання, біржа, налаштування тощо)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._builders = {}
+        self._sections = {}
+        self._bundle = None  # (version, payload, body, etag)
+        self.version = 1
+        self.stats = {'hits': 0, 'builds': 0, 'invalidations': 0, 'patches': 0}
+
+    def section(self, name):
+        """Декоратор для реєстрації функції, що будує секцію каталогу."""
+        def decorator(fn):
+            self._builders[name] = fn
+            return fn
+        return decorator
+
+    def invalidate(self, *sections, propagate=True):
+        """Скидає вказані секції (або всі) і піднімає версію каталогу.
+
+        propagate=False — зміну вже зроблено іншим воркером, повторно сповіщати не треба.
+        """
+        with self._lock:
+            for name in sections or list(self._sections):
+                self._sections.pop(name, None)
+            self.version += 1
+            self._bundle = None
+            self.stats['invalidations'] += 1
+        if propagate:
+            cache_sync.bump(*(f'catalog:{name}' for name in sections or self._builders))
+
+    def patch(self, name, entries, key='id', propagate=True):
+        """Оновлює поля окремих записів секції-списку на місці, без перебудови з БД.
+
+        Якщо секції ще немає в кеші або запис не знайдено, секція просто скидається.
+        """
+        with self._lock:
+            section = self._sections.get(name)
+            if section is not None:
+                index = {entry[key]: i for i, entry in enumerate(section)}
+                if all(entry[key] in index for entry in entries):
+                    section = list(section)
+                    for entry in entries:
+                        section[index[entry[key]]] = dict(section[index[entry[key]]], **entry)
+                    self._sections[name] = section
+                else:
+                    del self._sections[name]
+            self.version += 1
+            self._bundle = None
+            self.stats['patches'] += 1
+        if propagate:
+            cache_sync.bump(f'catalog:{name}')
+
+    def get(self):
+        """Повертає (payload, body, etag, version); будує лише відсутні секції."""
+        with self._lock:
+            if self._bundle is not None:
+                self.stats['hits'] += 1
+                return self._bundle[1:] + (self._bundle[0],)
+            version = self.version
+            missing = [name for name in self._builders if name not in self._sections]
+        # Запити до БД виконуємо поза блокуванням, щоб не тримати інші потоки
+        built = {name: self._builders[name]() for name in missing}
+        with self._lock:
+            if self.version != version:
+                # Поки ми будували, хтось змінив дані — віддаємо свіжозібране, але не кешуємо
+                sections = dict(self._sections, **built)
+                payload = {name: sections[name] for name in self._builders}
+                body = json.dumps(payload, sort_keys=True)
+                return payload, body, _etag(body), self.version
+            self._sections.update(built)
+            self.stats['builds'] += len(built)
+            payload = {name: self._sections[name] for name in self._builders}
+            body = json.dumps(payload, sort_keys=True)
+            self._bundle = (version, payload, body, _etag(body))
+            return payload, body, self._bundle[3], version
+
+def _etag(body):
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+catalog = CatalogCache()
+
+@catalog.section('shopItems')
+def _build_shop_items():
+    return [item.to_dict() for item in ShopItem.query.order_by(ShopItem.name).all()]
+
+@catalog.section('tasks')
+def _build_tasks():
+    return [task.to_dict() for task in Task.query.all()]
+
+@catalog.section('auction')
+def _build_auction():
+    # Живий стан лотів — з пам'яті auction.py; секція скидається після кожної прийнятої ставки
+    auction_engine.ensure_loaded()
+    general = auction_engine.snapshot('general_auction') or {}
+    special = auction_engine.snapshot('special_lot')
+    return {'isActive': general.get('isActive', False), 'endTime': general.get('endTime'), 'bids': general.get('topBids', []),
+            'highestBid': general.get('highestBid'), 'specialLot': special if special and special['round'] else None}
+
+@catalog.section('exchange')
+def _build_exchange():
+    assets = Asset.query.all()
+    return {'companies': [a.to_dict(history=price_tape.recent(a.id)) for a in assets if a.type == 'stock'],
+            'crypto': [a.to_dict(history=price_tape.recent(a.id)) for a in assets if a.type == 'crypto']}
+
+@catalog.section('settings')
+def _build_settings():
+    return settings_cache.all()
+
+@catalog.section('ceoNews')
+def _build_ceo_news():
+    return settings_cache.get('ceoNews', [])
+
+@catalog.section('schedule')
+def _build_schedule():
+    return [{'id': item.id, 'time': item.time_str, 'activity': item.activity} for item in ScheduleItem.query.order_by(ScheduleItem.time_str).all()]
+
+@catalog.section('insurance')
+def _build_insurance():
+    return {'options': [{'id': opt.id, 'duration': opt.duration, 'cost': opt.cost} for opt in InsuranceOption.query.all()]}
+
+@catalog.section('teams')
+def _build_teams():
+    # Учасники всіх команд — одним додатковим запитом, а не запитом на кожну команду
+    return [{'name': t.name, 'members': [m.username for m in t.members]}
+            for t in Team.query.options(selectinload(Team.members).load_only(User.username)).all()]
+
+cache_sync.on('catalog:', lambda name: catalog.invalidate(name.split(':', 1)[1], propagate=False))
@@ -0,0 +1,216 @@
+import threading
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import and_, case, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, ChatMessage, ChatThread, User, paginate_by_date
+import ledger
+
+# Чат підтримки: розмова кожного гравця з адміністраторами через кімнати Socket.IO
+# (гравець — своя кімната user_<id>, адміністратори — спільна SUPPORT_ROOM).
+# Історія віддається keyset-сторінками за (timestamp, id) по індексу розмови.
+# Лічильники непрочитаного зберігаються в ChatThread і змінюються в тій самій транзакції,
+# що й повідомлення, тож вхідні адміністратора не перераховуються COUNT-ом.
+# Позначки «прочитано» накопичуються протягом CHAT_READ_WINDOW і записуються пакетом:
+# один UPDATE повідомлень і один UPDATE лічильників на кожну сторону розмови.
+
+SUPPORT_ROOM = 'support'
+
+class ChatError(Exception):
+    """Повідомлення не прийнято; текст показується користувачу."""
+
+class ChatService:
+    def __init__(self, read_window=0.5, max_length=2000):
+        self.app = None
+        self.socketio = None
+        self.read_window = read_window
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._pending = {}  # (user_id, прочитала підтримка?) -> найбільший прочитаний id
+        self._scheduled = False
+        self._support_ids = None
+        self.stats = Counter()
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.read_window = app.config.get('CHAT_READ_WINDOW', self.read_window)
+        self.max_length = app.config.get('CHAT_MAX_LENGTH', self.max_length)
+
+    def support_ids(self):
+        """id адміністраторів; список змінюється лише через init-db, тож читається один раз."""
+        if self._support_ids is None:
+            self._support_ids = tuple(db.session.execute(select(User.id).where(User.is_admin == True).order_by(User.id)).scalars())
+        return self._support_ids
+
+    # --- Історія ---
+
+    def conversation(self, user_id):
+        admins = self.support_ids()
+        return ChatMessage.query.filter(or_(
+            and_(ChatMessage.from_user_id == user_id, ChatMessage.to_user_id.in_(admins)),
+            and_(ChatMessage.from_user_id.in_(admins), ChatMessage.to_user_id == user_id)))
+
+    def history(self, user_id, cursor=None, limit=50):
+        """Сторінка розмови від новіших до старіших. ValueError — некоректний курсор."""
+        messages, next_cursor = paginate_by_date(self.conversation(user_id), ChatMessage, cursor, limit, date_attr='timestamp')
+        return [message.to_dict() for message in messages], next_cursor
+
+    def thread(self, user_id):
+        thread = db.session.get(ChatThread, user_id)
+        return _thread_dict(user_id, thread.unread_by_admin, thread.unread_by_user, thread.last_message_at) if thread else _thread_dict(user_id, 0, 0, None)
+
+    def inbox(self, limit=200):
+        """Розмови для адміністратора: спершу ті, де останнє повідомлення новіше."""
+        rows = db.session.execute(select(ChatThread.user_id, User.username, ChatThread.unread_by_admin, ChatThread.last_message_at)
+                                  .join(User, ChatThread.user_id == User.id)
+                                  .order_by(ChatThread.last_message_at.desc()).limit(limit)).all()
+        return [{'userId': user_id, 'username': username, 'unread': unread, 'lastMessageAt': at.isoformat() if at else None}
+                for user_id, username, unread, at in rows]
+
+    # --- Повідомлення ---
+
+    def send(self, sender_id, user_id, text, from_support):
+        """Зберігає повідомлення в розмові гравця user_id і розсилає його обом сторонам."""
+        text = (text or '').strip()
+        if not text:
+            raise ChatError("Повідомлення не може бути порожнім")
+        if len(text) > self.max_length:
+            raise ChatError(f"Повідомлення довше за {self.max_length} символів")
+        if not self.support_ids():
+            raise ChatError("Підтримка недоступна")
+        # Повідомлення гравця адресується першому адміністратору; бачать його всі адміністратори
+        message = ChatMessage(from_user_id=sender_id, to_user_id=user_id if from_support else self.support_ids()[0],
+                              text=text, timestamp=datetime.utcnow())
+        db.session.add(message)
+        db.session.flush()
+        unread_by_admin, unread_by_user = self._bump_thread(user_id, message, 'unread_by_user' if from_support else 'unread_by_admin')
+        db.session.commit()
+        payload = dict(message.to_dict(), userId=user_id)
+        self.socketio.emit('chat_message', payload, room=f'user_{user_id}')
+        self.socketio.emit('chat_message', payload, room=SUPPORT_ROOM)
+        self.socketio.emit('chat_inbox_update', _thread_dict(user_id, unread_by_admin, unread_by_user, message.timestamp), room=SUPPORT_ROOM)
+        self.stats['sent'] += 1
+        return payload
+
+    def _bump_thread(self, user_id, message, column):
+        row = db.session.execute(
+            update(ChatThread).where(ChatThread.user_id == user_id)
+            .values({column: getattr(ChatThread, column) + 1, 'last_message_id': message.id, 'last_message_at': message.timestamp})
+            .returning(ChatThread.unread_by_admin, ChatThread.unread_by_user)
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        if row is not None:
+            return tuple(row)
+        values = {'user_id': user_id, 'unread_by_admin': 0, 'unread_by_user': 0, 'last_message_id': message.id, 'last_message_at': message.timestamp}
+        values[column] = 1
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(ChatThread).values(**values))
+        except IntegrityError:
+            return self._bump_thread(user_id, message, column)
+        return values['unread_by_admin'], values['unread_by_user']
+
+    # --- Позначки «прочитано» ---
+
+    def mark_read(self, user_id, by_support, up_to):
+        """Позначає прочитаними повідомлення розмови user_id до up_to включно (для гравця або для підтримки)."""
+        key = (user_id, bool(by_support))
+        with self._lock:
+            if up_to > self._pending.get(key, 0):
+                self._pending[key] = up_to
+            self.stats['receipts'] += 1
+        self._schedule()
+
+    def _schedule(self):
+        if not self.read_window:
+            self.flush()
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.read_window)
+        with self._lock:
+            self._scheduled = False
+        self.flush()
+
+    def flush(self):
+        """Записує накопичені позначки однією транзакцією і повідомляє другу сторону."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with self.app.app_context():
+            by_user = {user_id: up_to for (user_id, by_support), up_to in pending.items() if not by_support}
+            by_support = {user_id: up_to for (user_id, by_support), up_to in pending.items() if by_support}
+            marked = ledger.atomic(lambda: (self._apply_receipts(by_user, False), self._apply_receipts(by_support, True)))
+        self.stats['receiptBatches'] += 1
+        for user_id, (count, unread_by_admin, unread_by_user) in marked[0].items():
+            self.socketio.emit('chat_read', {'userId': user_id, 'upTo': by_user[user_id], 'reader': 'user'}, room=SUPPORT_ROOM)
+        for user_id, (count, unread_by_admin, unread_by_user) in marked[1].items():
+            self.socketio.emit('chat_read', {'userId': user_id, 'upTo': by_support[user_id], 'reader': 'support'}, room=f'user_{user_id}')
+            self.socketio.emit('chat_inbox_update', {'userId': user_id, 'unread': unread_by_admin}, room=SUPPORT_ROOM)
+
+    def _apply_receipts(self, up_to, by_support):
+        # Межа прочитаного для кожної розмови — через CASE, тож усі розмови пакета йдуть одним UPDATE
+        if not up_to:
+            return {}
+        admins = list(self.support_ids())
+        if by_support:
+            player, column = ChatMessage.from_user_id, 'unread_by_admin'
+            condition = (ChatMessage.from_user_id.in_(list(up_to)), ChatMessage.to_user_id.in_(admins))
+        else:
+            player, column = ChatMessage.to_user_id, 'unread_by_user'
+            condition = (ChatMessage.to_user_id.in_(list(up_to)), ChatMessage.from_user_id.in_(admins))
+        condition += (ChatMessage.read == False, ChatMessage.id <= case(up_to, value=player))
+        counts = dict(db.session.execute(select(player, func.count(ChatMessage.id)).where(*condition).group_by(player)).all())
+        if not counts:
+            return {}
+        db.session.execute(update(ChatMessage).where(*condition).values(read=True).execution_options(synchronize_session=False))
+        unread = getattr(ChatThread, column) - case(counts, value=ChatThread.user_id, else_=0)
+        rows = db.session.execute(
+            update(ChatThread).where(ChatThread.user_id.in_(list(counts))).values({column: case((unread < 0, 0), else_=unread)})
+            .returning(ChatThread.user_id, ChatThread.unread_by_admin, ChatThread.unread_by_user)
+            .execution_options(synchronize_session=False)).all()
+        return {user_id: (counts[user_id], unread_by_admin, unread_by_user) for user_id, unread_by_admin, unread_by_user in rows}
+
+    # --- Обслуговування ---
+
+    def reconcile(self):
+        """Перераховує ChatThread з повідомлень (для наявних БД або після ручних правок)."""
+        admins = list(self.support_ids())
+        if not admins:
+            return 0
+        threads = {}
+        def entry(user_id):
+            return threads.setdefault(user_id, {'user_id': user_id, 'unread_by_admin': 0, 'unread_by_user': 0, 'last_message_id': None, 'last_message_at': None})
+        for user_id, unread, last_id, last_at in db.session.execute(
+                select(ChatMessage.from_user_id, func.sum(case((ChatMessage.read == False, 1), else_=0)), func.max(ChatMessage.id), func.max(ChatMessage.timestamp))
+                .where(ChatMessage.to_user_id.in_(admins), ChatMessage.from_user_id.notin_(admins)).group_by(ChatMessage.from_user_id)):
+            entry(user_id).update(unread_by_admin=unread or 0, last_message_id=last_id, last_message_at=last_at)
+        for user_id, unread, last_id, last_at in db.session.execute(
+                select(ChatMessage.to_user_id, func.sum(case((ChatMessage.read == False, 1), else_=0)), func.max(ChatMessage.id), func.max(ChatMessage.timestamp))
+                .where(ChatMessage.from_user_id.in_(admins), ChatMessage.to_user_id.notin_(admins)).group_by(ChatMessage.to_user_id)):
+            thread = entry(user_id)
+            thread['unread_by_user'] = unread or 0
+            if thread['last_message_id'] is None or last_id > thread['last_message_id']:
+                thread.update(last_message_id=last_id, last_message_at=last_at)
+        db.session.execute(ChatThread.__table__.delete())
+        if threads:
+            db.session.execute(insert(ChatThread), list(threads.values()))
+        db.session.commit()
+        return len(threads)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pendingReceipts=len(self._pending))
+
+def _thread_dict(user_id, unread_by_admin, unread_by_user, last_message_at):
+    return {'userId': user_id, 'unread': unread_by_admin, 'unreadByUser': unread_by_user,
+            'lastMessageAt': last_message_at.isoformat() if last_message_at else None}
+
+chat_service = ChatService()
@@ -19,6 +19,33 @@ class Config:
     # Вимикаємо відстеження модифікацій SQLAlchemy, щоб зменшити навантаження
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Пул з'єднань для Postgres (db_pool.py): скільки з'єднань воркер тримає постійно, скільки може відкрити
+    # понад них, скільки секунд запит чекає вільного з'єднання, через скільки секунд з'єднання перевідкривається
+    # і чи перевіряти його перед видачею (pre-ping). Greenlet тримає з'єднання лише на час запиту чи задачі,
+    # тож пул розраховують на одночасні запити, а не на кількість підключених сокетів.
+    # Розміри пулу діють і для SQLite у режимі SQLITE_PRODUCTION
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 30))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    # Під eventlet psycopg2 працює в «зеленому» режимі: поки Postgres відповідає, хаб обслуговує інші запити.
+    # 0 — вимкнути (кожен запит до БД блокує весь воркер; лише для порівняння в бенчмарку)
+    DB_GREEN = os.environ.get('DB_GREEN', '1') == '1'
+    
+    # Продакшн-режим SQLite (sqlite_writer.py): WAL, busy_timeout (мс), synchronous, mmap (байти) і кеш сторінок
+    # (від'ємне значення — КіБ) на кожному з'єднанні; транзакції запису процесу йдуть через єдиний записувач,
+    # а роботи ledger.atomic комітяться пакетами до SQLITE_WRITE_BATCH штук. Вмикається для файлової БД SQLite.
+    # synchronous=NORMAL у WAL не втрачає даних при падінні процесу, але останні коміти можуть зникнути при втраті живлення
+    SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', '0') == '1'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024))
+    SQLITE_WRITE_BATCH = int(os.environ.get('SQLITE_WRITE_BATCH', 64))
+    # Скільки секунд транзакція чекає своєї черги на запис, перш ніж піти в обхід черги (на busy_timeout SQLite)
+    SQLITE_WRITE_LOCK_TIMEOUT = float(os.environ.get('SQLITE_WRITE_LOCK_TIMEOUT', 30))
+    
     # Конфігурація для JSON Web Tokens (JWT)
     # Секретний ключ для підпису токенів
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'another-super-secret-jwt-key'
@@ -30,4 +57,85 @@ class Config:
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     
     # Дозволені розширення файлів
-    ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
\ No newline at end of file
+    ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
+    
+    # Завантаження до завдань (uploads.py): найбільший розмір файлу (байти), шматок, яким тіло запиту
+    # пишеться на диск, кількість фонових обробників (перевірка вмісту, мініатюри) і через скільки секунд
+    # незавершене завантаження видаляється
+    UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 20 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 64 * 1024))
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+    UPLOAD_PARTIAL_TTL = int(os.environ.get('UPLOAD_PARTIAL_TTL', 24 * 3600))
+    
+    # Історія цін біржі: скільки останніх тиків тримати в пам'яті на актив
+    PRICE_RECENT_TICKS = 120
+    
+    # Скільки зберігати сирі тики AssetHistory та OHLC-свічки кожної роздільності
+    PRICE_RAW_RETENTION = timedelta(hours=6)
+    PRICE_CANDLE_RETENTION = {'1m': timedelta(days=2), '15m': timedelta(days=30), '1h': None}
+    
+    # Вікно (у секундах), протягом якого socket-розсилки об'єднуються в одне повідомлення; 0 — без затримки
+    BROADCAST_WINDOW = float(os.environ.get('BROADCAST_WINDOW', 0.25))
+    
+    # Режим кількох воркерів: спільна черга повідомлень Socket.IO, щоб emit доходив до клієнтів
+    # на всіх процесах. Напр. 'redis://localhost:6379/0' (пакет redis) або 'sqla+postgresql://...'
+    # (пакет kombu, черга в БД замість Redis). Без значення — звичайний режим одного процесу.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    
+    # Фонові задачі (тік цін, депозити) запускаються в кожному воркері,
+    # але виконує їх лише лідер, що тримає оренду в таблиці scheduler_lease.
+    # 0 — процес ніколи не претендує на лідерство
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+    SCHEDULER_LEASE_TTL = int(os.environ.get('SCHEDULER_LEASE_TTL', 30))
+    
+    # Як часто (в секундах) воркер звіряє версії кешів налаштувань і каталогу з іншими процесами.
+    # 0 — один процес, синхронізація вимкнена. Для кількох воркерів варто ставити 1-5 секунд
+    CACHE_SYNC_INTERVAL = float(os.environ.get('CACHE_SYNC_INTERVAL', 0))
+    
+    # Строки депозитів, страховок і кредитів: у пам'яті тримаються ті, що настануть протягом
+    # EXPIRY_HORIZON секунд; список перечитується з БД кожні EXPIRY_REFRESH_INTERVAL секунд
+    # (так лідер бачить строки, створені іншими воркерами)
+    EXPIRY_HORIZON = int(os.environ.get('EXPIRY_HORIZON', 600))
+    EXPIRY_REFRESH_INTERVAL = int(os.environ.get('EXPIRY_REFRESH_INTERVAL', 15))
+    
+    # Рейтинг статків (leaderboard.py): скільки гравців у топі, як часто (с) дочитувати змінених
+    # гравців і як часто повністю перезавантажувати рейтинг (зміни з інших воркерів)
+    LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 10))
+    LEADERBOARD_REFRESH_INTERVAL = int(os.environ.get('LEADERBOARD_REFRESH_INTERVAL', 2))
+    LEADERBOARD_REBUILD_INTERVAL = int(os.environ.get('LEADERBOARD_REBUILD_INTERVAL', 300))
+    
+    # Хешування паролів іде в пулі потоків поза хабом eventlet; скільки хешувань виконується одночасно
+    # (решта чекає в черзі). Розумно ставити не більше кількості ядер CPU
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', os.cpu_count() or 2))
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+    
+    # Вимірювання продуктивності (perf.py): час, SQL, розмір відповіді та emit-и по ендпоінтах і задачах.
+    # PERF_WINDOW — скільки останніх вимірів тримати для p50/p95/p99.
+    # PERF_SLOW_QUERY_MS — поріг (мс), після якого запит з планом EXPLAIN пишеться в лог; 0 — вимкнено.
+    # PERF_METRICS_TOKEN — токен для /metrics (Prometheus, заголовок "Authorization: Bearer ..."); без нього /metrics вимкнено
+    PERF_ENABLED = os.environ.get('PERF_ENABLED', '1') == '1'
+    PERF_WINDOW = int(os.environ.get('PERF_WINDOW', 1000))
+    PERF_SLOW_QUERY_MS = float(os.environ.get('PERF_SLOW_QUERY_MS', 0))
+    PERF_METRICS_TOKEN = os.environ.get('PERF_METRICS_TOKEN')
+    # Файл JSONL, куди записуються всі /api/-запити (без паролів) для відтворення бенчмарком; без значення — вимкнено
+    TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH')
+    
+    # Аукціони (auction.py): скільки найвищих ставок надсилати клієнтам, мінімальний інтервал (с) між ставками
+    # одного гравця, мінімальний крок ставки (грн) і антиснайпінг — ставка за AUCTION_SNIPE_WINDOW секунд
+    # до кінця відсуває завершення на AUCTION_EXTENSION секунд від моменту ставки
+    AUCTION_TOP_BIDS = int(os.environ.get('AUCTION_TOP_BIDS', 10))
+    AUCTION_BID_INTERVAL = float(os.environ.get('AUCTION_BID_INTERVAL', 0.5))
+    AUCTION_MIN_INCREMENT = float(os.environ.get('AUCTION_MIN_INCREMENT', 1))
+    AUCTION_SNIPE_WINDOW = int(os.environ.get('AUCTION_SNIPE_WINDOW', 30))
+    AUCTION_EXTENSION = int(os.environ.get('AUCTION_EXTENSION', 30))
+    
+    # Чат підтримки (chat.py): вікно (с), протягом якого позначки «прочитано» збираються в один пакетний запис
+    # (0 — записувати одразу), і максимальна довжина повідомлення
+    CHAT_READ_WINDOW = float(os.environ.get('CHAT_READ_WINDOW', 0.5))
+    CHAT_MAX_LENGTH = int(os.environ.get('CHAT_MAX_LENGTH', 2000))
+    
+    # Статичні файли фронтенду (static_assets.py): куди складати копії з хешем у назві, стиснуті .gz/.br
+    # і WebP-копії зображень, та ширини (px) цих копій для товарів і фото гравців (WebP потребує Pillow, .br — brotli).
+    # Збираються при старті (вже наявні файли не перераховуються) або заздалегідь `flask build-static`
+    STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR') or os.path.join(basedir, 'static_build')
+    STATIC_IMAGE_WIDTHS = tuple(int(width) for width in os.environ.get('STATIC_IMAGE_WIDTHS', '160,480').split(','))
@@ -0,0 +1,144 @@
+import time
+import logging
+import threading
+from collections import deque
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Пул з'єднань з БД під eventlet.
+# psycopg2 — C-розширення: його сокет eventlet не патчить, і кожен запит до Postgres блокує весь хаб
+# (а з ним усі запити й Socket.IO-клієнти воркера). Зелений wait callback переводить psycopg2 в
+# асинхронний режим: поки Postgres відповідає, greenlet чекає сокет через trampoline, а хаб обслуговує інших.
+# Розміри пулу беруться з Config (DB_POOL_*). Пул рахує, скільки з'єднань видано і скільки greenlet-ів
+# чекають, а також час очікування з'єднання; ці значення потрапляють у /api/admin/perf і /metrics.
+
+try:
+    from eventlet import patcher
+    from eventlet.hubs import trampoline
+except ImportError:  # Без eventlet (CLI, threading-режим) зелений режим не потрібен
+    patcher = None
+
+def _green_wait(conn, timeout=-1):
+    from psycopg2 import extensions, OperationalError
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise OperationalError(f"Неочікуваний результат poll(): {state!r}")
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool, що повідомляє db_pool про кожну видачу з'єднання і час очікування на неї."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        db_pool.pool = self  # recreate() після dispose() створює новий пул — метрики беруться з нього
+
+    def _do_get(self):
+        started = db_pool._begin_wait()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            db_pool._end_wait(started, failed=True)
+            raise
+        db_pool._end_wait(started)
+        return connection
+
+class PoolMonitor:
+    def __init__(self, window=1000):
+        self.pool = None
+        self.green = False
+        self.waiting = 0
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)  # мс очікування останніх видач
+        self.stats = {'checkouts': 0, 'timeouts': 0, 'waitMsTotal': 0.0, 'waitMsMax': 0.0}
+
+    def init_app(self, app):
+        """Викликається до db.init_app: доповнює SQLALCHEMY_ENGINE_OPTIONS налаштуваннями пулу."""
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        if url.get_backend_name() == 'sqlite':
+            if url.database in (None, '', ':memory:'):
+                return  # БД у пам'яті живе в єдиному з'єднанні (StaticPool) — міряти нічого
+            if app.config.get('SQLITE_PRODUCTION'):
+                # У WAL читачі не чекають записувача, тож пул розміру за замовчуванням (5) стає вузьким місцем
+                options.setdefault('pool_size', app.config.get('DB_POOL_SIZE', 20))
+                options.setdefault('max_overflow', app.config.get('DB_MAX_OVERFLOW', 30))
+                options.setdefault('pool_timeout', app.config.get('DB_POOL_TIMEOUT', 10))
+        else:
+            options.setdefault('pool_size', app.config.get('DB_POOL_SIZE', 20))
+            options.setdefault('max_overflow', app.config.get('DB_MAX_OVERFLOW', 30))
+            options.setdefault('pool_timeout', app.config.get('DB_POOL_TIMEOUT', 10))
+            options.setdefault('pool_recycle', app.config.get('DB_POOL_RECYCLE', 1800))
+            options.setdefault('pool_pre_ping', app.config.get('DB_POOL_PRE_PING', True))
+        options.setdefault('poolclass', MeteredQueuePool)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        if url.get_driver_name() == 'psycopg2' and app.config.get('DB_GREEN', True):
+            self.make_green()
+
+    def make_green(self):
+        # Wait callback глобальний для psycopg2, тож вмикаємо його лише коли хаб eventlet справді працює
+        if patcher is None or not patcher.is_monkey_patched('socket'):
+            return False
+        from psycopg2 import extensions
+        extensions.set_wait_callback(_green_wait)
+        self.green = True
+        logging.info("psycopg2 працює в зеленому режимі eventlet")
+        return True
+
+    # --- Облік видач ---
+
+    def _begin_wait(self):
+        with self._lock:
+            self.waiting += 1
+        return time.perf_counter()
+
+    def _end_wait(self, started, failed=False):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.waiting -= 1
+            if failed:
+                self.stats['timeouts'] += 1
+                return
+            self.stats['checkouts'] += 1
+            self.stats['waitMsTotal'] += elapsed
+            self.stats['waitMsMax'] = max(self.stats['waitMsMax'], elapsed)
+            self._waits.append(elapsed)
+
+    # --- Поточний стан ---
+
+    @property
+    def in_use(self):
+        return self.pool.checkedout() if self.pool else 0
+
+    @property
+    def idle(self):
+        return self.pool.checkedin() if self.pool else 0
+
+    @property
+    def overflow(self):
+        # QueuePool.overflow() від'ємний, поки постійні з'єднання ще не всі відкриті
+        return max(0, self.pool.overflow()) if self.pool else 0
+
+    def wait_percentile(self, q):
+        with self._lock:
+            values = sorted(self._waits)
+        value = _percentile(values, q)
+        return round(value, 2) if value is not None else 0
+
+    def get_stats(self):
+        with self._lock:
+            values = sorted(self._waits)
+            stats = dict(self.stats, waitMsTotal=round(self.stats['waitMsTotal'], 2), waitMsMax=round(self.stats['waitMsMax'], 2), waiting=self.waiting)
+        stats['waitMs'] = {f'p{int(q * 100)}': round(_percentile(values, q), 2) if values else None for q in (0.5, 0.95, 0.99)}
+        stats.update(green=self.green, size=self.pool.size() if self.pool else None, inUse=self.in_use, idle=self.idle, overflow=self.overflow)
+        return stats
+
+db_pool = PoolMonitor()
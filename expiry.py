@@ -0,0 +1,173 @@
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import case, select, update
+from models import db, User, Loan, Notification
+from bank_stats import record_balance_change, record_debt_change
+from leaderboard import touch_users
+import ledger
+
+# Рушій строків: депозити, страховки та кредити закриваються фоновим циклом лідера.
+# Найближчі строки (у межах горизонту) тримаються в мін-купі, яка кожні EXPIRY_REFRESH_INTERVAL секунд
+# перебудовується з індексованих колонок БД — так до неї потрапляють строки, створені будь-яким воркером.
+# Строк, що вже є в купі, закривається у свій час; новий строк, який настає раніше за наступне
+# перебудування, закривається з запізненням до EXPIRY_REFRESH_INTERVAL секунд.
+# Прострочені записи закриваються пачками (кількома UPDATE на пачку).
+
+# Депозит повертається з 10% прибутку
+DEPOSIT_RETURN = 1.10
+
+class ExpiryEngine:
+    """Мін-купа строків (deadline, kind, user_id), перебудована з БД під час останнього refresh()."""
+
+    def __init__(self, horizon=600, refresh_interval=15):
+        self.horizon = horizon
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._heap = []
+        self._deadlines = {}  # (kind, user_id) -> актуальний deadline
+        self._refreshed_at = None
+        self.stats = {'settled': 0, 'batches': 0, 'refreshes': 0}
+
+    def init_app(self, app):
+        self.horizon = app.config.get('EXPIRY_HORIZON', self.horizon)
+        self.refresh_interval = app.config.get('EXPIRY_REFRESH_INTERVAL', self.refresh_interval)
+
+    def refresh(self, now, loan_term_days):
+        """Перебудовує купу зі строків, що настають у межах горизонту (діапазонні запити по індексах)."""
+        until = now + timedelta(seconds=self.horizon)
+        entries = [('deposit', user_id, deadline) for user_id, deadline in db.session.execute(
+            select(User.id, User.deposit_end_time).where(User.deposit_amount > 0, User.deposit_end_time <= until))]
+        entries += [('insurance', user_id, deadline) for user_id, deadline in db.session.execute(
+            select(User.id, User.insurance_end_time).where(User.is_insured == True, User.insurance_end_time <= until))]
+        term = timedelta(days=loan_term_days)
+        entries += [('loan', user_id, taken_date + term) for user_id, taken_date in db.session.execute(
+            select(Loan.user_id, Loan.taken_date).where(Loan.amount > 0, Loan.taken_date <= until - term))]
+        db.session.commit()
+        with self._lock:
+            self._deadlines = {(kind, user_id): deadline for kind, user_id, deadline in entries}
+            self._heap = [(deadline, kind, user_id) for kind, user_id, deadline in entries]
+            heapq.heapify(self._heap)
+            self._refreshed_at = now
+            self.stats['refreshes'] += 1
+
+    def needs_refresh(self, now):
+        return self._refreshed_at is None or (now - self._refreshed_at).total_seconds() >= self.refresh_interval
+
+    def pop_due(self, now):
+        """Знімає з купи всі строки, що настали. Повертає {kind: [user_id, ...]}."""
+        due = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, kind, user_id = heapq.heappop(self._heap)
+                if self._deadlines.get((kind, user_id)) != deadline:
+                    continue  # Дублікат уже знятого строку
+                del self._deadlines[(kind, user_id)]
+                due.setdefault(kind, []).append(user_id)
+        return due
+
+    def seconds_until_next(self, now):
+        with self._lock:
+            return (self._heap[0][0] - now).total_seconds() if self._heap else None
+
+    def settle(self, due, now, loan_term_days):
+        """Закриває прострочені строки однією транзакцією БД.
+
+        Повертає {kind: [(user_id, transaction_dict або None, notification_dict)]} — серіалізовано ще до коміту,
+        щоб розсилка не перечитувала кожен запис окремим запитом.
+        """
+        def work():
+            ledger.lock_users([user_id for user_ids in due.values() for user_id in user_ids])
+            return {
+                'deposit': _settle_deposits(due.get('deposit', []), now),
+                'insurance': _settle_insurance(due.get('insurance', []), now),
+                'loan': _settle_loans(due.get('loan', []), now, loan_term_days),
+            }
+        settled = ledger.atomic(work)
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['settled'] += sum(len(items) for items in settled.values())
+        return settled
+
+def _notify_all(items):
+    notifications = [Notification(user_id=user_id, text=text, date=datetime.utcnow()) for user_id, text in items]
+    db.session.add_all(notifications)
+    return notifications
+
+def _settle_deposits(user_ids, now):
+    if not user_ids:
+        return []
+    # Повторна перевірка в SQL: строк міг змінитися після того, як потрапив у купу
+    rows = db.session.execute(select(User.id, User.deposit_amount)
+                              .where(User.id.in_(user_ids), User.deposit_amount > 0, User.deposit_end_time <= now)).all()
+    if not rows:
+        return []
+    db.session.execute(
+        update(User).where(User.id.in_([user_id for user_id, _ in rows])).values(
+            balance=User.balance + User.deposit_amount * DEPOSIT_RETURN,
+            deposit_earnings=User.deposit_earnings + User.deposit_amount * (DEPOSIT_RETURN - 1),
+            deposit_amount=0, deposit_end_time=None)
+        .execution_options(synchronize_session=False))
+    record_balance_change(sum(amount * DEPOSIT_RETURN for _, amount in rows))
+    touch_users([user_id for user_id, _ in rows])
+    transactions = [ledger.record(user_id, 'Повернення депозиту', amount * DEPOSIT_RETURN, True, f"Прибуток: {amount * (DEPOSIT_RETURN - 1):.2f} грн")
+                    for user_id, amount in rows]
+    notifications = _notify_all([(user_id, f"Ваш депозит на {amount:.2f} грн завершено! Нараховано {amount * DEPOSIT_RETURN:.2f} грн.")
+                                 for user_id, amount in rows])
+    db.session.flush()
+    return [(user_id, tx.to_dict(), n.to_dict()) for (user_id, _), tx, n in zip(rows, transactions, notifications)]
+
+def _settle_insurance(user_ids, now):
+    if not user_ids:
+        return []
+    ids = db.session.execute(select(User.id).where(User.id.in_(user_ids), User.is_insured == True, User.insurance_end_time <= now)).scalars().all()
+    if not ids:
+        return []
+    db.session.execute(update(User).where(User.id.in_(ids)).values(is_insured=False, insurance_end_time=None)
+                       .execution_options(synchronize_session=False))
+    notifications = _notify_all([(user_id, "Термін дії вашої страховки завершився.") for user_id in ids])
+    db.session.flush()
+    return [(user_id, None, n.to_dict()) for user_id, n in zip(ids, notifications)]
+
+def _settle_loans(user_ids, now, loan_term_days):
+    if not user_ids:
+        return []
+    # Кредит погашається автоматично з балансу разом із відсотками (баланс може стати від'ємним)
+    rows = db.session.execute(select(Loan.user_id, Loan.amount, Loan.interest_rate)
+                              .where(Loan.user_id.in_(user_ids), Loan.amount > 0, Loan.taken_date <= now - timedelta(days=loan_term_days))).all()
+    if not rows:
+        return []
+    owed = {user_id: amount * (1 + (rate or 0) / 100) for user_id, amount, rate in rows}
+    db.session.execute(update(Loan).where(Loan.user_id.in_(list(owed))).values(amount=0, interest_rate=0, taken_date=None)
+                       .execution_options(synchronize_session=False))
+    db.session.execute(update(User).where(User.id.in_(list(owed)))
+                       .values(balance=User.balance - case(owed, value=User.id, else_=0))
+                       .execution_options(synchronize_session=False))
+    record_balance_change(-sum(owed.values()))
+    record_debt_change(-sum(amount for _, amount, _ in rows))
+    touch_users(owed)
+    transactions = [ledger.record(user_id, 'Погашення кредиту', total, False, "Автоматичне погашення після закінчення терміну") for user_id, total in owed.items()]
+    notifications = _notify_all([(user_id, f"Термін кредиту завершився. З рахунку списано {total:.2f} грн.") for user_id, total in owed.items()])
+    db.session.flush()
+    return [(user_id, tx.to_dict(), n.to_dict()) for user_id, tx, n in zip(owed, transactions, notifications)]
+
+expiry_engine = ExpiryEngine()
+
+def run_expiry_loop(app, socketio, is_leader, get_loan_term_days, on_settled):
+    """Фоновий цикл: спить до найближчого строку (не довше секунди) і закриває прострочене."""
+    while True:
+        try:
+            if is_leader():
+                with app.app_context():
+                    now = datetime.utcnow()
+                    term = get_loan_term_days()
+                    if expiry_engine.needs_refresh(now):
+                        expiry_engine.refresh(now, term)
+                    due = expiry_engine.pop_due(now)
+                    if due:
+                        on_settled(expiry_engine.settle(due, now, term))
+        except Exception:
+            logging.exception("Помилка в циклі обробки строків")
+        wait = expiry_engine.seconds_until_next(datetime.utcnow())
+        socketio.sleep(1.0 if wait is None else min(max(wait, 0.05), 1.0))
@@ -0,0 +1,75 @@
+import os
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from functools import wraps
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from models import db, SchedulerLease
+
+# Вибір лідера між воркерами через рядок-оренду в БД: фонові задачі APScheduler
+# запускаються в кожному процесі, але виконуються лише там, де оренда дійсна.
+
+class LeaderLease:
+    """Оренда з обмеженим часом життя; лідер мусить поновлювати її частіше, ніж раз на ttl."""
+
+    def __init__(self, name='scheduler', ttl=30):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._expires = None
+        self._lock = threading.Lock()
+
+    def is_leader(self):
+        # Перевіряємо і локальний строк: якщо поновлення не вдалося, лідерство спливає саме
+        with self._lock:
+            return self._expires is not None and datetime.utcnow() < self._expires
+
+    def try_acquire(self):
+        """Поновлює свою оренду або перехоплює прострочену. Повертає True, якщо цей процес — лідер."""
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.ttl)
+        try:
+            result = db.session.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now))
+                .values(holder=self.holder, expires_at=expires)
+            )
+            acquired = result.rowcount == 1
+            if not acquired and db.session.get(SchedulerLease, self.name) is None:
+                db.session.add(SchedulerLease(name=self.name, holder=self.holder, expires_at=expires))
+                db.session.flush()
+                acquired = True
+            db.session.commit()
+        except IntegrityError:
+            # Інший воркер одночасно створив рядок оренди
+            db.session.rollback()
+            acquired = False
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            logging.warning(f"Не вдалося поновити оренду '{self.name}': {exc}")
+            acquired = False
+        with self._lock:
+            was_leader = self._expires is not None
+            # Запас у третину ttl: локально вважаємо себе лідером трохи менше, ніж триває оренда в БД
+            self._expires = now + timedelta(seconds=self.ttl * 2 / 3) if acquired else None
+        if acquired != was_leader:
+            logging.info(f"Процес {self.holder} {'став' if acquired else 'більше не'} лідером планувальника.")
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self._expires = None
+        db.session.execute(update(SchedulerLease).where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                           .values(expires_at=datetime.utcnow()))
+        db.session.commit()
+
+    def leader_only(self, fn):
+        """Декоратор для задач планувальника: виконує задачу лише в процесі-лідері."""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if self.is_leader():
+                return fn(*args, **kwargs)
+        return wrapper
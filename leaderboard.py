@@ -0,0 +1,204 @@
+import threading
+from collections import Counter
+from sqlalchemy import event, select
+from models import db, User, Loan, UserAsset, Asset, Team
+
+try:
+    import numpy as np
+except ImportError:  # numpy необов'язковий: без нього переоцінка йде чистим Python
+    np = None
+
+# Рейтинг статків гравців у пам'яті: статок = баланс - кредит + Σ кількість × ціна активу.
+# Портфелі зберігаються щільною матрицею користувачі × активи, тож тік цін переоцінює всіх
+# одним множенням матриці на вектор цін. Зміни окремих гравців (перекази, покупки, угоди)
+# позначаються після коміту і дочитуються з БД пачкою у refresh(); читання рейтингу БД не чіпає.
+
+def touch_users(user_ids, session=None):
+    """Позначає гравців, змінених в обхід ORM (прямі UPDATE), для оновлення рейтингу після коміту."""
+    (session or db.session()).info.setdefault('leaderboard', set()).update(user_ids)
+
+@event.listens_for(db.session, 'after_flush')
+def _collect(session, flush_context):
+    # after_flush: session.new ще містить нові об'єкти, а id вже присвоєні
+    touched = session.info.setdefault('leaderboard', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            touched.add(obj.id)
+        elif isinstance(obj, (Loan, UserAsset)):
+            touched.add(obj.user_id)
+
+@event.listens_for(db.session, 'after_commit')
+def _commit(session):
+    touched = session.info.pop('leaderboard', None)
+    if touched:
+        leaderboard.touch(touched)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard(session):
+    session.info.pop('leaderboard', None)
+
+def _zeros(n):
+    return np.zeros(n) if np is not None else [0.0] * n
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._dirty = set()
+        self.stats = Counter()
+
+    def rebuild(self):
+        """Повне завантаження з БД: п'ять запитів незалежно від кількості гравців."""
+        assets = db.session.execute(select(Asset.id, Asset.price).order_by(Asset.id)).all()
+        users = db.session.execute(select(User.id, User.username, User.balance, User.team_id)
+                                   .where(User.is_admin == False).order_by(User.id)).all()
+        loans = dict(db.session.execute(select(Loan.user_id, Loan.amount)).all())
+        holdings = db.session.execute(select(UserAsset.user_id, UserAsset.asset_id, UserAsset.quantity)).all()
+        teams = dict(db.session.execute(select(Team.id, Team.name)).all())
+        db.session.commit()
+        columns = {asset_id: i for i, (asset_id, _) in enumerate(assets)}
+        rows = {user_id: i for i, (user_id, *_) in enumerate(users)}
+        matrix = np.zeros((len(users), len(assets))) if np is not None else [[0.0] * len(assets) for _ in users]
+        for user_id, asset_id, quantity in holdings:
+            if user_id in rows and asset_id in columns:
+                matrix[rows[user_id]][columns[asset_id]] = quantity or 0
+        cash = _zeros(len(users))
+        for i, (user_id, _, balance, _) in enumerate(users):
+            cash[i] = (balance or 0) - (loans.get(user_id) or 0)
+        prices = _zeros(len(assets))
+        for i, (_, price) in enumerate(assets):
+            prices[i] = price or 0
+        with self._lock:
+            self._columns, self._rows = columns, rows
+            self._user_ids = [user_id for user_id, *_ in users]
+            self._names = [username for _, username, _, _ in users]
+            self._team_ids = [team_id for *_, team_id in users]
+            self._team_names = teams
+            self._active = [True] * len(users)
+            self._holdings, self._cash, self._prices = matrix, cash, prices
+            self._dirty.clear()
+            self.loaded = True
+            self.stats['rebuilds'] += 1
+            self._revalue()
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.rebuild()
+
+    def _revalue(self):
+        # Переоцінка всієї таблиці: одне множення матриці на вектор цін
+        if np is not None:
+            self._net = (self._cash + self._holdings @ self._prices).tolist() if len(self._user_ids) else []
+        else:
+            self._net = [cash + sum(q * p for q, p in zip(row, self._prices)) for cash, row in zip(self._cash, self._holdings)]
+        self._rerank()
+
+    def _row_value(self, row):
+        if np is not None:
+            return float(self._cash[row] + self._holdings[row] @ self._prices)
+        return self._cash[row] + sum(q * p for q, p in zip(self._holdings[row], self._prices))
+
+    def _rerank(self):
+        self._order = sorted((row for row, active in enumerate(self._active) if active), key=lambda row: -self._net[row])
+        self._rank = {self._user_ids[row]: i + 1 for i, row in enumerate(self._order)}
+        totals = {}
+        for row in self._order:
+            team_id = self._team_ids[row]
+            if team_id is not None:
+                totals[team_id] = totals.get(team_id, 0) + self._net[row]
+        self._teams = sorted(totals.items(), key=lambda item: -item[1])
+
+    def revalue(self, prices):
+        """Тік цін ({asset_id: price}). Новий актив змінює форму матриці — тоді повне перезавантаження."""
+        if not self.loaded or any(asset_id not in self._columns for asset_id in prices):
+            self.rebuild()
+            return
+        with self._lock:
+            for asset_id, price in prices.items():
+                self._prices[self._columns[asset_id]] = price
+            self.stats['revaluations'] += 1
+            self._revalue()
+
+    def reload_prices(self):
+        if self.loaded:
+            self.revalue(dict(db.session.execute(select(Asset.id, Asset.price)).all()))
+            db.session.commit()
+
+    def touch(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_id for user_id in user_ids if user_id is not None)
+
+    def refresh(self):
+        """Дочитує з БД рядки гравців, змінених після останнього оновлення. Повертає True, якщо рейтинг змінився."""
+        if not self.loaded:
+            self.rebuild()
+            return True
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return False
+        users = {user_id: (username, balance, team_id, is_admin) for user_id, username, balance, team_id, is_admin in db.session.execute(
+            select(User.id, User.username, User.balance, User.team_id, User.is_admin).where(User.id.in_(dirty)))}
+        if any(user_id not in self._rows and not users[user_id][3] for user_id in users):
+            # Новий гравець — змінюється форма матриці
+            db.session.commit()
+            self.rebuild()
+            return True
+        loans = dict(db.session.execute(select(Loan.user_id, Loan.amount).where(Loan.user_id.in_(dirty))).all())
+        holdings = db.session.execute(select(UserAsset.user_id, UserAsset.asset_id, UserAsset.quantity).where(UserAsset.user_id.in_(dirty))).all()
+        teams = dict(db.session.execute(select(Team.id, Team.name)).all())
+        db.session.commit()
+        if any(asset_id not in self._columns for _, asset_id, _ in holdings):
+            self.rebuild()
+            return True
+        with self._lock:
+            self._team_names = teams
+            for user_id in dirty:
+                row = self._rows.get(user_id)
+                if row is None:
+                    continue
+                if user_id not in users or users[user_id][3]:
+                    self._active[row] = False  # Видалений або став адміністратором
+                    continue
+                username, balance, team_id, _ = users[user_id]
+                self._names[row], self._team_ids[row], self._active[row] = username, team_id, True
+                self._cash[row] = (balance or 0) - (loans.get(user_id) or 0)
+                for column in range(len(self._columns)):
+                    self._holdings[row][column] = 0
+            for user_id, asset_id, quantity in holdings:
+                if user_id in self._rows:
+                    self._holdings[self._rows[user_id]][self._columns[asset_id]] = quantity or 0
+            for user_id in dirty:
+                if user_id in self._rows:
+                    self._net[self._rows[user_id]] = self._row_value(self._rows[user_id])
+            self.stats['row_updates'] += len(dirty)
+            self._rerank()
+        return True
+
+    def _entry(self, row, rank):
+        team_id = self._team_ids[row]
+        return {'rank': rank, 'userId': self._user_ids[row], 'username': self._names[row],
+                'team': self._team_names.get(team_id) if team_id else None, 'netWorth': round(self._net[row], 2)}
+
+    def top(self, limit=10):
+        with self._lock:
+            return [self._entry(row, i + 1) for i, row in enumerate(self._order[:limit])]
+
+    def rank(self, user_id):
+        with self._lock:
+            rank = self._rank.get(user_id)
+            return self._entry(self._rows[user_id], rank) if rank else None
+
+    def team_totals(self):
+        with self._lock:
+            return [{'rank': i + 1, 'teamId': team_id, 'name': self._team_names.get(team_id), 'netWorth': round(total, 2)}
+                    for i, (team_id, total) in enumerate(self._teams)]
+
+    def snapshot(self, limit=10):
+        return {'top': self.top(limit), 'teams': self.team_totals(), 'players': len(self._order)}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, players=len(self._order) if self.loaded else 0, pending=len(self._dirty), vectorized=np is not None)
+
+leaderboard = Leaderboard()
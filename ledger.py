@@ -0,0 +1,147 @@
+import json
+import time
+import random
+import logging
+from datetime import datetime
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import OperationalError, DBAPIError
+from models import db, User, Transaction
+from bank_stats import record_balance_change
+from leaderboard import touch_users
+from sqlite_writer import sqlite_writer
+
+# Рушій проводок: усі зміни балансів виконуються атомарними умовними UPDATE
+# (balance = balance - :amt WHERE balance >= :amt), без читання балансу в Python.
+
+MAX_RETRIES = 5
+# SQLSTATE Postgres: serialization_failure та deadlock_detected
+RETRYABLE_PGCODES = {'40001', '40P01'}
+
+class LedgerError(Exception):
+    """Базова помилка операцій з балансами."""
+
+class InsufficientFunds(LedgerError):
+    def __init__(self, user_id):
+        super().__init__(f"Недостатньо коштів у користувача {user_id}")
+        self.user_id = user_id
+
+def _is_retryable(exc):
+    orig = getattr(exc, 'orig', None)
+    if getattr(orig, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    return 'database is locked' in str(orig or exc)
+
+def atomic(work, retries=MAX_RETRIES):
+    """Виконує work() в одній транзакції БД і комітить її.
+
+    При конфлікті серіалізації / взаємоблокуванні транзакція відкочується
+    і повторюється з експоненційною затримкою. Помилки LedgerError не повторюються.
+    У режимі SQLITE_PRODUCTION робота йде в пакет записувача (sqlite_writer.py).
+    """
+    if sqlite_writer.in_writer():
+        return work()  # Вкладений виклик усередині пакета — та сама транзакція
+    if sqlite_writer.accepts(db.session):
+        result = sqlite_writer.submit(work, lambda job: _atomic(job, retries))
+        db.session.expire_all()  # Як після власного коміту: далі сесія читає вже записане
+        return result
+    return _atomic(work, retries)
+
+def _atomic(work, retries):
+    for attempt in range(retries):
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except (OperationalError, DBAPIError) as exc:
+            db.session.rollback()
+            if not _is_retryable(exc) or attempt == retries - 1:
+                raise
+            logging.warning(f"Конфлікт транзакції, повтор {attempt + 1}/{retries}: {exc.orig}")
+            time.sleep((2 ** attempt) * 0.01 * (1 + random.random()))
+        except Exception:
+            db.session.rollback()
+            raise
+
+def lock_users(user_ids):
+    # Блокуємо рядки в детермінованому порядку (за id), щоб зустрічні перекази не давали deadlock.
+    # На SQLite FOR UPDATE ігнорується — там запис і так серіалізований.
+    ids = sorted(set(user_ids))
+    db.session.execute(select(User.id).where(User.id.in_(ids)).order_by(User.id).with_for_update())
+    return ids
+
+def debit(user_id, amount, count_as_sent=False, **extra):
+    # extra — інші колонки User, що змінюються тим самим UPDATE (напр. бали лояльності при покупці)
+    values = dict(extra, balance=User.balance - amount)
+    if count_as_sent:
+        values['total_sent'] = User.total_sent + amount
+    result = db.session.execute(
+        update(User).where(User.id == user_id, User.balance >= amount).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise InsufficientFunds(user_id)
+    touch_users([user_id])
+
+def credit(user_id, amount):
+    db.session.execute(
+        update(User).where(User.id == user_id).values(balance=User.balance + amount)
+        .execution_options(synchronize_session=False)
+    )
+    touch_users([user_id])
+
+def record(user_id, action, amount, is_positive, comment='', details=None):
+    """Створює рядок Transaction у поточній транзакції (без коміту та без emit)."""
+    transaction = Transaction(user_id=user_id, action=action, amount=round(amount, 2), is_positive=is_positive,
+                              comment=comment, details=json.dumps(details) if details else None, date=datetime.utcnow())
+    db.session.add(transaction)
+    return transaction
+
+def transfer(sender, recipient, amount, comment='', extra=None):
+    """Переказ між двома користувачами. Повертає (транзакція відправника, транзакція отримувача, результат extra).
+
+    extra — необов'язкова функція, що виконується в тій самій транзакції БД (наприклад, додає сповіщення).
+    Вона може виконатися кілька разів (повтори atomic) або відкотитися, тож emit — лише після повернення transfer.
+    """
+    def work():
+        # Порядок операцій відповідає порядку блокувань: спершу менший id
+        for user_id in lock_users([sender.id, recipient.id]):
+            if user_id == sender.id:
+                debit(sender.id, amount, count_as_sent=True)
+            else:
+                credit(recipient.id, amount)
+        if sender.is_admin:
+            record_balance_change(amount)  # Адмін не входить у загальний баланс гравців
+        sender_tx = record(sender.id, f'Переказ до {recipient.username}', amount, False, comment)
+        recipient_tx = record(recipient.id, f'Отримано від {sender.username}', amount, True, comment)
+        extra_result = extra() if extra else None
+        db.session.flush()
+        return sender_tx, recipient_tx, extra_result
+    return atomic(work)
+
+def batch_credit(credits, action, comment='', payer_id=None):
+    """Нараховує кожному користувачу з credits ({user_id: amount}) однією інструкцією UPDATE.
+
+    Якщо вказано payer_id, загальна сума списується з нього умовним UPDATE у тій самій транзакції.
+    Повертає список створених Transaction.
+    """
+    credits = {user_id: amount for user_id, amount in credits.items() if amount > 0}
+    if not credits:
+        return []
+    def work():
+        lock_users(list(credits) + ([payer_id] if payer_id else []))
+        if payer_id:
+            debit(payer_id, sum(credits.values()), count_as_sent=True)
+        db.session.execute(
+            update(User).where(User.id.in_(list(credits)))
+            .values(balance=User.balance + case(credits, value=User.id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+        touch_users(credits)
+        # Платник (якщо є) — гравець, тож загальний баланс змінюється лише на нараховане з банку
+        record_balance_change(0 if payer_id else sum(credits.values()))
+        transactions = [record(user_id, action, amount, True, comment) for user_id, amount in credits.items()]
+        if payer_id:
+            record(payer_id, action, sum(credits.values()), False, comment)
+        db.session.flush()
+        return transactions
+    return atomic(work)
@@ -0,0 +1,152 @@
+import random
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, LotteryCounter, LotteryTicket, ShopItem, User, WonLot, Notification
+from bank_stats import record_balance_change
+import ledger
+
+# Лотереї: квиток — рядок LotteryTicket з номером, унікальним у межах лотереї (товару ShopItem.is_lottery).
+# Покупка кількох квитків резервує суцільний діапазон номерів одним атомарним UPDATE лічильника,
+# ліміт на гравця перевіряється індексованим COUNT (item_id, user_id).
+# Розіграш вибирає випадкові номери з діапазону 1..last_number і шукає їхніх власників
+# за індексом (item_id, ticket_number), тож не читає всі квитки лотереї.
+
+# Скільки номерів на одного переможця можна витягнути, перш ніж перейти до добору в SQL
+REDRAW_LIMIT = 20
+
+class LotteryError(Exception):
+    """Квитки не видано (ліміт, розпродано тощо); текст показується гравцю."""
+
+def _reserve_numbers(item_id, count):
+    """Резервує count номерів поспіль і повертає перший із них."""
+    last = db.session.execute(
+        update(LotteryCounter).where(LotteryCounter.item_id == item_id)
+        .values(last_number=LotteryCounter.last_number + count).returning(LotteryCounter.last_number)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if last is None:
+        # Перша покупка: лічильник продовжує вже видані квитки (якщо такі є)
+        start = db.session.execute(select(func.max(LotteryTicket.ticket_number)).where(LotteryTicket.item_id == item_id)).scalar() or 0
+        try:
+            with db.session.begin_nested():
+                db.session.add(LotteryCounter(item_id=item_id, last_number=start + count))
+        except IntegrityError:
+            return _reserve_numbers(item_id, count)
+        last = start + count
+    return last - count + 1
+
+def tickets_owned(user_id, item_id):
+    return db.session.execute(select(func.count(LotteryTicket.id))
+                              .where(LotteryTicket.item_id == item_id, LotteryTicket.user_id == user_id)).scalar()
+
+def issue_tickets(user_id, item, count, now=None):
+    """Видає count квитків у поточній транзакції (без коміту та без списання коштів чи запасу).
+
+    Повертає (перший, останній номер). LotteryError — перевищено ліміт квитків на гравця.
+    """
+    if count <= 0:
+        raise LotteryError("Некоректна кількість квитків")
+    if item.lottery_max_tickets_user:
+        owned = tickets_owned(user_id, item.id)
+        if owned + count > item.lottery_max_tickets_user:
+            raise LotteryError(f"Можна мати не більше {item.lottery_max_tickets_user} квитків (у вас уже {owned})")
+    first = _reserve_numbers(item.id, count)
+    now = now or datetime.utcnow()
+    db.session.execute(insert(LotteryTicket), [
+        {'user_id': user_id, 'item_id': item.id, 'ticket_number': first + i, 'purchase_date': now} for i in range(count)])
+    return first, first + count - 1
+
+def buy_tickets(user_id, item, count):
+    """Купівля квитків окремою транзакцією: запас, ліміт, номери та списання коштів.
+
+    Повертає (transaction, перший, останній номер). LotteryError / ledger.InsufficientFunds — покупки не було.
+    """
+    price = item.discount_price if item.discount_price else item.price
+    total = price * count
+    def work():
+        ledger.lock_users([user_id])
+        first, last = issue_tickets(user_id, item, count)
+        result = db.session.execute(
+            update(ShopItem).where(ShopItem.id == item.id, ShopItem.quantity >= count)
+            .values(quantity=ShopItem.quantity - count, popularity=ShopItem.popularity + count)
+            .execution_options(synchronize_session=False))
+        if result.rowcount != 1:
+            raise LotteryError("Квитки закінчилися")
+        ledger.debit(user_id, total)
+        record_balance_change(-total)
+        transaction = ledger.record(user_id, 'Купівля лотерейних квитків', total, False, f"{item.name}: №{first}–{last}",
+                                    {'itemId': item.id, 'count': count, 'firstNumber': first, 'lastNumber': last})
+        db.session.flush()
+        return transaction, first, last
+    return ledger.atomic(work)
+
+def _pick_numbers(last, count, tried):
+    """count випадкових ще не перевірених номерів з 1..last (рівномірно, без повторів)."""
+    remaining = last - len(tried)
+    count = min(count, remaining)
+    if remaining <= 2 * len(tried):
+        # Більшу частину вже перевірено — простіше вибрати з решти напряму
+        return random.sample([n for n in range(1, last + 1) if n not in tried], count)
+    # Порядок витягування важливий: першим перевіряється перший витягнутий номер
+    picked = {}
+    while len(picked) < count:
+        number = random.randint(1, last)
+        if number not in tried:
+            picked.setdefault(number, None)
+    return list(picked)
+
+def _draw_rest(item_id, winners, chosen):
+    # Рівномірно серед квитків ще не обраних гравців: випадковий зсув у відсортованій вибірці
+    while len(chosen) < winners:
+        others = (LotteryTicket.item_id == item_id, LotteryTicket.user_id.notin_(list(chosen)))
+        total = db.session.execute(select(func.count(LotteryTicket.id)).where(*others)).scalar()
+        if not total:
+            return
+        number, user_id = db.session.execute(select(LotteryTicket.ticket_number, LotteryTicket.user_id).where(*others)
+                                             .order_by(LotteryTicket.ticket_number).offset(random.randrange(total)).limit(1)).one()
+        chosen[user_id] = number
+
+def draw(item, winners, prize=None):
+    """Розігрує лотерею: winners різних гравців, кожен квиток має однаковий шанс.
+
+    Номери видалених квитків (і повторні влучання в уже обраних гравців) просто перетягуються.
+    Результати пишуться в WonLot і сповіщення пакетно. Повертає [{userId, username, ticketNumber, notification}].
+    """
+    def work():
+        last = db.session.execute(select(LotteryCounter.last_number).where(LotteryCounter.item_id == item.id)).scalar()
+        if last is None:
+            last = db.session.execute(select(func.max(LotteryTicket.ticket_number)).where(LotteryTicket.item_id == item.id)).scalar() or 0
+        chosen, tried = {}, set()  # user_id -> номер квитка
+        while len(chosen) < winners and len(tried) < last:
+            if len(tried) >= REDRAW_LIMIT * winners:
+                # Майже всі витягнуті номери належать уже обраним гравцям — решту добираємо в SQL
+                _draw_rest(item.id, winners, chosen)
+                break
+            numbers = _pick_numbers(last, 2 * (winners - len(chosen)), tried)
+            tried.update(numbers)
+            owners = dict(db.session.execute(select(LotteryTicket.ticket_number, LotteryTicket.user_id)
+                                             .where(LotteryTicket.item_id == item.id, LotteryTicket.ticket_number.in_(numbers))).all())
+            for number in numbers:
+                user_id = owners.get(number)
+                if user_id is not None and user_id not in chosen and len(chosen) < winners:
+                    chosen[user_id] = number
+        if not chosen:
+            return []
+        usernames = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(list(chosen)))).all())
+        now = datetime.utcnow()
+        db.session.execute(insert(WonLot), [{'user_id': user_id, 'type': 'lottery', 'name': item.name, 'prize': prize, 'date': now}
+                                            for user_id in chosen])
+        notifications = [Notification(user_id=user_id, text=f"Вітаємо! Ваш квиток №{number} виграв у лотереї «{item.name}»" + (f": {prize}" if prize else "."), date=now)
+                         for user_id, number in chosen.items()]
+        db.session.add_all(notifications)
+        db.session.flush()
+        return [{'userId': user_id, 'username': usernames.get(user_id), 'ticketNumber': number, 'notification': n.to_dict()}
+                for (user_id, number), n in zip(chosen.items(), notifications)]
+    return ledger.atomic(work)
+
+def reset(item_id):
+    """Видаляє всі квитки лотереї та її лічильник (у поточній транзакції)."""
+    removed = db.session.execute(delete(LotteryTicket).where(LotteryTicket.item_id == item_id)).rowcount
+    db.session.execute(delete(LotteryCounter).where(LotteryCounter.item_id == item_id))
+    return removed
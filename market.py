@@ -0,0 +1,109 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, update
+from models import db, AssetHistory, AssetCandle
+
+# Роздільності OHLC-свічок (назва -> тривалість інтервалу в секундах)
+RESOLUTIONS = {'1m': 60, '15m': 900, '1h': 3600}
+
+EPOCH = datetime(1970, 1, 1)
+
+def _bucket(ts, seconds):
+    # Початок інтервалу, до якого належить ts (час у БД зберігається як naive UTC)
+    return EPOCH + timedelta(seconds=int((ts - EPOCH).total_seconds()) // seconds * seconds)
+
+class PriceTape:
+    """Кільцеві буфери останніх тиків і поточні (відкриті) свічки по кожному активу.
+
+    Тік-джоб записує ціни через record(): сирий тик, буфер і свічки оновлюються
+    інкрементно, без перечитування історії з БД.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ticks = {}    # asset_id -> deque[(timestamp, price)]
+        self._candles = {}  # (asset_id, resolution) -> dict з id, bucket_start та OHLC
+
+    def recent(self, asset_id, limit=30):
+        """Останні limit цін активу (від старіших до новіших)."""
+        buf = self._ticks.get(asset_id)
+        if buf is None:
+            buf = self._load_ticks(asset_id)
+        with self._lock:
+            return [price for _, price in list(buf)[-limit:]]
+
+    def _load_ticks(self, asset_id):
+        size = current_app.config['PRICE_RECENT_TICKS']
+        rows = db.session.query(AssetHistory.timestamp, AssetHistory.price).filter_by(asset_id=asset_id) \
+            .order_by(AssetHistory.timestamp.desc(), AssetHistory.id.desc()).limit(size).all()
+        with self._lock:
+            return self._ticks.setdefault(asset_id, deque(((ts, price) for ts, price in reversed(rows)), maxlen=size))
+
+    def _load_candle(self, asset_id, resolution):
+        candle = AssetCandle.query.filter_by(asset_id=asset_id, resolution=resolution).order_by(AssetCandle.bucket_start.desc()).first()
+        if not candle:
+            return None
+        return {'id': candle.id, 'bucket_start': candle.bucket_start, 'open': candle.open, 'high': candle.high, 'low': candle.low, 'close': candle.close}
+
+    def record(self, ticks, now=None):
+        """Записує тики [(asset_id, price), ...] у поточну транзакцію (коміт робить викликач)."""
+        now = now or datetime.utcnow()
+        for asset_id, _ in ticks:
+            if asset_id not in self._ticks:
+                self._load_ticks(asset_id)  # Спершу підтягуємо історію, щоб новий тик не потрапив у буфер двічі
+        db.session.execute(insert(AssetHistory), [{'asset_id': asset_id, 'price': price, 'timestamp': now} for asset_id, price in ticks])
+        for asset_id, price in ticks:
+            with self._lock:
+                self._ticks[asset_id].append((now, price))
+            for resolution, seconds in RESOLUTIONS.items():
+                self._update_candle(asset_id, resolution, _bucket(now, seconds), price)
+
+    def _update_candle(self, asset_id, resolution, bucket_start, price):
+        key = (asset_id, resolution)
+        candle = self._candles.get(key) or self._load_candle(asset_id, resolution)
+        if candle and candle['bucket_start'] == bucket_start:
+            candle.update(high=max(candle['high'], price), low=min(candle['low'], price), close=price)
+            result = db.session.execute(update(AssetCandle).where(AssetCandle.id == candle['id'])
+                                        .values(high=candle['high'], low=candle['low'], close=price))
+            if result.rowcount:
+                self._candles[key] = candle
+                return
+            # Рядок зник (відкат попереднього тіку) — створюємо свічку заново з поточних значень
+            values = {k: candle[k] for k in ('open', 'high', 'low', 'close')}
+        else:
+            values = {'open': price, 'high': price, 'low': price, 'close': price}
+        result = db.session.execute(insert(AssetCandle).values(asset_id=asset_id, resolution=resolution, bucket_start=bucket_start, **values))
+        self._candles[key] = dict(values, id=result.inserted_primary_key[0], bucket_start=bucket_start)
+
+    def reset(self):
+        with self._lock:
+            self._ticks.clear(); self._candles.clear()
+
+price_tape = PriceTape()
+
+def price_history(asset_id, resolution='1m', start=None, end=None, limit=500):
+    """Історія цін для графіка: сирі тики (resolution='raw') або OHLC-свічки."""
+    if resolution == 'raw':
+        query = AssetHistory.query.filter_by(asset_id=asset_id)
+        if start: query = query.filter(AssetHistory.timestamp >= start)
+        if end: query = query.filter(AssetHistory.timestamp < end)
+        rows = query.order_by(AssetHistory.timestamp.desc()).limit(limit).all()
+        return [{'time': h.timestamp.isoformat(), 'price': h.price} for h in reversed(rows)]
+    query = AssetCandle.query.filter_by(asset_id=asset_id, resolution=resolution)
+    if start: query = query.filter(AssetCandle.bucket_start >= start)
+    if end: query = query.filter(AssetCandle.bucket_start < end)
+    rows = query.order_by(AssetCandle.bucket_start.desc()).limit(limit).all()
+    return [c.to_dict() for c in reversed(rows)]
+
+def compact_price_history(now=None):
+    """Видаляє сирі тики та свічки, старші за період зберігання з конфігурації."""
+    now = now or datetime.utcnow()
+    config = current_app.config
+    removed = db.session.execute(delete(AssetHistory).where(AssetHistory.timestamp < now - config['PRICE_RAW_RETENTION'])).rowcount
+    for resolution, keep in config['PRICE_CANDLE_RETENTION'].items():
+        if keep:
+            removed += db.session.execute(delete(AssetCandle).where(AssetCandle.resolution == resolution, AssetCandle.bucket_start < now - keep)).rowcount
+    db.session.commit()
+    return removed
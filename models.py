@@ -1,11 +1,37 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import is_legacy_hash, simple_hash
+from static_assets import static_assets
 import json
 from datetime import datetime
+from sqlalchemy import and_, desc, or_
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
 
 # Ініціалізація розширення SQLAlchemy
 db = SQLAlchemy()
 
+# Розмір сторінки історії (транзакції, сповіщення), що віддається за замовчуванням
+HISTORY_PAGE_SIZE = 50
+
+def paginate_by_date(query, model, cursor=None, limit=HISTORY_PAGE_SIZE, date_attr='date'):
+    """Keyset-пагінація від новіших до старіших за (date, id).
+
+    Курсор має вигляд "<isoformat дати>_<id>" і вказує на останній запис попередньої сторінки.
+    Повертає (записи, курсор наступної сторінки або None).
+    """
+    date_col, id_col = getattr(model, date_attr), model.id
+    if cursor:
+        date_str, _, id_str = cursor.rpartition('_')
+        cursor_date, cursor_id = datetime.fromisoformat(date_str), int(id_str)
+        query = query.filter(or_(date_col < cursor_date, and_(date_col == cursor_date, id_col < cursor_id)))
+    items = query.order_by(desc(date_col), desc(id_col)).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = f"{getattr(last, date_attr).isoformat()}_{last.id}"
+    return items, next_cursor
+
 # --- Таблиці-асоціації для зв'язків багато-до-багатьох ---
 
 # Зв'язок між користувачами та виконаними завданнями
@@ -18,7 +44,7 @@ completed_tasks = db.Table('completed_tasks',
 class UserAsset(db.Model):
     __tablename__ = 'user_asset'
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
-    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), primary_key=True, index=True)  # Власники активу
     quantity = db.Column(db.Float, nullable=False, default=0)
     
     user = db.relationship('User', back_populates='assets')
@@ -38,12 +64,12 @@ class User(db.Model):
     
     # Поля для депозиту
     deposit_amount = db.Column(db.Float, default=0)
-    deposit_end_time = db.Column(db.DateTime, nullable=True)
+    deposit_end_time = db.Column(db.DateTime, nullable=True, index=True)
     deposit_earnings = db.Column(db.Float, default=0)
 
     # Поля для страхування
     is_insured = db.Column(db.Boolean, default=False)
-    insurance_end_time = db.Column(db.DateTime, nullable=True)
+    insurance_end_time = db.Column(db.DateTime, nullable=True, index=True)
     
     # Поля для статистики
     total_sent = db.Column(db.Float, default=0)
@@ -51,42 +77,49 @@ class User(db.Model):
 
     # Зв'язки
     passport = db.relationship('Passport', backref='user', uselist=False, cascade="all, delete-orphan")
-    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True, index=True)
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade="all, delete-orphan")
     notifications = db.relationship('Notification', backref='user', lazy=True, cascade="all, delete-orphan")
     task_submissions = db.relationship('TaskSubmission', backref='user', lazy=True, cascade="all, delete-orphan")
-    completed_tasks = db.relationship('Task', secondary=completed_tasks, lazy='subquery',
+    # Не 'subquery': інакше виконані завдання вантажаться при кожному запиті User (див. USER_LOADERS)
+    completed_tasks = db.relationship('Task', secondary=completed_tasks, lazy=True,
                                       backref=db.backref('completed_by', lazy=True))
     loan = db.relationship('Loan', backref='user', uselist=False, cascade="all, delete-orphan")
     assets = db.relationship('UserAsset', back_populates='user', cascade="all, delete-orphan")
     lottery_tickets = db.relationship('LotteryTicket', backref='user', lazy=True, cascade="all, delete-orphan")
     won_lots = db.relationship('WonLot', backref='user', lazy=True, cascade="all, delete-orphan")
+    bids = db.relationship('Bid', backref='user', lazy=True, cascade="all, delete-orphan")
     messages_sent = db.relationship('ChatMessage', foreign_keys='ChatMessage.from_user_id', backref='sender', lazy=True)
     messages_received = db.relationship('ChatMessage', foreign_keys='ChatMessage.to_user_id', backref='recipient', lazy=True)
+    chat_thread = db.relationship('ChatThread', backref='user', uselist=False, lazy=True, cascade="all, delete-orphan")
+    stats = db.relationship('UserStats', uselist=False, cascade="all, delete-orphan")
 
-# Новий, виправлений код
-    # Цей блок має бути у файлі models.py
     def set_password(self, password):
         # Ми явно вказуємо використовувати інший, більш сумісний метод хешування
         self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
     def check_password(self, password):
-        # Для сумісності зі старим "simpleHash" з вашого JS
-        # Якщо пароль не був оновлений на сервері, він буде у старому форматі
-        try:
-            # Спроба перевірити за новим, безпечним методом
-            return check_password_hash(self.password_hash, password)
-        except Exception:
-            # Якщо виникає помилка (старий формат), перевіряємо старим методом
-            return self.password_hash == self._simple_hash(password)
-
-    def _simple_hash(self, s):
-        hash_val = 0
-        for char in s:
-            hash_val = (hash_val << 5) - hash_val + ord(char)
-            hash_val |= 0  # Convert to 32bit integer
-        return str(hash_val)
-        
-    def to_dict(self, include_sensitive=False):
+        # Синхронна перевірка (CLI, скрипти); view входу використовує passwords.password_hasher.
+        # Старий "simpleHash" з JS не містить '$' — check_password_hash для нього просто повертає False
+        if is_legacy_hash(self.password_hash):
+            return self.password_hash == simple_hash(password)
+        return check_password_hash(self.password_hash, password)
+
+    # Скалярні поля, які можна надсилати частковим user_update (ключі як у to_dict)
+    DELTA_FIELDS = {
+        'balance': lambda u: u.balance,
+        'loyaltyPoints': lambda u: u.loyalty_points,
+        'isBlocked': lambda u: u.is_blocked,
+        'isInsured': lambda u: u.is_insured,
+        'insuranceEndTime': lambda u: u.insurance_end_time.isoformat() if u.insurance_end_time else None,
+        'depositAmount': lambda u: u.deposit_amount,
+        'depositEndTime': lambda u: u.deposit_end_time.isoformat() if u.deposit_end_time else None,
+        'loan': lambda u: u.loan.to_dict() if u.loan else {'amount': 0, 'interest_rate': 0, 'taken_date': None, 'is_pending': False, 'pending_amount': 0},
+    }
+
+    def to_delta(self, *fields):
+        return dict({'id': self.id}, **{f: self.DELTA_FIELDS[f](self) for f in fields})
+
+    def to_dict(self, include_sensitive=False, history_limit=HISTORY_PAGE_SIZE):
         user_dict = {
             'id': self.id,
             'username': self.username,
@@ -95,6 +128,7 @@ class User(db.Model):
             'balance': self.balance,
             'loyaltyPoints': self.loyalty_points,
             'photo': self.photo,
+            'photoThumb': static_assets.image(self.photo, 160),
             'team': self.team.name if self.team else None,
             'passport': self.passport.to_dict() if self.passport else None,
             'loan': self.loan.to_dict() if self.loan else {'amount': 0, 'interest_rate': 0, 'taken_date': None, 'is_pending': False, 'pending_amount': 0},
@@ -106,8 +140,12 @@ class User(db.Model):
             # Тут можна додати поля, які потрібні тільки самому користувачу
             user_dict['depositAmount'] = self.deposit_amount
             user_dict['depositEndTime'] = self.deposit_end_time.isoformat() if self.deposit_end_time else None
-            user_dict['transactions'] = [t.to_dict() for t in self.transactions]
-            user_dict['notifications'] = sorted([n.to_dict() for n in self.notifications], key=lambda x: x['date'], reverse=True)
+            # Історія обмежена першою сторінкою; решту клієнт догружає за курсором
+            transactions, user_dict['transactionsCursor'] = paginate_by_date(Transaction.query.with_parent(self), Transaction, limit=history_limit)
+            user_dict['transactions'] = [t.to_dict() for t in transactions]
+            notifications, user_dict['notificationsCursor'] = paginate_by_date(Notification.query.with_parent(self), Notification, limit=history_limit)
+            user_dict['notifications'] = [n.to_dict() for n in notifications]
+            user_dict['unreadNotifications'] = Notification.query.with_parent(self).filter_by(read=False).count()
             user_dict['completedTasks'] = [task.id for task in self.completed_tasks]
             user_dict['taskSubmissions'] = [sub.to_dict() for sub in self.task_submissions]
             user_dict['stocks'] = {ua.asset.ticker: ua.quantity for ua in self.assets if ua.asset.type == 'stock'}
@@ -141,6 +179,9 @@ class Team(db.Model):
     members = db.relationship('User', backref='team', lazy=True)
 
 class Transaction(db.Model):
+    # Історія гравця (user_id, date) і загальний журнал адміністратора (date), обидва — keyset за датою
+    __table_args__ = (db.Index('ix_transaction_user_date', 'user_id', 'date'),
+                      db.Index('ix_transaction_date', 'date'))
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     action = db.Column(db.String(200))
@@ -184,6 +225,9 @@ class ShopItem(db.Model):
             'category': self.category,
             'description': self.description,
             'image': self.image,
+            # Адреси з хешем (WebP, якщо зібрано): картка товару і мініатюра в кошику
+            'imageUrl': static_assets.image(self.image, 480),
+            'imageThumb': static_assets.image(self.image, 160),
             'isLottery': self.is_lottery,
             'lotteryMaxTicketsUser': self.lottery_max_tickets_user,
             'popularity': self.popularity
@@ -211,8 +255,8 @@ class Task(db.Model):
 
 class TaskSubmission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
     status = db.Column(db.String(20), default='pending') # pending, approved, rejected
     file_path = db.Column(db.String(255), nullable=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -223,15 +267,52 @@ class TaskSubmission(db.Model):
             'taskId': self.task_id,
             'status': self.status,
             'file': self.file_path,
+            # Файли з uploads.py лежать за вмістом (objects/ab/<sha256>) і віддаються через API
+            'fileUrl': f"/api/uploads/files/{self.file_path.rsplit('/', 1)[-1]}" if self.file_path and self.file_path.startswith('objects/') else None,
             'date': self.date.isoformat()
         }
 
+class StoredFile(db.Model):
+    # Вміст завантаження, адресований sha256: однакові файли різних гравців зберігаються один раз
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    extension = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, ready, rejected
+    has_thumbnail = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'sha256': self.sha256,
+            'size': self.size,
+            'status': self.status,
+            'hasThumbnail': self.has_thumbnail
+        }
+
+class Upload(db.Model):
+    # Незавершене завантаження, яке можна докачати; прийняті байти лежать у UPLOAD_FOLDER/partial/<id>.part
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self, offset=0):
+        return {
+            'uploadId': self.id,
+            'taskId': self.task_id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': offset
+        }
+
 class Loan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
     amount = db.Column(db.Float, default=0)
     interest_rate = db.Column(db.Float, default=0)
-    taken_date = db.Column(db.DateTime, nullable=True)
+    taken_date = db.Column(db.DateTime, nullable=True, index=True)
     is_pending = db.Column(db.Boolean, default=False)
     pending_amount = db.Column(db.Float, default=0)
     
@@ -253,20 +334,44 @@ class Asset(db.Model):
     history = db.relationship('AssetHistory', backref='asset', lazy=True, cascade="all, delete-orphan")
     owners = db.relationship('UserAsset', back_populates='asset', cascade="all, delete-orphan")
     
-    def to_dict(self):
+    def to_dict(self, history=None):
         return {
             'name': self.name,
             'ticker': self.ticker,
             'price': self.price,
             'type': self.type,
-            'history': [h.price for h in self.history[-30:]] # Обмежимо історію
+            # Останні ціни передаються з кільцевого буфера market.py; запасний варіант — зв'язок history
+            'history': history if history is not None else [h.price for h in self.history[-30:]] # Обмежимо історію
         }
         
 class AssetHistory(db.Model):
+    # Графік активу (asset_id, timestamp) і чистка старих тиків за timestamp (market.compact_price_history)
+    __table_args__ = (db.Index('ix_asset_history_asset_timestamp', 'asset_id', 'timestamp'),)
     id = db.Column(db.Integer, primary_key=True)
     asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False)
     price = db.Column(db.Float, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class AssetCandle(db.Model):
+    # OHLC-агрегати цін активу для роздільностей '1m', '15m', '1h'
+    id = db.Column(db.Integer, primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('asset.id'), nullable=False)
+    resolution = db.Column(db.String(5), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    open = db.Column(db.Float, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint('asset_id', 'resolution', 'bucket_start'),)
+
+    def to_dict(self):
+        return {
+            'time': self.bucket_start.isoformat(),
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close
+        }
 
 class InsuranceOption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -288,6 +393,7 @@ class EconomicEvent(db.Model):
     add_to_schedule = db.Column(db.Boolean, default=True)
 
 class Notification(db.Model):
+    __table_args__ = (db.Index('ix_notification_user_date', 'user_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
@@ -303,6 +409,9 @@ class Notification(db.Model):
         }
 
 class ChatMessage(db.Model):
+    # Індекси під непрочитані повідомлення гравця і під історію розмови (див. chat.py)
+    __table_args__ = (db.Index('ix_chat_message_to_read', 'to_user_id', 'read'),
+                      db.Index('ix_chat_message_conversation', 'from_user_id', 'to_user_id', 'timestamp'))
     id = db.Column(db.Integer, primary_key=True)
     from_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     to_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Може бути ID адміна
@@ -310,13 +419,34 @@ class ChatMessage(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     read = db.Column(db.Boolean, default=False)
 
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'fromUserId': self.from_user_id,
+            'toUserId': self.to_user_id,
+            'text': self.text,
+            'timestamp': self.timestamp.isoformat(),
+            'read': self.read
+        }
+
+class ChatThread(db.Model):
+    # Розмова гравця з підтримкою: лічильники непрочитаного оновлюються інкрементно разом із повідомленнями
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_by_admin = db.Column(db.Integer, nullable=False, default=0)
+    unread_by_user = db.Column(db.Integer, nullable=False, default=0)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True, index=True)
+
 class GlobalSetting(db.Model):
     key = db.Column(db.String(100), primary_key=True)
     value = db.Column(db.Text, nullable=False) # Зберігаємо значення як JSON-рядок
 
 class LotteryTicket(db.Model):
+    # Номери квитків видаються суцільними діапазонами з LotteryCounter (див. lottery.py)
+    __table_args__ = (db.Index('ix_lottery_ticket_item_user', 'item_id', 'user_id'),
+                      db.Index('ix_lottery_ticket_item_number', 'item_id', 'ticket_number'))
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # Квитки гравця в initial-data
     item_id = db.Column(db.Integer, db.ForeignKey('shop_item.id'), nullable=False)
     ticket_number = db.Column(db.Integer, nullable=False)
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -328,9 +458,14 @@ class LotteryTicket(db.Model):
             'ticketNumber': self.ticket_number
         }
         
+class LotteryCounter(db.Model):
+    # Останній виданий номер квитка для кожної лотереї
+    item_id = db.Column(db.Integer, db.ForeignKey('shop_item.id'), primary_key=True)
+    last_number = db.Column(db.Integer, nullable=False, default=0)
+
 class WonLot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     type = db.Column(db.String(50)) # 'auction', 'special_auction'
     name = db.Column(db.String(200))
     prize = db.Column(db.Text)
@@ -340,4 +475,68 @@ class AuctionState(db.Model):
     # Зберігаємо стан аукціонів тут
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(50), unique=True) # e.g., 'general_auction', 'special_lot'
-    state_json = db.Column(db.Text) # JSON blob of bids, endTime, winner etc.
\ No newline at end of file
+    state_json = db.Column(db.Text) # JSON: isActive, endTime, round, winner та опис лоту; ставки — у таблиці Bid
+
+class Bid(db.Model):
+    # Ставка аукціону; round відділяє ставки різних запусків того самого лоту (див. auction.py)
+    __table_args__ = (db.Index('ix_bid_lot_round_amount', 'lot_key', 'round', 'amount'),)
+    id = db.Column(db.Integer, primary_key=True)
+    lot_key = db.Column(db.String(50), nullable=False)
+    round = db.Column(db.Integer, nullable=False, default=0)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    date = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchedulerLease(db.Model):
+    # Оренда лідерства для фонових задач при запуску кількох воркерів (див. leader.py)
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(120), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class CacheVersion(db.Model):
+    # Лічильники версій кешів у пам'яті для інвалідації між воркерами (див. cache_sync.py)
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+class BankStats(db.Model):
+    # Агрегати для адмін-панелі (один рядок id=1), оновлюються інкрементно в bank_stats.py
+    id = db.Column(db.Integer, primary_key=True)
+    total_balance = db.Column(db.Float, nullable=False, default=0)
+    total_debt = db.Column(db.Float, nullable=False, default=0)
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'totalUsers': self.user_count,
+            'totalTransactions': self.tx_count,
+            'totalBalance': self.total_balance,
+            'totalDebt': self.total_debt,
+            'moneySupply': self.total_balance + self.total_debt,
+            'reconciledAt': self.reconciled_at.isoformat() if self.reconciled_at else None
+        }
+
+class UserStats(db.Model):
+    # Лічильник транзакцій користувача для рейтингу активності
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    tx_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+# Профілі завантаження User: зв'язки, потрібні серіалізації, вантажаться наперед фіксованою
+# кількістю запитів незалежно від кількості користувачів (joinedload — в тому ж запиті,
+# selectinload — один додатковий запит на зв'язок для всієї вибірки).
+#  - auth: лише колонки User (вхід, перевірки, зміна балансу);
+#  - list: to_dict() без чутливих полів (списки в адмінці);
+#  - full: to_dict(include_sensitive=True) для самого користувача.
+configure_mappers()  # backref-атрибути (User.team, User.passport, User.loan) з'являються лише після конфігурації
+USER_LOADERS = {
+    'auth': (),
+    'list': (joinedload(User.team), joinedload(User.passport), joinedload(User.loan)),
+}
+USER_LOADERS['full'] = USER_LOADERS['list'] + (
+    selectinload(User.completed_tasks), selectinload(User.task_submissions),
+    selectinload(User.assets).joinedload(UserAsset.asset), selectinload(User.lottery_tickets),
+)
+
+def user_query(profile='auth'):
+    return User.query.options(*USER_LOADERS[profile])
@@ -0,0 +1,93 @@
+import threading
+from collections import deque
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Хешування паролів поза хабом eventlet: pbkdf2 — це сотні тисяч ітерацій CPU, і виконаний
+# прямо у view він зупиняє всі сокети та запити воркера. Під eventlet робота йде в пул
+# справжніх потоків (eventlet.tpool; hashlib.pbkdf2_hmac відпускає GIL), а семафор обмежує
+# кількість одночасних хешувань — решта чекає в черзі, не блокуючи хаб.
+
+try:
+    from eventlet import patcher, tpool
+except ImportError:  # Без eventlet (напр. CLI або threading-режим) хешуємо в поточному потоці
+    tpool = None
+
+def _offload(fn, *args):
+    if tpool is not None and patcher.is_monkey_patched('thread'):
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+def is_legacy_hash(password_hash):
+    # Старий формат з JS-клієнта ("simpleHash") — просто число, без роздільника '$'
+    return '$' not in (password_hash or '')
+
+def simple_hash(s):
+    hash_val = 0
+    for char in s:
+        hash_val = (hash_val << 5) - hash_val + ord(char)
+        hash_val |= 0  # Convert to 32bit integer
+    return str(hash_val)
+
+class PasswordHasher:
+    def __init__(self, concurrency=4, method='pbkdf2:sha256'):
+        self.method = method
+        self._limit = threading.BoundedSemaphore(concurrency)
+        self._prefix = None
+        self._lock = threading.Lock()
+        self.concurrency = concurrency
+        self.waiting = 0
+        self.running = 0
+        self.stats = {'hashed': 0, 'verified': 0, 'rehashed': 0, 'logins': 0, 'failedLogins': 0, 'maxQueue': 0}
+        self._latencies = deque(maxlen=1000)  # Тривалість останніх входів, секунди
+
+    def init_app(self, app):
+        self.concurrency = app.config.get('PASSWORD_HASH_CONCURRENCY', self.concurrency)
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self._limit = threading.BoundedSemaphore(self.concurrency)
+        self._prefix = None
+
+    def _run(self, key, fn, *args):
+        with self._lock:
+            self.waiting += 1
+            self.stats['maxQueue'] = max(self.stats['maxQueue'], self.waiting)
+        with self._limit:
+            with self._lock:
+                self.waiting -= 1; self.running += 1
+            try:
+                return _offload(fn, *args)
+            finally:
+                with self._lock:
+                    self.running -= 1; self.stats[key] += 1
+
+    def hash(self, password):
+        return self._run('hashed', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        if is_legacy_hash(password_hash):
+            return password_hash == simple_hash(password)
+        return self._run('verified', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Старий simpleHash або хеш іншим методом — після успішного входу перезаписуємо."""
+        if is_legacy_hash(password_hash):
+            return True
+        if self._prefix is None:
+            # Префікс поточного формату разом із параметрами (напр. "pbkdf2:sha256:600000")
+            self._prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def observe_login(self, seconds, ok, rehashed=False):
+        with self._lock:
+            self._latencies.append(seconds)
+            self.stats['logins'] += 1
+            if not ok: self.stats['failedLogins'] += 1
+            if rehashed: self.stats['rehashed'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+            return dict(self.stats, concurrency=self.concurrency, queueDepth=self.waiting, inFlight=self.running,
+                        loginLatencyMs={'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99), 'max': percentile(1.0)})
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,228 @@
+import json
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from functools import wraps
+from flask import request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from greenlet import getcurrent as _current
+except ImportError:
+    from threading import get_ident as _current
+
+# Вимірювання продуктивності: для кожного ендпоінта і кожної фонової задачі рахуємо час,
+# кількість і час SQL-запитів, розмір відповіді та кількість socket-повідомлень.
+# Значення зберігаються у ковзних вікнах (останні PERF_WINDOW вимірів), з яких рахуються p50/p95/p99.
+# Одиниця виміру прив'язана до поточного greenlet/потоку, тож паралельні запити під eventlet не змішуються.
+
+QUANTILES = (0.5, 0.95, 0.99)
+METRICS = ('wall_ms', 'sql_count', 'sql_ms', 'bytes', 'emits')
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+class _Series:
+    """Ковзне вікно вимірів однієї одиниці (ендпоінта або задачі) плюс накопичувальні лічильники для Prometheus."""
+
+    def __init__(self, window):
+        self.samples = {metric: deque(maxlen=window) for metric in METRICS}
+        self.count = 0
+        self.errors = 0
+        self.totals = dict.fromkeys(METRICS, 0.0)
+
+    def add(self, values, error):
+        self.count += 1
+        self.errors += bool(error)
+        for metric in METRICS:
+            self.samples[metric].append(values[metric])
+            self.totals[metric] += values[metric]
+
+    def summary(self):
+        result = {'count': self.count, 'errors': self.errors}
+        for metric in METRICS:
+            values = sorted(self.samples[metric])
+            result[metric] = {f'p{int(q * 100)}': round(_percentile(values, q), 2) if values else None for q in QUANTILES}
+        return result
+
+class PerfMonitor:
+    def __init__(self):
+        self.enabled = False
+        self.window = 1000
+        self.slow_query_ms = 0
+        self._lock = threading.Lock()
+        self._units = {}  # greenlet/потік -> поточний вимір
+        self._series = {'request': defaultdict(self._new_series), 'job': defaultdict(self._new_series)}
+        self.slow_queries = deque(maxlen=50)
+        self._gauges = {}
+        self.capture_path = None
+
+    def _new_series(self):
+        return _Series(self.window)
+
+    def init_app(self, app, socketio):
+        self.enabled = app.config.get('PERF_ENABLED', True)
+        self.window = app.config.get('PERF_WINDOW', self.window)
+        self.slow_query_ms = app.config.get('PERF_SLOW_QUERY_MS', 0)
+        self.capture_path = app.config.get('TRAFFIC_CAPTURE_PATH')
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor)
+        emit = socketio.emit
+        @wraps(emit)
+        def counted_emit(*args, **kwargs):
+            unit = self._units.get(_current())
+            if unit is not None: unit['emits'] += 1
+            return emit(*args, **kwargs)
+        socketio.emit = counted_emit
+
+    def gauge(self, name, fn, help_text=''):
+        """Додає до /metrics значення, що читається в момент експорту (напр. довжина черги)."""
+        self._gauges[name] = (fn, help_text)
+
+    # --- Одиниці виміру ---
+
+    def _start(self):
+        self._units[_current()] = {'started': time.perf_counter(), 'sql_count': 0, 'sql_ms': 0.0, 'bytes': 0, 'emits': 0}
+
+    def _finish(self, kind, name, error=False):
+        unit = self._units.pop(_current(), None)
+        if unit is None:
+            return
+        unit['wall_ms'] = (time.perf_counter() - unit['started']) * 1000
+        with self._lock:
+            self._series[kind][name].add(unit, error)
+
+    def _before_request(self):
+        self._start()
+
+    def _after_request(self, response):
+        unit = self._units.get(_current())
+        if unit is not None and not response.direct_passthrough:
+            unit['bytes'] = response.content_length or 0
+        if unit is not None:
+            self._finish('request', f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}", response.status_code >= 500)
+        if self.capture_path and request.path.startswith('/api/'):
+            self._capture(response)
+        return response
+
+    def _capture(self, response):
+        """Дописує запит у JSONL для відтворення бенчмарком (benchmarks/run.py --replay). Паролі не зберігаються."""
+        try:
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        body = request.get_json(silent=True) if request.is_json else None
+        if isinstance(body, dict):
+            body = {key: value for key, value in body.items() if 'password' not in key.lower()}
+        if request.path == '/api/login' and isinstance(body, dict):
+            identity = {'username': body.get('username')}
+        line = json.dumps({'t': time.time(), 'method': request.method, 'path': request.path, 'query': request.query_string.decode(),
+                           'body': body, 'user': identity.get('username') if isinstance(identity, dict) else None,
+                           'status': response.status_code}, ensure_ascii=False)
+        with self._lock:
+            with open(self.capture_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def _teardown_request(self, exc):
+        # Необроблений виняток: after_request не викликався
+        if _current() in self._units:
+            self._finish('request', f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}", True)
+
+    def job(self, fn):
+        """Декоратор для задач планувальника."""
+        if not self.enabled:
+            return fn
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            self._start()
+            error = True
+            try:
+                result = fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                self._finish('job', fn.__name__, error)
+        return wrapper
+
+    # --- SQL ---
+
+    def _before_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        context._perf_started = time.perf_counter()
+
+    def _after_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_perf_started', None)
+        if started is None:
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        unit = self._units.get(_current())
+        if unit is not None:
+            unit['sql_count'] += 1
+            unit['sql_ms'] += elapsed
+        if self.slow_query_ms and elapsed >= self.slow_query_ms and not executemany:
+            self._log_slow(conn, cursor, statement, parameters, elapsed)
+
+    def _log_slow(self, conn, cursor, statement, parameters, elapsed):
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        plan = None
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            try:
+                # Окремий DBAPI-курсор того ж з'єднання: без подій SQLAlchemy і без впливу на поточний результат
+                explain = cursor.connection.cursor()
+                explain.execute(prefix + statement, parameters)
+                plan = [' '.join(str(col) for col in row) for row in explain.fetchall()]
+                explain.close()
+            except Exception as exc:
+                plan = [f'EXPLAIN недоступний: {exc}']
+        entry = {'ms': round(elapsed, 2), 'statement': statement, 'plan': plan, 'at': time.time()}
+        self.slow_queries.append(entry)
+        logging.warning(f"Повільний запит ({entry['ms']} мс): {statement}\nПлан: {plan}")
+
+    # --- Звіти ---
+
+    def report(self):
+        with self._lock:
+            return {
+                'requests': {name: series.summary() for name, series in sorted(self._series['request'].items())},
+                'jobs': {name: series.summary() for name, series in sorted(self._series['job'].items())},
+                'slowQueries': list(self.slow_queries),
+                'inFlight': len(self._units),
+            }
+
+    def prometheus(self):
+        """Текстовий формат Prometheus: summary з квантилями ковзного вікна + накопичувальні _sum/_count."""
+        lines = []
+        with self._lock:
+            for kind, label in (('request', 'endpoint'), ('job', 'job')):
+                for metric in METRICS:
+                    name = f'ceobank_{kind}_{metric}'
+                    lines.append(f'# TYPE {name} summary')
+                    for unit, series in sorted(self._series[kind].items()):
+                        values = sorted(series.samples[metric])
+                        escaped = _label(unit)
+                        for q in QUANTILES:
+                            if values:
+                                lines.append(f'{name}{{{label}="{escaped}",quantile="{q}"}} {_percentile(values, q)}')
+                        lines.append(f'{name}_sum{{{label}="{escaped}"}} {series.totals[metric]}')
+                        lines.append(f'{name}_count{{{label}="{escaped}"}} {series.count}')
+                name = f'ceobank_{kind}_errors_total'
+                lines.append(f'# TYPE {name} counter')
+                for unit, series in sorted(self._series[kind].items()):
+                    lines.append(f'{name}{{{label}="{_label(unit)}"}} {series.errors}')
+        for name, (fn, help_text) in sorted(self._gauges.items()):
+            if help_text: lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {fn()}')
+        return '\n'.join(lines) + '\n'
+
+perf = PerfMonitor()
@@ -0,0 +1,167 @@
+import os
+import csv
+import json
+import math
+import time
+import random
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from models import db, User, Passport, Loan, Team, ShopItem, Asset, AssetHistory, AuctionState
+from settings import settings_cache
+import bank_stats
+
+# Масове створення гравців (flask import-users) і початкове наповнення БД (init-db, seed.py).
+# Паролі хешуються пулом процесів, рядки User/Passport/Loan вставляються пачками одним
+# INSERT на таблицю, а вже наявні імена пропускаються — повторний запуск нічого не дублює.
+
+IMPORT_CHUNK_SIZE = 500
+
+# Колонки файлу імпорту; обов'язкові лише username і password
+IMPORT_FIELDS = ('username', 'password', 'surname', 'name', 'dob', 'passport', 'room', 'team', 'balance', 'loyaltyPoints', 'photo')
+
+def read_rows(path, fmt=None):
+    """Читає CSV (з рядком заголовків) або JSONL. Формат визначається за розширенням, якщо не вказано."""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if key in IMPORT_FIELDS and value not in (None, '')}
+        else:
+            for line in f:
+                if line.strip():
+                    yield {key: value for key, value in json.loads(line).items() if key in IMPORT_FIELDS and value not in (None, '')}
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk; chunk = []
+    if chunk:
+        yield chunk
+
+def _resolve_teams(names):
+    names = {name for name in names if name}
+    if not names:
+        return {}
+    teams = dict(db.session.execute(select(Team.name, Team.id).where(Team.name.in_(names))).all())
+    missing = [{'name': name} for name in names if name not in teams]
+    if missing:
+        db.session.execute(insert(Team), missing)
+        teams = dict(db.session.execute(select(Team.name, Team.id).where(Team.name.in_(names))).all())
+    return teams
+
+def import_users(rows, chunk_size=IMPORT_CHUNK_SIZE, workers=None, method='pbkdf2:sha256'):
+    """Імпортує гравців з ітератора словників (див. IMPORT_FIELDS). Повертає звіт з кількостями та швидкістю."""
+    started = time.perf_counter()
+    report = {'read': 0, 'created': 0, 'skipped': 0, 'invalid': 0}
+    hasher = partial(generate_password_hash, method=method)
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    seen, seen_passports = set(), set()
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            report['read'] += len(chunk)
+            valid = []
+            for row in chunk:
+                username = str(row.get('username', '')).strip()
+                passport = str(row['passport']) if row.get('passport') else None
+                if not username or not row.get('password'):
+                    report['invalid'] += 1
+                    continue
+                try:
+                    balance = float(row.get('balance', 100))
+                    loyalty_points = int(row.get('loyaltyPoints', 10))
+                except (TypeError, ValueError):
+                    report['invalid'] += 1  # Напр. balance=abc у CSV
+                    continue
+                if not math.isfinite(balance):
+                    report['invalid'] += 1
+                    continue
+                if username in seen or passport in seen_passports:
+                    report['skipped'] += 1  # Дублікат у самому файлі
+                    continue
+                seen.add(username)
+                if passport: seen_passports.add(passport)
+                valid.append(dict(row, username=username, balance=balance, loyaltyPoints=loyalty_points))
+            # Ідемпотентність: вже наявні імена і номери паспортів пропускаємо одним запитом на пачку
+            existing = set(db.session.execute(select(User.username).where(User.username.in_([r['username'] for r in valid]))).scalars())
+            passports = [str(r['passport']) for r in valid if r.get('passport')]
+            taken = set(db.session.execute(select(Passport.number).where(Passport.number.in_(passports))).scalars()) if passports else set()
+            fresh = [r for r in valid if r['username'] not in existing and str(r.get('passport', '')) not in taken]
+            report['skipped'] += len(valid) - len(fresh)
+            if not fresh:
+                continue
+            passwords = [str(r['password']) for r in fresh]
+            if workers > 1 and len(passwords) > 1:
+                pool = pool or ProcessPoolExecutor(max_workers=workers)
+                hashes = list(pool.map(hasher, passwords, chunksize=max(1, len(passwords) // (4 * workers))))
+            else:
+                hashes = [hasher(p) for p in passwords]
+            teams = _resolve_teams(r.get('team') for r in fresh)
+            user_rows = [{
+                'username': r['username'], 'password_hash': password_hash,
+                'balance': r['balance'], 'loyalty_points': r['loyaltyPoints'],
+                'photo': r.get('photo', './foto_default.png'), 'team_id': teams.get(r.get('team')),
+            } for r, password_hash in zip(fresh, hashes)]
+            ids = dict(db.session.execute(insert(User).returning(User.username, User.id), user_rows).all())
+            db.session.execute(insert(Passport), [{
+                'user_id': ids[r['username']], 'surname': r.get('surname'), 'name': r.get('name'), 'dob': r.get('dob'),
+                'number': str(r['passport']) if r.get('passport') else None, 'room': str(r['room']) if r.get('room') else None,
+            } for r in fresh])
+            db.session.execute(insert(Loan), [{'user_id': ids[r['username']]} for r in fresh])
+            bank_stats.record_new_users(len(fresh), sum(row['balance'] for row in user_rows))
+            db.session.commit()
+            report['created'] += len(fresh)
+            logging.info(f"Імпорт: створено {report['created']}, пропущено {report['skipped']} з {report['read']} прочитаних.")
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if pool: pool.shutdown()
+    elapsed = time.perf_counter() - started
+    report['seconds'] = round(elapsed, 2)
+    report['rowsPerSecond'] = round(report['read'] / elapsed, 1) if elapsed else None
+    return report
+
+def demo_users(count=70):
+    for i in range(1, count + 1):
+        yield {'username': f'user{i}', 'password': f'pass{i}', 'photo': f'./foto{i % 20 + 1}.png', 'balance': 100, 'loyaltyPoints': 10,
+               'surname': f'Прізвище{i}', 'name': f'Ім\'я{i}', 'dob': f'{2000+(i%15)}-{str(i%12+1).zfill(2)}-{str(i%28+1).zfill(2)}',
+               'passport': ''.join(random.choices('AB', k=2)) + str(random.randint(100000, 999999)), 'room': str(100+i)}
+
+def seed_database(workers=None, method='pbkdf2:sha256'):
+    """Початкові дані: адмін, демо-гравці, товари, активи, налаштування і стан аукціону.
+
+    method — метод хешування паролів (PASSWORD_HASH_METHOD), як і в import_users.
+    """
+    admin_user = User(username='admin', is_admin=True, password_hash=generate_password_hash('admin123', method)); db.session.add(admin_user)
+    shop_items_data = [
+      {'name': 'Смартфон X', 'price': 500, 'category': 'electronics', 'description': 'Сучасний смартфон.', 'image': './t1.png', 'quantity': 5},
+      {'name': 'Навушники Z', 'price': 200, 'category': 'electronics', 'description': 'Бездротові навушники.', 'image': './t2.png', 'discount_price': 180, 'quantity': 10},
+      {'name': 'Футболка Logo', 'price': 150, 'category': 'clothing', 'description': 'Стильна футболка.', 'image': './t3.png', 'quantity': 20},
+      {'name': 'Лотерейний квиток "Шанс"', 'price': 25, 'category': 'lottery', 'description': 'Випробуй свою удачу!', 'image': './t4.png', 'quantity': 200, 'is_lottery': True, 'lottery_max_tickets_user': 10},
+    ]
+    for item_data in shop_items_data: db.session.add(ShopItem(**item_data))
+    assets_data = [
+        {'name': 'TechCorp', 'ticker': 'TCH', 'price': 150.00, 'type': 'stock'}, {'name': 'EcoFuel', 'ticker': 'EFL', 'price': 85.50, 'type': 'stock'},
+        {'name': 'Bitcoin', 'ticker': 'BTC', 'price': 65000.00, 'type': 'crypto'}, {'name': 'Ethereum', 'ticker': 'ETH', 'price': 3500.00, 'type': 'crypto'}
+    ]
+    for asset_data in assets_data:
+        asset = Asset(name=asset_data['name'], ticker=asset_data['ticker'], price=asset_data['price'], type=asset_data['type'])
+        history = AssetHistory(asset=asset, price=asset_data['price']); db.session.add_all([asset, history])
+    auction_states = {'general_auction': {'isActive': False, 'endTime': None, 'round': 0, 'winner': None}, 'special_lot': None}
+    for key, value in auction_states.items(): db.session.add(AuctionState(key=key, state_json=json.dumps(value)))
+    db.session.commit()
+    initial_settings = {
+        "featuresEnabled": {"transfers": True, "shop": True, "auction": True, "loans": True, "exchange": True, "insurance": True, "rewards": True, "support": True, "deposit": True, "lottery": True, "dynamicEvents": True},
+        "loanSettings": {"interestRate": 5, "maxAmount": 1000, "autoApprove": True, "termDays": 1},
+        "ceoNews": [{"text": "Вітаємо у C.E.O. Банку! Ваш надійний партнер у світі ігрових фінансів.", "date": datetime.now(timezone.utc).isoformat()}],
+        "loyaltyDiscountsEnabled": True
+    }
+    for key, value in initial_settings.items(): settings_cache.set(key, value)
+    return import_users(demo_users(), workers=workers, method=method)
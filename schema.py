@@ -0,0 +1,116 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import desc, func, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from models import (
+    db, completed_tasks, User, Transaction, Notification, TaskSubmission, Loan, AssetHistory, AssetCandle,
+    UserAsset, LotteryTicket, WonLot, ChatMessage, ChatThread, Bid, UserStats
+)
+
+# Обслуговування схеми живих БД (`flask db-optimize`).
+# db.create_all() створює лише відсутні таблиці, тож індекси, оголошені в models.py пізніше,
+# на вже розгорнутих БД (напр. app.db) самі не з'являються. Тут вони порівнюються з тим, що є в БД,
+# відсутні створюються, після чого ANALYZE оновлює статистику планувальника, а EXPLAIN гарячих
+# запитів показує, які з них усе ще читають таблицю повністю.
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN для будь-якого select(): параметри прив'язуються так само, як у звичайному запиті."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN ' if compiler.dialect.name == 'sqlite' else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+def _hot_queries(now):
+    # Запити з найчастіших шляхів застосунку; значення параметрів довільні — план від них не залежить
+    user_ids, day_ago = [1, 2, 3], now - timedelta(days=1)
+    return [
+        ('login: гравець за іменем', select(User).where(User.username == 'user1')),
+        ('history: транзакції гравця', select(Transaction).where(Transaction.user_id == 1).order_by(desc(Transaction.date), desc(Transaction.id)).limit(51)),
+        ('history: сповіщення гравця', select(Notification).where(Notification.user_id == 1).order_by(desc(Notification.date), desc(Notification.id)).limit(51)),
+        ('admin: журнал транзакцій', select(Transaction).join(User, Transaction.user_id == User.id).order_by(desc(Transaction.date), desc(Transaction.id)).limit(101)),
+        ('initial-data: заявки на завдання', select(TaskSubmission).where(TaskSubmission.user_id.in_(user_ids))),
+        ('initial-data: виконані завдання', select(completed_tasks).where(completed_tasks.c.user_id.in_(user_ids))),
+        ('initial-data: активи гравця', select(UserAsset).where(UserAsset.user_id.in_(user_ids))),
+        ('initial-data: лотерейні квитки', select(LotteryTicket).where(LotteryTicket.user_id.in_(user_ids))),
+        ('catalog: учасники команд', select(User.username).where(User.team_id.in_(user_ids))),
+        ('market: власники активу', select(UserAsset).where(UserAsset.asset_id == 1)),
+        ('market: тики активу', select(AssetHistory).where(AssetHistory.asset_id == 1, AssetHistory.timestamp >= day_ago).order_by(desc(AssetHistory.timestamp)).limit(500)),
+        ('market: свічки активу', select(AssetCandle).where(AssetCandle.asset_id == 1, AssetCandle.resolution == '1m').order_by(desc(AssetCandle.bucket_start)).limit(500)),
+        ('market: чистка старих тиків', select(func.count(AssetHistory.id)).where(AssetHistory.timestamp < day_ago)),
+        ('expiry: депозити', select(User.id, User.deposit_end_time).where(User.deposit_amount > 0, User.deposit_end_time <= now)),
+        ('expiry: страховки', select(User.id, User.insurance_end_time).where(User.is_insured == True, User.insurance_end_time <= now)),
+        ('expiry: кредити', select(Loan.user_id, Loan.taken_date).where(Loan.amount > 0, Loan.taken_date <= day_ago)),
+        ('lottery: квитки гравця в лотереї', select(func.count(LotteryTicket.id)).where(LotteryTicket.item_id == 1, LotteryTicket.user_id == 1)),
+        ('lottery: власник номера', select(LotteryTicket.user_id).where(LotteryTicket.item_id == 1, LotteryTicket.ticket_number.in_(user_ids))),
+        ('auction: найвищі ставки', select(Bid).where(Bid.lot_key == 'general_auction', Bid.round == 1).order_by(desc(Bid.amount)).limit(10)),
+        ('chat: розмова гравця', select(ChatMessage).where(ChatMessage.from_user_id == 1, ChatMessage.to_user_id.in_(user_ids)).order_by(desc(ChatMessage.timestamp)).limit(51)),
+        ('chat: вхідні підтримки', select(ChatThread).order_by(desc(ChatThread.last_message_at)).limit(200)),
+        ('dashboard: найактивніші гравці', select(UserStats).order_by(desc(UserStats.tx_count)).limit(5)),
+        ('profile: виграні лоти', select(WonLot).where(WonLot.user_id == 1)),
+    ]
+
+def missing_indexes():
+    """Індекси з models.py, яких немає в БД (лише для вже наявних таблиць)."""
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing += sorted((index for index in table.indexes if index.name not in existing), key=lambda index: index.name)
+    return missing
+
+def create_indexes(indexes):
+    """Створює індекси по одному (кожен — окрема коротка транзакція). Повертає [(назва, секунди)]."""
+    created = []
+    for index in indexes:
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            index.create(conn, checkfirst=True)
+        created.append((index.name, round(time.perf_counter() - started, 3)))
+    return created
+
+def analyze():
+    with db.engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text('PRAGMA optimize'))
+
+def _full_scans(dialect, plan):
+    if dialect == 'sqlite':
+        # "SCAN user" — повний прохід таблиці; "SCAN ... USING INDEX" і "SEARCH" ідуть по індексу
+        return [line.split()[1] for line in plan if line.startswith('SCAN ') and ' USING ' not in line]
+    return [line.split(' on ')[1].split()[0] for line in plan if 'Seq Scan on ' in line]
+
+def explain_hot_queries(now=None):
+    """EXPLAIN гарячих запитів. Повертає [{query, plan, fullScans: {таблиця: рядків}}]."""
+    report, counts = [], {}
+    with db.engine.connect() as conn:
+        dialect = conn.dialect.name
+        for name, statement in _hot_queries(now or datetime.utcnow()):
+            try:
+                # Рядки плану читаються з курсора напряму: типи колонок select() до них не застосовні
+                result = conn.execute(Explain(statement))
+                rows = result.cursor.fetchall()
+                result.close()
+            except DBAPIError as exc:  # Напр. таблиці ще немає (db-optimize --dry-run на старій БД)
+                conn.rollback()
+                report.append({'query': name, 'plan': [], 'fullScans': {}, 'error': str(exc.orig)})
+                continue
+            plan = [row[-1] for row in rows] if dialect == 'sqlite' else [row[0].strip() for row in rows]
+            scans = {}
+            for table in _full_scans(dialect, plan):
+                table = table.strip('"')
+                if table not in counts:
+                    counts[table] = conn.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+                scans[table] = counts[table]
+            report.append({'query': name, 'plan': plan, 'fullScans': scans})
+    return report
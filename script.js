@@ -59,10 +59,31 @@ function connectSocket() {
 function setupSocketListeners() {
     socket.on('user_update', (data) => {
         if (currentUserData && data.user.id === currentUserData.id) {
+            // Сервер надсилає лише змінені поля та нову транзакцію
             currentUserData = { ...currentUserData, ...data.user };
+            if (data.transaction && !currentUserData.transactions.some(t => t.id === data.transaction.id)) {
+                currentUserData.transactions = [data.transaction, ...currentUserData.transactions];
+            }
             updateAllDisplays();
         }
     });
+    socket.on('new_notification', (notification) => {
+        if (!currentUserData) return;
+        currentUserData.notifications = [notification, ...(currentUserData.notifications || [])];
+        currentUserData.unreadNotifications = (currentUserData.unreadNotifications || 0) + 1;
+        checkNotifications();
+    });
+    socket.on('shop_update', (data) => {
+        // Приходять лише змінені товари (або позначені як видалені)
+        if (!appData.shopItems || !data?.items) return;
+        data.items.forEach(change => {
+            const index = appData.shopItems.findIndex(i => i.id === change.id);
+            if (change.deleted) { if (index !== -1) appData.shopItems.splice(index, 1); }
+            else if (index !== -1) appData.shopItems[index] = { ...appData.shopItems[index], ...change };
+            else appData.shopItems.push(change);
+        });
+        populateShopItems();
+    });
     socket.on('admin_data_refresh', (section) => { if (document.getElementById('adminPanel')) { showSection(section); }});
 }
 
@@ -183,7 +204,7 @@ function updateAllDisplays() {
     checkNotifications();
     generateAndDisplayCardNumber();
     document.getElementById('userName').textContent = `${passport.name || ''} ${passport.surname || ''}`;
-    document.getElementById('ownerPhoto').src = user.photo || './logo.png';
+    document.getElementById('ownerPhoto').src = user.photoThumb || user.photo || './logo.png';
 }
 
 function updateBalanceDisplay() {
@@ -224,16 +245,24 @@ function updateTransactionHistoryDisplay() {
             <span class="transaction-amount ${t.isPositive ? 'positive' : 'negative'}">${t.isPositive ? '+' : '−'}${t.amount.toFixed(2)}</span>
           </div>`).join('')}
     `).join('');
-    document.getElementById('moreBtn').style.display = transactions.length > 5 && !showAllTransactionsFlag ? 'block' : 'none';
+    document.getElementById('moreBtn').style.display = (transactions.length > 5 && !showAllTransactionsFlag) || currentUserData.transactionsCursor ? 'block' : 'none';
 }
 
-function showMoreTransactions() {
+async function showMoreTransactions() {
     showAllTransactionsFlag = true;
+    // Догружаємо наступну сторінку історії за курсором
+    if (currentUserData.transactionsCursor) {
+        try {
+            const page = await apiFetch(`/user/transactions?cursor=${encodeURIComponent(currentUserData.transactionsCursor)}`);
+            currentUserData.transactions = [...currentUserData.transactions, ...page.items];
+            currentUserData.transactionsCursor = page.nextCursor;
+        } catch (error) { console.error(error); }
+    }
     updateTransactionHistoryDisplay();
 }
 
 function checkNotifications() {
-    const unreadCount = currentUserData?.notifications?.filter(n => !n.read).length || 0;
+    const unreadCount = currentUserData?.unreadNotifications ?? currentUserData?.notifications?.filter(n => !n.read).length ?? 0;
     const badge = document.getElementById('notification-badge');
     badge.textContent = unreadCount;
     badge.style.display = unreadCount > 0 ? 'flex' : 'none';
@@ -244,7 +273,7 @@ function populateShopItems() {
     if (!shopGrid || !appData.shopItems) return;
     shopGrid.innerHTML = appData.shopItems.length ? appData.shopItems.map(item => `
             <div class="shop-item-card" onclick="handleAddToCartClick(event, ${item.id})">
-              <img src="${item.image}" alt="${item.name}" class="shop-item-image">
+              <img src="${item.imageUrl || item.image}" alt="${item.name}" class="shop-item-image" loading="lazy">
               <h4 class="shop-item-name">${item.name}</h4>
               <div class="shop-item-price-container">
                 ${item.discountPrice ? `<span class="shop-item-price-original">${item.price.toFixed(2)} грн</span>` : ''}
@@ -280,8 +309,10 @@ function renderCart() {
     cartDiv.innerHTML = cart.map((cartItem) => {
         const itemTotal = cartItem.price * cartItem.quantity;
         subtotal += itemTotal;
+        // Кошик зберігається в localStorage, тож адресу з хешем беремо з актуального каталогу
+        const shopItem = appData.shopItems.find(i => i.id === cartItem.id);
         return `<div class="cart-item-display">
-            <img src="${cartItem.image}" class="cart-item-image">
+            <img src="${(shopItem && shopItem.imageThumb) || cartItem.image}" class="cart-item-image">
             <div class="cart-item-info"><h4>${cartItem.name}</h4><p>${cartItem.quantity} x ${cartItem.price.toFixed(2)} = ${itemTotal.toFixed(2)} грн</p></div>
             </div>`;
     }).join('');
@@ -0,0 +1,103 @@
+import logging
+from sqlalchemy import event, or_, text
+from models import db, Transaction, User
+
+# Повнотекстовий індекс журналу транзакцій для адмін-пошуку.
+#  - SQLite: віртуальна таблиця FTS5 з триграмним токенізатором (пошук підрядка, як ILIKE '%...%'),
+#    синхронізується тригерами на вставку/зміну/видалення транзакцій;
+#  - Postgres: розширення pg_trgm і GIN-індекси, які прискорюють ILIKE без зміни запиту.
+
+FTS_TABLE = 'transaction_fts'
+# Триграмний індекс не може шукати рядки, коротші за 3 символи
+MIN_FTS_QUERY = 3
+
+_fts_ready = None
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(action, comment, username, tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS transaction_fts_insert AFTER INSERT ON "transaction" BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, action, comment, username)
+        VALUES (new.id, new.action, new.comment, (SELECT username FROM user WHERE id = new.user_id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transaction_fts_update AFTER UPDATE OF action, comment ON "transaction" BEGIN
+        UPDATE {FTS_TABLE} SET action = new.action, comment = new.comment WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transaction_fts_delete AFTER DELETE ON "transaction" BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+]
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS ix_transaction_action_trgm ON "transaction" USING gin (action gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_transaction_comment_trgm ON "transaction" USING gin (comment gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_user_username_trgm ON "user" USING gin (username gin_trgm_ops)',
+]
+
+def install_search_index():
+    """Створює індекс (ідемпотентно) і заповнює його наявними транзакціями. Повертає True, якщо індекс доступний."""
+    global _fts_ready
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.begin() as conn:
+            if dialect == 'sqlite':
+                created = not conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': FTS_TABLE}).first()
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+                if created:
+                    conn.execute(text(f"""INSERT INTO {FTS_TABLE}(rowid, action, comment, username)
+                        SELECT t.id, t.action, t.comment, u.username FROM "transaction" t JOIN user u ON u.id = t.user_id"""))
+            elif dialect == 'postgresql':
+                for statement in _POSTGRES_DDL:
+                    conn.execute(text(statement))
+            else:
+                return False
+    except Exception as exc:
+        # Напр. SQLite без FTS5 або Postgres без прав на CREATE EXTENSION — лишається звичайний ILIKE
+        logging.warning(f"Пошуковий індекс транзакцій недоступний: {exc}")
+        return False
+    _fts_ready = dialect == 'sqlite'
+    return True
+
+@event.listens_for(Transaction.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    """db.drop_all() не знає про FTS-таблицю: без цього після `flask init-db` старі рядки індексу
+    лишаються, а нові id транзакцій (знову з 1) конфліктують з ними в тригері вставки."""
+    global _fts_ready
+    if connection.dialect.name == 'sqlite':
+        for trigger in ('transaction_fts_insert', 'transaction_fts_update', 'transaction_fts_delete'):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+    _fts_ready = None
+
+def _sqlite_fts_ready():
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': FTS_TABLE}).first() is not None
+    return _fts_ready
+
+def _fts_phrase(filter_text):
+    return '"' + filter_text.replace('"', '""') + '"'
+
+def filter_transactions(query, filter_text=None, username=None, action=None, min_amount=None, max_amount=None, date_from=None, date_to=None):
+    """Додає до запиту по Transaction (вже з'єднаному з User) фільтри адмін-пошуку."""
+    if filter_text:
+        if db.engine.dialect.name == 'sqlite' and len(filter_text) >= MIN_FTS_QUERY and _sqlite_fts_ready():
+            matches = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q").bindparams(q=_fts_phrase(filter_text))
+            query = query.filter(Transaction.id.in_(matches))
+        else:
+            search = f"%{filter_text}%"
+            query = query.filter(or_(User.username.ilike(search), Transaction.comment.ilike(search), Transaction.action.ilike(search)))
+    if username:
+        query = query.filter(User.username == username)
+    if action:
+        query = query.filter(Transaction.action.like(f"{action}%"))
+    if min_amount is not None:
+        query = query.filter(Transaction.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(Transaction.amount <= max_amount)
+    if date_from:
+        query = query.filter(Transaction.date >= date_from)
+    if date_to:
+        query = query.filter(Transaction.date < date_to)
+    return query
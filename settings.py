@@ -0,0 +1,83 @@
+import copy
+import json
+import threading
+from models import db, GlobalSetting
+from cache_sync import cache_sync
+
+# Типи та значення за замовчуванням для відомих глобальних налаштувань
+SETTING_DEFAULTS = {
+    'featuresEnabled': {},
+    'loanSettings': {'interestRate': 5, 'maxAmount': 1000, 'autoApprove': True, 'termDays': 1},
+    'ceoNews': [],
+    'loyaltyDiscountsEnabled': True,
+}
+
+class SettingsCache:
+    """Кеш GlobalSetting у пам'яті процесу: читання не звертаються до БД після першого завантаження."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    def _ensure_loaded(self):
+        if self._values is None:
+            self.reload()
+
+    def reload(self, name=None):
+        values = {}
+        for setting in GlobalSetting.query.all():
+            try:
+                values[setting.key] = json.loads(setting.value)
+            except (json.JSONDecodeError, TypeError):
+                values[setting.key] = setting.value
+        with self._lock:
+            self._values = values
+            self.stats['reloads'] += 1
+
+    def get(self, key, default=None):
+        self._ensure_loaded()
+        with self._lock:
+            if key in self._values:
+                self.stats['hits'] += 1
+                value = self._values[key]
+            else:
+                self.stats['misses'] += 1
+                value = default if default is not None else SETTING_DEFAULTS.get(key)
+        # Копія, щоб випадкова зміна списку/словника викликачем не зіпсувала кеш
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def all(self):
+        self._ensure_loaded()
+        with self._lock:
+            self.stats['hits'] += 1
+            return copy.deepcopy(self._values)
+
+    def validate(self, key, value):
+        if key in SETTING_DEFAULTS and not isinstance(value, type(SETTING_DEFAULTS[key])):
+            raise ValueError(f"Налаштування '{key}' має бути типу {type(SETTING_DEFAULTS[key]).__name__}")
+
+    def set(self, key, value):
+        """Зберігає налаштування в БД (з комітом) і оновлює кеш. Для відомих ключів перевіряє тип."""
+        self.validate(key, value)
+        self._ensure_loaded()
+        setting = db.session.get(GlobalSetting, key)
+        if not setting:
+            setting = GlobalSetting(key=key)
+            db.session.add(setting)
+        setting.value = json.dumps(value)
+        db.session.commit()
+        with self._lock:
+            self._values[key] = copy.deepcopy(value)
+        cache_sync.bump('settings')
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, keys=len(self._values or {}))
+
+settings_cache = SettingsCache()
+cache_sync.on('settings', settings_cache.reload)
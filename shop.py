@@ -0,0 +1,80 @@
+from collections import Counter
+from sqlalchemy import select, update
+from models import db, ShopItem, User
+from bank_stats import record_balance_change
+import ledger
+import lottery
+
+# Оформлення замовлення магазину однією транзакцією БД:
+# усі товари кошика читаються одним SELECT ... WHERE id IN (...), залишок кожного товару
+# зменшується умовним UPDATE (quantity >= :q), гроші й бали списуються умовним UPDATE користувача.
+# Якщо хоч один крок не вдався, транзакція відкочується повністю — товар не можна продати двічі.
+
+class CheckoutError(Exception):
+    """Замовлення не оформлено; текст показується покупцю."""
+
+class OutOfStock(CheckoutError):
+    def __init__(self, item_name):
+        super().__init__(f"Товар '{item_name}' закінчився або його недостатньо")
+        self.item_name = item_name
+
+def parse_cart(cart):
+    """[{id, quantity}, ...] -> {item_id: кількість}; однакові товари в кількох рядках складаються."""
+    quantities = Counter()
+    for line in cart or []:
+        if not isinstance(line, dict):
+            raise CheckoutError("Некоректний вміст кошика")
+        item_id, quantity = line.get('id'), line.get('quantity', 1)
+        if isinstance(item_id, bool) or not isinstance(item_id, int) or isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise CheckoutError("Некоректний вміст кошика")
+        quantities[item_id] += quantity
+    if not quantities:
+        raise CheckoutError("Кошик порожній")
+    return quantities
+
+def checkout(user_id, quantities, loyalty_enabled=True):
+    """Оформлює замовлення. Повертає (transaction, [{id, quantity, popularity}] змінених товарів).
+
+    CheckoutError / OutOfStock / ledger.InsufficientFunds — нічого не змінено.
+    """
+    def work():
+        ledger.lock_users([user_id])
+        items = {item.id: item for item in db.session.execute(select(ShopItem).where(ShopItem.id.in_(list(quantities)))).scalars()}
+        missing = set(quantities) - set(items)
+        if missing:
+            raise CheckoutError("Товар не знайдено")
+        subtotal, details = 0, []
+        for item_id, quantity in quantities.items():
+            item = items[item_id]
+            price = item.discount_price if item.discount_price else item.price
+            subtotal += price * quantity
+            details.append({'itemId': item.id, 'itemName': item.name, 'quantity': quantity, 'price': price})
+        buyer = db.session.execute(select(User.loyalty_points, User.is_admin).where(User.id == user_id)).one()
+        loyalty_points = buyer.loyalty_points or 0
+        discount = min(subtotal, loyalty_points) if loyalty_enabled else 0
+        total = subtotal - discount
+        changed = []
+        # Порядок за id однаковий для всіх покупців — зустрічні замовлення не дають deadlock на Postgres
+        for item_id in sorted(quantities):
+            row = db.session.execute(
+                update(ShopItem).where(ShopItem.id == item_id, ShopItem.quantity >= quantities[item_id])
+                .values(quantity=ShopItem.quantity - quantities[item_id], popularity=ShopItem.popularity + quantities[item_id])
+                .returning(ShopItem.quantity, ShopItem.popularity)
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+            if row is None:
+                raise OutOfStock(items[item_id].name)
+            changed.append({'id': item_id, 'quantity': row.quantity, 'popularity': row.popularity})
+        ledger.debit(user_id, total, loyalty_points=User.loyalty_points - discount + int(subtotal / 100))
+        if not buyer.is_admin:
+            record_balance_change(-total)  # Адмін не входить у загальний баланс гравців (як у ledger.transfer)
+        for detail in details:
+            if items[detail['itemId']].is_lottery:
+                try:
+                    detail['tickets'] = lottery.issue_tickets(user_id, items[detail['itemId']], detail['quantity'])
+                except lottery.LotteryError as e:
+                    raise CheckoutError(str(e))
+        transaction = ledger.record(user_id, "Покупка в магазині", total, False, f"Використано {discount} балів", {'items': details})
+        db.session.flush()
+        return transaction, changed
+    return ledger.atomic(work)
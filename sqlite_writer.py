@@ -0,0 +1,198 @@
+import time
+import queue
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, OperationalError
+from models import db
+import bank_stats
+
+try:
+    from greenlet import getcurrent as _current
+except ImportError:
+    from threading import get_ident as _current
+
+# SQLite у продакшн-режимі (SQLITE_PRODUCTION).
+# На кожне нове з'єднання ставляться прагми: WAL (читачі не блокують записувача і навпаки),
+# synchronous=NORMAL (у WAL fsync лише на контрольних точках), busy_timeout, mmap і кеш сторінок.
+# Записувач у SQLite завжди один, тож у процесі всі транзакції запису стають у чергу на спільний
+# замок ще до першого INSERT/UPDATE/DELETE: greenlet-и чекають на ньому кооперативно, а не в
+# busy-циклі SQLite, який блокує весь хаб eventlet. Замок відпускається, коли з'єднання повертається в пул.
+# Роботи ledger.atomic виконує окремий greenlet-записувач: усе, що накопичилося в черзі, йде однією
+# транзакцією (кожна робота — у власному SAVEPOINT) з одним комітом на пакет. Читання йдуть поза чергою.
+
+_WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'BEGIN IMMEDIATE', 'CREATE', 'DROP', 'ALTER')
+_HOLDS = '_sqlite_writer_holds'
+
+class _Job:
+    __slots__ = ('work', 'done', 'result', 'error')
+
+    def __init__(self, work):
+        self.work = work
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SqliteWriter:
+    def __init__(self, batch_size=64, lock_timeout=30):
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._owner = None
+        self._queue = queue.Queue()
+        self._writer = None  # greenlet/потік записувача, коли черга запущена
+        self._started = False
+        self.stats = Counter()
+
+    def init_app(self, app, socketio):
+        """Викликається після db.init_app: прагми і черга записувача лише для файлової БД SQLite."""
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        if not app.config.get('SQLITE_PRODUCTION') or url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+            return
+        self.app = app
+        self.socketio = socketio
+        self.enabled = True
+        self.batch_size = app.config.get('SQLITE_WRITE_BATCH', self.batch_size)
+        self.lock_timeout = app.config.get('SQLITE_WRITE_LOCK_TIMEOUT', self.lock_timeout)
+        pragmas = [
+            'PRAGMA journal_mode=WAL',
+            f"PRAGMA busy_timeout={int(app.config.get('SQLITE_BUSY_TIMEOUT', 5000))}",
+            f"PRAGMA synchronous={app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            f"PRAGMA mmap_size={int(app.config.get('SQLITE_MMAP_SIZE', 0))}",
+            f"PRAGMA cache_size={int(app.config.get('SQLITE_CACHE_SIZE', -2000))}",
+            'PRAGMA temp_store=MEMORY',
+        ]
+        with app.app_context():
+            engine = db.engine
+        @event.listens_for(engine, 'connect')
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+        event.listen(engine, 'before_cursor_execute', self._before_write)
+        event.listen(engine.pool, 'checkin', self._on_checkin)
+        event.listen(engine.pool, 'invalidate', lambda dbapi_connection, record, exc: self._on_checkin(dbapi_connection, record))
+
+    # --- Єдиний записувач процесу ---
+
+    def _before_write(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get(_HOLDS) or not statement.lstrip()[:15].upper().startswith(_WRITES):
+            return
+        if self._owner == _current():
+            return  # Цей greenlet уже пише іншим з'єднанням — далі вирішує busy_timeout SQLite
+        started = time.perf_counter()
+        if not self._lock.acquire(timeout=self.lock_timeout):
+            self.stats['lockTimeouts'] += 1
+            logging.warning("Черга записувача SQLite: замок не отримано вчасно, запис іде без черги")
+            return
+        waited = time.perf_counter() - started
+        self._owner = _current()
+        conn.info[_HOLDS] = True
+        self.stats['writeTransactions'] += 1
+        self.stats['lockWaitMs'] += waited * 1000
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        if connection_record is not None and connection_record.info.pop(_HOLDS, False):
+            self._owner = None
+            self._lock.release()
+
+    def holds_lock(self):
+        return self._owner is not None and self._owner == _current()
+
+    # --- Черга робіт ledger.atomic ---
+
+    def start(self):
+        if self.enabled and not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._run)
+
+    def accepts(self, session):
+        """Чи можна віддати роботу записувачу: черга працює, виклик не з самого записувача,
+        а сесія, що викликає, не тримає замок і не має незбережених змін (їх закомітить лише атомарний шлях)."""
+        return (self._writer is not None and self._writer != _current() and not self.holds_lock()
+                and not (session.new or session.dirty or session.deleted))
+
+    def in_writer(self):
+        return self._writer is not None and self._writer == _current()
+
+    def submit(self, work, fallback):
+        """Виконує work() у пакеті записувача і повертає результат (або піднімає помилку work).
+
+        fallback(work) — окрема транзакція з повторами, якщо пакет цілком не вдалося закомітити.
+        """
+        job = _Job(work)
+        self._queue.put((job, fallback))
+        self.stats['queued'] += 1
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run(self):
+        self._writer = _current()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._run_batch(batch)
+            except Exception as exc:
+                logging.exception("Черга записувача SQLite: пакет не виконано")
+                for job, _ in batch:
+                    if not job.done.is_set():
+                        job.error = exc
+            finally:
+                for job, _ in batch:
+                    job.done.set()
+
+    def _run_batch(self, batch):
+        with self.app.app_context():
+            # Без expire_on_commit результати (напр. Transaction) лишаються завантаженими після коміту,
+            # і викликач читає їх уже від'єднаними від сесії записувача
+            db.session().expire_on_commit = False
+            try:
+                db.session.execute(text('BEGIN IMMEDIATE'))
+                for job, _ in batch:
+                    # Накопичене в session.info (агрегати bank_stats) може лишитися незастосованим від попередніх
+                    # робіт пакета; невдала робота відкочує свій SAVEPOINT і повертає агрегати до знімка
+                    before, saved = set(db.session.info), bank_stats.snapshot(db.session())
+                    try:
+                        with db.session.begin_nested():
+                            job.result = job.work()
+                    except Exception as exc:
+                        job.error = exc
+                        bank_stats.restore(db.session(), saved)
+                        for key in set(db.session.info) - before:
+                            db.session.info.pop(key, None)
+                db.session.commit()
+            except (OperationalError, DBAPIError) as exc:
+                db.session.rollback()
+                self.stats['fallbacks'] += 1
+                logging.warning(f"Пакет записувача SQLite відкочено ({exc.orig}), роботи виконуються поодинці")
+                for job, fallback in batch:
+                    job.result, job.error = None, None
+                    try:
+                        job.result = fallback(job.work)
+                    except Exception as error:
+                        job.error = error
+            self.stats['batches'] += 1
+            self.stats['jobs'] += len(batch)
+            self.stats['maxBatch'] = max(self.stats['maxBatch'], len(batch))
+
+    def get_stats(self):
+        stats = dict(self.stats, enabled=self.enabled, running=self._writer is not None, pending=self._queue.qsize())
+        stats['lockWaitMs'] = round(stats.get('lockWaitMs', 0), 2)
+        if stats.get('batches'):
+            stats['avgBatch'] = round(stats['jobs'] / stats['batches'], 2)
+        return stats
+
+sqlite_writer = SqliteWriter()
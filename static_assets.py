@@ -0,0 +1,232 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+from io import BytesIO
+from flask import abort, request, send_file
+
+# Статичні файли фронтенду (index.html, admin.html, script.js, styles.css, зображення в корені проєкту).
+# При старті (або `flask build-static`) кожен файл отримує копію з хешем вмісту в назві
+# (/assets/styles.3f2a9c1d04.css), а посилання в HTML/CSS/JS переписуються на ці назви — такі URL
+# ніколи не змінюють вмісту, тож віддаються з Cache-Control: immutable на рік.
+# Текстові файли заздалегідь стискаються (.gz, і .br, якщо встановлено brotli), зображення
+# товарів і фото гравців отримують WebP-копії потрібних ширин (якщо встановлено Pillow).
+# Усе зібране лежить у STATIC_BUILD_DIR; шляхи тримаються в індексі в пам'яті, тож запит
+# не перевіряє файлову систему. Віддаються лише файли з індексу (а не будь-що з кореня, як app.db чи app.env).
+
+try:
+    import brotli
+except ImportError:  # Без brotli текстові файли віддаються лише gzip-стиснутими
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # Без Pillow зображення віддаються в оригінальному форматі й розмірі
+    Image = None
+
+PAGES = ('index.html', 'admin.html')  # Віддаються лише за своїми адресами, з перевіркою актуальності
+TEXT = ('.html', '.css', '.js', '.svg')
+IMAGES = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico')
+RESIZABLE = ('.png', '.jpg', '.jpeg')
+PREFIX = 'assets/'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+WEBP_QUALITY = 80
+
+class Asset:
+    __slots__ = ('path', 'mimetype', 'etag', 'cache', 'encodings')
+
+    def __init__(self, path, mimetype, etag, cache, encodings=None):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.cache = cache
+        self.encodings = encodings or {}  # {'br'/'gzip': шлях стиснутої копії}
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+def _write(path, data):
+    """Файли з хешем у назві не змінюються: наявний не перезаписується, новий з'являється атомарно
+    (кілька воркерів можуть збирати одночасно)."""
+    if os.path.exists(path):
+        return False
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+class StaticAssets:
+    def __init__(self):
+        self.source_dir = None
+        self.build_dir = None
+        self.widths = (160, 480)
+        self.index = {}   # URL-шлях без початкового "/" -> Asset
+        self.urls = {}    # файл-джерело -> /assets/... з хешем
+        self.images = {}  # файл-джерело -> {ширина: /assets/....webp}
+        self.stats = {}
+
+    def init_app(self, app):
+        self.source_dir = app.root_path
+        self.build_dir = app.config.get('STATIC_BUILD_DIR') or os.path.join(app.root_path, 'static_build')
+        self.widths = tuple(sorted(app.config.get('STATIC_IMAGE_WIDTHS', self.widths)))
+        try:
+            self.build()
+        except OSError:
+            # Напр. каталог збірки недоступний для запису — віддаємо файли-джерела без хешів і стиснення
+            logging.exception("Не вдалося зібрати статичні файли, віддаються оригінали")
+            self._index_sources()
+
+    def _sources(self):
+        names = [name for name in os.listdir(self.source_dir)
+                 if not name.startswith('.') and name.lower().endswith(TEXT + IMAGES) and os.path.isfile(os.path.join(self.source_dir, name))]
+        # Спочатку зображення, потім CSS і JS, сторінки в кінці: хеш файлу рахується вже після
+        # переписування посилань, тож зміна картинки змінює й хеш сторінки, що на неї посилається
+        rank = {'.css': 1, '.svg': 1, '.js': 2, '.html': 3}
+        return sorted(names, key=lambda name: (rank.get(os.path.splitext(name)[1].lower(), 0), name))
+
+    def _index_sources(self):
+        index = {}
+        for name in self._sources():
+            path = os.path.join(self.source_dir, name)
+            index[name] = Asset(path, mimetypes.guess_type(name)[0], None, REVALIDATE)
+        index[''] = index.get('index.html')
+        self.index = index
+
+    def build(self):
+        """Збирає STATIC_BUILD_DIR і оновлює індекс. Повертає множину зібраних файлів (для prune)."""
+        os.makedirs(self.build_dir, exist_ok=True)
+        index, urls, images, produced = {}, {}, {}, set()
+        stats = {'files': 0, 'written': 0, 'bytes': 0, 'compressedBytes': 0, 'webp': 0}
+
+        def emit(name, data, cache, mimetype):
+            path = os.path.join(self.build_dir, name)
+            stats['written'] += _write(path, data)
+            produced.add(name)
+            encodings = {}
+            if name.endswith(TEXT):
+                stats['bytes'] += len(data)
+                variants = [('gzip', '.gz', lambda: gzip.compress(data, 9, mtime=0))]
+                if brotli is not None:
+                    variants.insert(0, ('br', '.br', lambda: brotli.compress(data, quality=11)))
+                for encoding, suffix, compress in variants:
+                    if os.path.exists(path + suffix):
+                        encodings[encoding] = path + suffix; produced.add(name + suffix); continue
+                    packed = compress()
+                    if len(packed) < len(data):
+                        _write(path + suffix, packed)
+                        encodings[encoding] = path + suffix; produced.add(name + suffix)
+                stats['compressedBytes'] += os.path.getsize(encodings['gzip']) if 'gzip' in encodings else len(data)
+            return Asset(path, mimetype, _digest(data), cache, encodings)
+
+        rewrite = None
+        for name in self._sources():
+            stem, ext = os.path.splitext(name)
+            mimetype = mimetypes.guess_type(name)[0]
+            with open(os.path.join(self.source_dir, name), 'rb') as f:
+                data = f.read()
+            if ext.lower() in TEXT and rewrite is not None:
+                data = rewrite.sub(lambda m: m.group(1) + urls[m.group(3)], data.decode('utf-8')).encode('utf-8')
+            stats['files'] += 1
+            built = f'{stem}.{_digest(data)}{ext}'
+            if name in PAGES:
+                index[name] = emit(built, data, REVALIDATE, mimetype)
+                continue
+            asset = emit(built, data, IMMUTABLE, mimetype)
+            index[PREFIX + built] = asset
+            # Стара адреса (./logo.png, сторонні посилання) працює й надалі, але з перевіркою актуальності
+            index[name] = Asset(asset.path, mimetype, asset.etag, REVALIDATE, asset.encodings)
+            urls[name] = '/' + PREFIX + built
+            if ext.lower() in RESIZABLE and Image is not None:
+                images[name] = {}
+                for width, (target, asset) in self._derive_images(name, built, emit).items():
+                    index[PREFIX + target] = asset
+                    images[name][width] = '/' + PREFIX + target
+                    stats['webp'] += 1
+            # Наступні файли посилаються на вже зібрані: "logo.png", "./logo.png", "/logo.png"
+            names = '|'.join(re.escape(source) for source in sorted(urls, key=len, reverse=True))
+            rewrite = re.compile(rf'''(["'(=\s])(\./|/)?({names})(?=["')\s?#])''')
+        index[''] = index.get('index.html')
+        self.index, self.urls, self.images, self.stats = index, urls, images, stats
+        logging.info(f"Статичні файли: {stats['files']} джерел, нових файлів {stats['written']}, "
+                     f"текст {stats['bytes']} -> {stats['compressedBytes']} байт (gzip), WebP-копій {stats['webp']}")
+        return produced
+
+    def _derive_images(self, name, built, emit):
+        """WebP-копії ширин STATIC_IMAGE_WIDTHS (не ширші за оригінал) і WebP в оригінальному розмірі."""
+        stem, variants = os.path.splitext(built)[0], {}
+        with Image.open(os.path.join(self.source_dir, name)) as image:
+            for width in sorted({w for w in self.widths if w < image.width} | {image.width}):
+                target = f'{stem}.w{width}.webp'
+                path = os.path.join(self.build_dir, target)
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                else:
+                    resized = image if width == image.width else image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                    buffer = BytesIO()
+                    resized.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+                    data = buffer.getvalue()
+                variants[width] = (target, emit(target, data, IMMUTABLE, 'image/webp'))
+        return variants
+
+    def prune(self, produced):
+        """Видаляє з каталогу збірки файли, яких не дала остання збірка. Повертає їх кількість."""
+        removed = 0
+        for name in os.listdir(self.build_dir):
+            if name not in produced:
+                os.remove(os.path.join(self.build_dir, name)); removed += 1
+        return removed
+
+    # --- Адреси для API ---
+
+    def _source_name(self, source):
+        return source[2:] if source.startswith('./') else source.lstrip('/')
+
+    def url(self, source):
+        """Адреса з хешем для шляху з БД ("./t1.png"); невідомі шляхи повертаються як є."""
+        return self.urls.get(self._source_name(source), source) if source else source
+
+    def image(self, source, width):
+        """Найменша WebP-копія не вужча за width (або найбільша з наявних); без копій — url(source)."""
+        variants = self.images.get(self._source_name(source)) if source else None
+        if not variants:
+            return self.url(source)
+        return variants[min((w for w in variants if w >= width), default=max(variants))]
+
+    # --- Віддача ---
+
+    def find(self, path):
+        return self.index.get(path)
+
+    def send(self, asset):
+        encoding = next((name for name in ('br', 'gzip') if name in asset.encodings and request.accept_encodings[name]), None)
+        path = asset.encodings[encoding] if encoding else asset.path
+        etag = f'{asset.etag}-{encoding}' if encoding and asset.etag else asset.etag
+        response = send_file(path, mimetype=asset.mimetype, etag=etag or True, conditional=True)
+        response.headers['Cache-Control'] = asset.cache
+        if asset.encodings:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    def serve(self, path):
+        """Файл з індексу; решта адрес (маршрути SPA) отримує index.html або admin.html."""
+        asset = self.index.get(path)
+        if asset is None:
+            last = path.rsplit('/', 1)[-1]
+            if 'admin.html' in path:
+                asset = self.index.get('admin.html')
+            elif path.startswith(PREFIX) or '.' in last:
+                abort(404)  # Застарілий хеш або файл, якого немає серед статичних
+            else:
+                asset = self.index.get('index.html')
+        if asset is None:
+            abort(404)
+        return self.send(asset)
+
+static_assets = StaticAssets()
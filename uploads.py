@@ -0,0 +1,370 @@
+import os
+import uuid
+import queue
+import codecs
+import hashlib
+import logging
+import mimetypes
+import threading
+from io import BytesIO
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import send_file
+from sqlalchemy import select, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from models import db, completed_tasks, StoredFile, Task, TaskSubmission, Upload
+
+# Завантаження файлів до завдань.
+# Тіло запиту не буферизується: байти читаються з request.stream шматками по UPLOAD_CHUNK_SIZE,
+# пишуться в UPLOAD_FOLDER/partial/<id>.part і одразу ж хешуються (sha256). Завантаження можна
+# докачати: клієнт дізнається прийняте зміщення (GET) і продовжує з нього (PATCH з Upload-Offset).
+# Коли прийнято останній байт, файл переноситься в objects/<2 символи>/<sha256> — однаковий вміст
+# різних гравців зберігається один раз (StoredFile). Перевірка вмісту (сигнатура відповідає
+# розширенню, зображення декодується) і мініатюра робляться фоновими обробниками вже після відповіді.
+
+try:
+    from eventlet import patcher, tpool
+except ImportError:  # Без eventlet обробка йде в поточному потоці обробника
+    tpool = None
+
+try:
+    from PIL import Image
+except ImportError:  # Без Pillow зображення перевіряються лише за сигнатурою, без мініатюр
+    Image = None
+
+SIGNATURES = {
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'pdf': (b'%PDF-',),
+    'doc': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',),
+    'docx': (b'PK\x03\x04',),
+}
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif')
+THUMBNAIL_SIZE = (320, 320)
+
+def _offload(fn, *args):
+    if tpool is not None and patcher.is_monkey_patched('thread'):
+        return tpool.execute(fn, *args)
+    return fn(*args)
+
+def _extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+def _inspect(path, extension, thumbnail_path):
+    """Виконується поза хабом eventlet. Повертає (прийнято?, причина відмови, чи створено мініатюру)."""
+    with open(path, 'rb') as f:
+        head = f.read(8192)
+    if extension == 'txt':
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(head)
+        except UnicodeDecodeError:
+            return False, "Текстовий файл не в UTF-8", False
+        if b'\x00' in head:
+            return False, "Текстовий файл містить двійкові дані", False
+    elif extension in SIGNATURES and not head.startswith(SIGNATURES[extension]):
+        return False, f"Вміст файлу не відповідає розширенню .{extension}", False
+    if Image is None or extension not in IMAGE_EXTENSIONS:
+        return True, None, False
+    try:
+        with Image.open(path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            buffer = BytesIO()
+            image.save(buffer, 'WEBP', quality=80)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False, "Зображення пошкоджене або завелике", False
+    tmp = f'{thumbnail_path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp, thumbnail_path)
+    return True, None, True
+
+class UploadError(Exception):
+    """Завантаження не прийнято; текст показується користувачу, status — код відповіді,
+    offset — скільки байтів уже прийнято (клієнт продовжує з цього місця)."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+class UploadStore:
+    def __init__(self, max_size=20 * 1024 * 1024, chunk_size=64 * 1024, workers=2, partial_ttl=86400):
+        self.app = None
+        self.socketio = None
+        self.folder = None
+        self.allowed = set()
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.partial_ttl = partial_ttl
+        self._guard = threading.Lock()
+        self._locks = {}    # id завантаження -> Lock: одночасно дописує лише один запит
+        self._hashers = {}  # id завантаження -> (sha256 прийнятих байтів, зміщення)
+        self._queue = queue.Queue()  # sha256 файлів, що чекають на перевірку
+        self._started = False
+        self.stats = Counter()
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.folder = app.config['UPLOAD_FOLDER']
+        self.allowed = set(app.config.get('ALLOWED_EXTENSIONS', ()))
+        self.max_size = app.config.get('UPLOAD_MAX_SIZE', self.max_size)
+        self.chunk_size = app.config.get('UPLOAD_CHUNK_SIZE', self.chunk_size)
+        self.workers = app.config.get('UPLOAD_WORKERS', self.workers)
+        self.partial_ttl = app.config.get('UPLOAD_PARTIAL_TTL', self.partial_ttl)
+        for name in ('partial', 'objects'):
+            os.makedirs(os.path.join(self.folder, name), exist_ok=True)
+
+    def _partial(self, upload_id):
+        return os.path.join(self.folder, 'partial', f'{upload_id}.part')
+
+    def _object(self, sha256):
+        return f'objects/{sha256[:2]}/{sha256}'
+
+    def _thumbnail(self, sha256):
+        return os.path.join(self.folder, self._object(sha256) + '.thumb.webp')
+
+    # --- Прийом байтів ---
+
+    def create(self, user_id, task_id, filename, size):
+        """Нове завантаження файлу до завдання; байти надсилаються окремо (append)."""
+        if not isinstance(filename, str) or not filename.strip():
+            raise UploadError("Потрібно вказати назву файлу")
+        if _extension(filename) not in self.allowed:
+            raise UploadError(f"Дозволені файли: {', '.join(sorted(self.allowed))}", 415)
+        if isinstance(size, bool) or not isinstance(size, int) or size <= 0:
+            raise UploadError("Некоректний розмір файлу")
+        if size > self.max_size:
+            raise UploadError(f"Файл більший за {self.max_size // (1024 * 1024)} МБ", 413)
+        task = db.session.get(Task, task_id)
+        if task is None:
+            raise UploadError("Завдання не знайдено", 404)
+        if not task.requires_file:
+            raise UploadError("Це завдання не потребує файлу")
+        if db.session.execute(select(completed_tasks.c.task_id).where(completed_tasks.c.user_id == user_id, completed_tasks.c.task_id == task_id)).first():
+            raise UploadError("Завдання вже виконано", 409)
+        upload = Upload(id=uuid.uuid4().hex, user_id=user_id, task_id=task_id, filename=filename.strip()[-255:], size=size)
+        open(self._partial(upload.id), 'wb').close()
+        db.session.add(upload)
+        db.session.commit()
+        self.stats['created'] += 1
+        return upload.to_dict()
+
+    def get(self, user_id, upload_id):
+        upload = db.session.get(Upload, upload_id)
+        if upload is None or upload.user_id != user_id:
+            raise UploadError("Завантаження не знайдено", 404)
+        return upload
+
+    def offset(self, upload):
+        try:
+            return os.path.getsize(self._partial(upload.id))
+        except FileNotFoundError:
+            raise UploadError("Завантаження не знайдено", 404)
+
+    def status(self, user_id, upload_id):
+        upload = self.get(user_id, upload_id)
+        return upload.to_dict(self.offset(upload))
+
+    def _lock(self, upload_id):
+        with self._guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _hasher(self, upload_id, offset):
+        hasher, hashed = self._hashers.get(upload_id, (None, None))
+        if hashed == offset:
+            return hasher
+        if offset == 0:
+            return hashlib.sha256()
+        # Докачування після перезапуску чи через інший воркер — хеш прийнятого рахується з диска
+        hasher = hashlib.sha256()
+        with open(self._partial(upload_id), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        self.stats['rehashed'] += 1
+        return hasher
+
+    def append(self, user_id, upload_id, offset, length, stream):
+        """Дописує length байтів з stream, починаючи з offset.
+
+        Поки файл не прийнято повністю, повертає {'upload': ...} з новим зміщенням; після останнього
+        байта — {'submission', 'file', 'deduplicated'}. Якщо клієнт обірвав з'єднання, прийняте зберігається.
+        """
+        upload = self.get(user_id, upload_id)
+        lock = self._lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("Це завантаження вже приймається іншим запитом", 409)
+        try:
+            current = self.offset(upload)
+            if offset != current:
+                raise UploadError("Зміщення не збігається з уже прийнятим", 409, current)
+            if length is None:
+                raise UploadError("Потрібен заголовок Content-Length", 411, current)
+            if current + length > upload.size:
+                raise UploadError("Дані виходять за оголошений розмір файлу", 413, current)
+            hasher, received = self._hasher(upload_id, current), 0
+            try:
+                with open(self._partial(upload_id), 'r+b') as f:
+                    f.seek(current)
+                    while received < length:
+                        chunk = stream.read(min(self.chunk_size, length - received))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        received += len(chunk)
+            finally:
+                self._hashers[upload_id] = (hasher, current + received)
+                self.stats['bytes'] += received
+            if current + received < upload.size:
+                return {'upload': upload.to_dict(current + received)}
+            return self._complete(upload, hasher.hexdigest())
+        finally:
+            lock.release()
+
+    def _complete(self, upload, sha256):
+        relative = self._object(sha256)
+        path = os.path.join(self.folder, relative)
+        stored, created = db.session.get(StoredFile, sha256), False
+        if os.path.exists(path) or (stored is not None and stored.status == 'rejected'):
+            os.remove(self._partial(upload.id))
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._partial(upload.id), path)
+        self._forget(upload.id)
+        if stored is None:
+            try:
+                with db.session.begin_nested():
+                    stored = StoredFile(sha256=sha256, size=upload.size, extension=_extension(upload.filename), status='pending')
+                    db.session.add(stored)
+                created = True
+            except IntegrityError:  # Той самий вміст щойно зберіг інший запит
+                stored = db.session.get(StoredFile, sha256)
+        db.session.delete(upload)
+        if stored.status == 'rejected':
+            db.session.commit()
+            raise UploadError("Файл не пройшов перевірку", 422)
+        submission = TaskSubmission.query.filter_by(user_id=upload.user_id, task_id=upload.task_id, status='pending').first()
+        if submission is None:
+            submission = TaskSubmission(user_id=upload.user_id, task_id=upload.task_id, status='pending')
+            db.session.add(submission)
+        submission.file_path, submission.date = relative, datetime.utcnow()
+        db.session.commit()
+        self.stats['completed'] += 1
+        if created:
+            self._queue.put(sha256)
+        else:
+            self.stats['deduplicated'] += 1
+        return {'submission': submission.to_dict(), 'file': stored.to_dict(), 'deduplicated': not created}
+
+    def _forget(self, upload_id):
+        with self._guard:
+            self._locks.pop(upload_id, None)
+        self._hashers.pop(upload_id, None)
+
+    def cancel(self, user_id, upload_id):
+        upload = self.get(user_id, upload_id)
+        db.session.delete(upload)
+        db.session.commit()
+        self._remove_partial(upload_id)
+
+    def _remove_partial(self, upload_id):
+        self._forget(upload_id)
+        try:
+            os.remove(self._partial(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def expire(self, now=None):
+        """Видаляє завантаження, не завершені за UPLOAD_PARTIAL_TTL секунд. Повертає їх кількість."""
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=self.partial_ttl)
+        expired = Upload.query.filter(Upload.created_at < cutoff).all()
+        for upload in expired:
+            db.session.delete(upload)
+        db.session.commit()
+        for upload in expired:
+            self._remove_partial(upload.id)
+        self.stats['expired'] += len(expired)
+        return len(expired)
+
+    # --- Фонова обробка ---
+
+    def start(self):
+        """Запускає UPLOAD_WORKERS обробників; файли, не перевірені до перезапуску, стають у чергу знову."""
+        if self.socketio is None or self._started:
+            return
+        self._started = True
+        with self.app.app_context():
+            try:
+                for sha256 in db.session.execute(select(StoredFile.sha256).where(StoredFile.status == 'pending')).scalars():
+                    self._queue.put(sha256)
+            except DBAPIError:  # Таблиці ще немає (БД до `flask safe-init-db`)
+                db.session.rollback()
+        for _ in range(self.workers):
+            self.socketio.start_background_task(self._work)
+
+    def _work(self):
+        while True:
+            sha256 = self._queue.get()
+            try:
+                self.process(sha256)
+            except Exception:
+                logging.exception(f"Не вдалося обробити файл {sha256}")
+                self.stats['failed'] += 1
+
+    def process(self, sha256):
+        with self.app.app_context():
+            stored = db.session.get(StoredFile, sha256)
+            if stored is None or stored.status != 'pending':
+                return
+            extension = stored.extension
+        relative = self._object(sha256)
+        path = os.path.join(self.folder, relative)
+        # Читання файлу, декодування зображення і мініатюра — у пулі справжніх потоків, хаб тим часом вільний
+        ok, reason, thumbnail = _offload(_inspect, path, extension, self._thumbnail(sha256))
+        status = 'ready' if ok else 'rejected'
+        with self.app.app_context():
+            db.session.execute(update(StoredFile).where(StoredFile.sha256 == sha256, StoredFile.status == 'pending')
+                               .values(status=status, has_thumbnail=thumbnail).execution_options(synchronize_session=False))
+            if not ok:
+                db.session.execute(update(TaskSubmission).where(TaskSubmission.file_path == relative, TaskSubmission.status == 'pending')
+                                   .values(status='rejected').execution_options(synchronize_session=False))
+            user_ids = db.session.execute(select(TaskSubmission.user_id).where(TaskSubmission.file_path == relative).distinct()).scalars().all()
+            db.session.commit()
+        if not ok:
+            os.remove(path)  # Запис StoredFile лишається: повторне завантаження того ж вмісту відхиляється одразу
+            logging.warning(f"Файл {sha256} відхилено: {reason}")
+        self.stats['ready' if ok else 'rejected'] += 1
+        for user_id in user_ids:
+            self.socketio.emit('upload_processed', {'sha256': sha256, 'status': status, 'reason': reason}, room=f'user_{user_id}')
+
+    # --- Віддача ---
+
+    def send(self, user_id, is_admin, sha256, thumbnail=False):
+        stored = db.session.get(StoredFile, sha256)
+        relative = self._object(sha256)
+        if stored is None or stored.status == 'rejected':
+            return None
+        if not is_admin and not db.session.execute(select(TaskSubmission.id).where(TaskSubmission.user_id == user_id, TaskSubmission.file_path == relative)).first():
+            return None
+        if thumbnail and stored.has_thumbnail:
+            path, mimetype, etag = self._thumbnail(sha256), 'image/webp', f'{sha256}-thumb'
+        else:
+            path, mimetype, etag = os.path.join(self.folder, relative), mimetypes.guess_type(f'file.{stored.extension}')[0], sha256
+        response = send_file(path, mimetype=mimetype or 'application/octet-stream', etag=etag, conditional=True,
+                             as_attachment=stored.extension not in IMAGE_EXTENSIONS, download_name=f'{sha256[:16]}.{stored.extension}')
+        # Адреса визначається вмістом, тож він ніколи не змінюється; файл бачать лише власник і адміністратори
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def get_stats(self):
+        return dict(self.stats, pending=self.pending, inProgress=len(self._hashers), workers=self.workers, started=self._started)
+
+upload_store = UploadStore()
@@ -3,7 +3,10 @@ import eventlet
 eventlet.monkey_patch()
 
 # І тільки після цього ми імпортуємо наш додаток
-from app import app, socketio
+from app import app, socketio, start_scheduler
+
+# Під gunicorn кожен воркер імпортує цей модуль; фонові задачі виконає лише воркер-лідер
+start_scheduler()
 
 if __name__ == "__main__":
     # Цей блок потрібен для локального запуску, якщо ви захочете запускати через wsgi.py